@@ -24,6 +24,13 @@ cloudinary.config(
 DEFAULT_FILE_STORAGE = "cloudinary_storage.storage.MediaCloudinaryStorage"
 
 MEDIA_URL = "/media/"
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', str(BASE_DIR / 'media'))
+
+# Fotos de los reportes: se reciben en FOTOS_STAGING_DIR y el comando
+# subir_fotos las pasa al backend de almacenamiento (ver server/almacenamiento.py).
+# Para desarrollo sin conexión: server.almacenamiento.AlmacenamientoLocal.
+FOTOS_ALMACENAMIENTO = os.environ.get('FOTOS_ALMACENAMIENTO', 'server.almacenamiento.AlmacenamientoCloudinary')
+FOTOS_STAGING_DIR = os.environ.get('FOTOS_STAGING_DIR', str(BASE_DIR / 'staging_fotos'))
 
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
@@ -40,6 +47,7 @@ INSTALLED_APPS = [
     'cloudinary',
     'cloudinary_storage',
     'django.contrib.staticfiles',
+    'channels',
     'server.apps.ServerConfig',
     'widget_tweaks',
     'django.contrib.sites',
@@ -77,6 +85,7 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 
 ROOT_URLCONF = 'huella_urbana.urls'
 WSGI_APPLICATION = 'huella_urbana.wsgi.application'
+ASGI_APPLICATION = 'huella_urbana.asgi.application'
 
 
 TEMPLATES = [
@@ -101,6 +110,43 @@ DATABASES = {
     }
 }
 
+# Caché compartida entre los procesos del servidor (tiles del mapa, versiones de invalidación).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_DIR', str(BASE_DIR / '.cache')),
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    }
+}
+
+# `manage.py test` cambia la caché por una en memoria (ver server/ejecutor_pruebas.py).
+TEST_RUNNER = 'server.ejecutor_pruebas.EjecutorPruebas'
+
+# Archivos generados por las exportaciones en segundo plano (comando procesar_exportaciones).
+EXPORTACIONES_DIR = os.environ.get('EXPORTACIONES_DIR', str(BASE_DIR / 'exportaciones'))
+
+# Reportes del mismo incidente (server/incidentes.py): distancia máxima en metros
+# y diferencia máxima de fecha y hora en minutos.
+INCIDENTES_RADIO_METROS = int(os.environ.get('INCIDENTES_RADIO_METROS', 300))
+INCIDENTES_VENTANA_MINUTOS = int(os.environ.get('INCIDENTES_VENTANA_MINUTOS', 120))
+
+# Capa de canales del panel de moderación en vivo. Un aviso enviado por un
+# proceso solo llega a los paneles conectados a otro si la capa es compartida,
+# así que en producción (varios procesos daphne o nodos) se define REDIS_URL y
+# se usa channels_redis. La capa en memoria solo sirve para desarrollo con un
+# único proceso; `manage.py check --deploy` avisa si quedó configurada.
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CHANNEL_LAYER_BACKEND',
+            'channels_redis.core.RedisChannelLayer' if os.environ.get('REDIS_URL')
+            else 'channels.layers.InMemoryChannelLayer',
+        ),
+    }
+}
+if os.environ.get('REDIS_URL'):
+    CHANNEL_LAYERS['default']['CONFIG'] = {'hosts': [os.environ['REDIS_URL']]}
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -1,26 +1,30 @@
 from django.contrib import admin
+from django.contrib import messages
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 from django.db.models import Count
-from .models import PerfilUsuario, NuevoReporte, Foto, ModeracionLog
+from .models import PerfilUsuario, NuevoReporte, Foto, ModeracionLog, Hotspot, ExportacionJob
+from .mapa import invalidar_tiles
+from .estadisticas import actualizar_reportes
+from .moderacion import moderar_reportes
 
 
 class FotoInline(admin.TabularInline):
     model = Foto
     extra = 1
     max_num = 5
-    fields = ('miniatura', 'archivo', 'orden', 'contiene_contenido_grafico', 'es_censurada', 'estado_moderacion')
-    readonly_fields = ('miniatura', 'subida_en')
+    fields = ('previa', 'archivo', 'orden', 'contiene_contenido_grafico', 'es_censurada', 'estado_moderacion')
+    readonly_fields = ('previa', 'subida_en')
     
-    def miniatura(self, obj):
+    def previa(self, obj):
         if obj.archivo:
             return format_html(
                 '<img src="{}" style="max-height: 80px; max-width: 120px; border-radius: 4px;" />',
-                obj.archivo.url
+                obj.url_miniatura()
             )
         return "Sin imagen"
-    miniatura.short_description = "Vista previa"
+    previa.short_description = "Vista previa"
 
 
 class ModeracionLogInline(admin.TabularInline):
@@ -88,6 +92,7 @@ class NuevoReporteAdmin(admin.ModelAdmin):
         'sector',
         'tipo_animal',
         'anonimo',
+        ('duplicado_de', admin.EmptyFieldListFilter),
         'fecha_creacion',
         'fecha'
     )
@@ -105,7 +110,10 @@ class NuevoReporteAdmin(admin.ModelAdmin):
         'fecha_actualizacion',
         'usuario',
         'mapa_ubicacion',
-        'info_reportante_completa'
+        'info_reportante_completa',
+        'reclamado_por',
+        'reclamado_hasta',
+        'duplicado_de',
     )
     
     date_hierarchy = 'fecha_creacion'
@@ -130,7 +138,8 @@ class NuevoReporteAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
         ('✅ Moderación', {
-            'fields': ('moderador', 'fecha_moderacion', 'comentario_moderacion'),
+            'fields': ('moderador', 'fecha_moderacion', 'comentario_moderacion', 'reclamado_por', 'reclamado_hasta',
+                       'duplicado_de'),
             'classes': ('wide',)
         }),
         ('🕐 Metadatos', {
@@ -235,28 +244,37 @@ class NuevoReporteAdmin(admin.ModelAdmin):
         return mark_safe(html)
     info_reportante_completa.short_description = "Datos del reportante"
     
+    def avisar_ya_moderados(self, request, resultados):
+        ya_moderados = sum(1 for r in resultados.values() if r == 'ya_moderado')
+        if ya_moderados:
+            self.message_user(
+                request,
+                f'{ya_moderados} reporte(s) no estaban pendientes y no se modificaron. '
+                'Márcalos como pendientes para volver a decidirlos.',
+                level=messages.WARNING,
+            )
+
     def aprobar_reportes(self, request, queryset):
-        from django.utils import timezone
-        updated = queryset.update(
-            estado='aprobado',
-            moderador=request.user,
-            fecha_moderacion=timezone.now()
-        )
+        ids = list(queryset.values_list('id', flat=True))
+        resultados, updated = moderar_reportes(ids, 'aprobar', request.user)
         self.message_user(request, f'{updated} reporte(s) aprobado(s) exitosamente.')
+        self.avisar_ya_moderados(request, resultados)
     aprobar_reportes.short_description = "✅ Aprobar reportes seleccionados"
     
     def rechazar_reportes(self, request, queryset):
-        from django.utils import timezone
-        updated = queryset.update(
-            estado='rechazado',
-            moderador=request.user,
-            fecha_moderacion=timezone.now()
+        ids = list(queryset.values_list('id', flat=True))
+        resultados, updated = moderar_reportes(
+            ids, 'rechazar', request.user, 'Rechazado desde el panel de administración.'
         )
         self.message_user(request, f'{updated} reporte(s) rechazado(s).')
+        self.avisar_ya_moderados(request, resultados)
     rechazar_reportes.short_description = "❌ Rechazar reportes seleccionados"
     
     def marcar_pendientes(self, request, queryset):
-        updated = queryset.update(estado='pendiente')
+        from django.utils import timezone
+        coordenadas = list(queryset.values_list('latitud', 'longitud'))
+        updated = actualizar_reportes(queryset, estado='pendiente', fecha_actualizacion=timezone.now())
+        invalidar_tiles(coordenadas)
         self.message_user(request, f'{updated} reporte(s) marcado(s) como pendiente(s).')
     marcar_pendientes.short_description = "⏳ Marcar como pendientes"
 
@@ -270,12 +288,15 @@ class FotoAdmin(admin.ModelAdmin):
         'estado_badge',
         'contenido_grafico_badge',
         'censurada_badge',
+        'duplicado_badge',
         'orden',
         'subida_en_corta'
     )
     
     list_filter = (
         'estado_moderacion',
+        'estado_subida',
+        ('duplicado_de', admin.EmptyFieldListFilter),
         'es_censurada',
         'contiene_contenido_grafico',
         'subida_en'
@@ -283,28 +304,41 @@ class FotoAdmin(admin.ModelAdmin):
     
     search_fields = ('reporte__titulo', 'id')
     
-    readonly_fields = ('subida_en', 'imagen_completa')
+    readonly_fields = (
+        'subida_en', 'imagen_completa', 'estado_subida', 'intentos_subida', 'error_subida', 'ancho', 'alto',
+        'duplicado_de', 'distancia_duplicado',
+    )
     
     ordering = ('-subida_en',)
+
+    actions = ['reintentar_subida']
     
     fieldsets = (
         ('📷 Imagen', {
             'fields': ('reporte', 'archivo', 'imagen_completa', 'orden')
         }),
         ('⚠️ Moderación de Contenido', {
-            'fields': ('estado_moderacion', 'contiene_contenido_grafico', 'es_censurada')
+            'fields': ('estado_moderacion', 'contiene_contenido_grafico', 'es_censurada',
+                       'duplicado_de', 'distancia_duplicado')
         }),
         ('🕐 Información', {
-            'fields': ('subida_en',)
+            'fields': ('subida_en', 'estado_subida', 'intentos_subida', 'error_subida', 'ancho', 'alto')
         }),
     )
     
+    def reintentar_subida(self, request, queryset):
+        updated = queryset.filter(estado_subida='error').exclude(archivo_local='').update(
+            estado_subida='pendiente', intentos_subida=0, proximo_intento=None
+        )
+        self.message_user(request, f'{updated} foto(s) vuelven a la cola de subida.')
+    reintentar_subida.short_description = "🔁 Reintentar subida"
+
     def imagen_preview(self, obj):
         if obj.archivo:
             return format_html(
                 '<img src="{}" style="max-height: 60px; max-width: 80px; '
                 'border-radius: 4px; border: 1px solid #ddd;" />',
-                obj.archivo.url
+                obj.url_miniatura()
             )
         return "Sin imagen"
     imagen_preview.short_description = "Preview"
@@ -314,7 +348,7 @@ class FotoAdmin(admin.ModelAdmin):
             return format_html(
                 '<img src="{}" style="max-width: 100%; max-height: 500px; '
                 'border-radius: 8px; box-shadow: 0 2px 8px rgba(0,0,0,0.1);" />',
-                obj.archivo.url
+                obj.url_vista_previa
             )
         return "Sin imagen"
     imagen_completa.short_description = "Imagen completa"
@@ -353,6 +387,17 @@ class FotoAdmin(admin.ModelAdmin):
             )
         return format_html('<span style="color: #28a745;">No</span>')
     censurada_badge.short_description = "Censurada"
+
+    def duplicado_badge(self, obj):
+        if obj.duplicado_de_id:
+            url = reverse('admin:server_foto_change', args=[obj.duplicado_de_id])
+            etiqueta = 'idéntica' if obj.distancia_duplicado == 0 else 'parecida'
+            return format_html(
+                '<a href="{}" style="color: #fd7e14; font-weight: bold;">⚠️ {} a #{}</a>',
+                url, etiqueta, obj.duplicado_de_id
+            )
+        return format_html('<span style="color: #28a745;">No</span>')
+    duplicado_badge.short_description = "Duplicado"
     
     def subida_en_corta(self, obj):
         return obj.subida_en.strftime('%d/%m/%Y %H:%M')
@@ -422,6 +467,41 @@ class ModeracionLogAdmin(admin.ModelAdmin):
     motivo_corto.short_description = "Motivo"
 
 
+@admin.register(Hotspot)
+class HotspotAdmin(admin.ModelAdmin):
+    list_display = ('id', 'total_reportes', 'graves', 'radio_m', 'fecha_inicio', 'fecha_fin', 'mapa_link', 'detectado_en')
+    list_filter = ('fecha_fin',)
+    ordering = ('-total_reportes',)
+    readonly_fields = (
+        'latitud', 'longitud', 'radio_m', 'total_reportes', 'graves',
+        'fecha_inicio', 'fecha_fin', 'reportes', 'detectado_en',
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+    def mapa_link(self, obj):
+        return format_html(
+            '<a href="https://www.google.com/maps?q={},{}" target="_blank">🗺️ Ver</a>',
+            obj.latitud,
+            obj.longitud
+        )
+    mapa_link.short_description = "Mapa"
+
+
+@admin.register(ExportacionJob)
+class ExportacionJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'formato', 'estado', 'usuario', 'filas', 'tamano', 'creado', 'terminado')
+    list_filter = ('estado', 'formato')
+    readonly_fields = (
+        'usuario', 'formato', 'filtros', 'clave', 'estado', 'archivo',
+        'filas', 'tamano', 'error', 'creado', 'iniciado', 'terminado',
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+
 
 admin.site.site_header = "🐕 Sistema de Reportes de Ataques"
 admin.site.site_title = "Admin - Reportes"
@@ -0,0 +1,62 @@
+"""Dónde se guardan las fotos de los reportes.
+
+El backend se elige con el setting FOTOS_ALMACENAMIENTO. Cada backend
+devuelve al guardar el valor que va en `Foto.archivo` (el formato de
+CloudinaryField, "image/upload/<public_id>.<formato>") y sabe construir la URL
+pública a partir de él. El backend local sirve para desarrollo y pruebas sin
+conexión.
+"""
+
+import shutil
+import uuid
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from pathlib import Path
+
+from cloudinary import uploader
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class AlmacenamientoFotos(ABC):
+    """Interfaz de los backends de almacenamiento de fotos."""
+
+    @abstractmethod
+    def guardar(self, ruta):
+        """Guarda el archivo local `ruta` y devuelve el valor para `Foto.archivo`."""
+
+    @abstractmethod
+    def url(self, recurso, **transformacion):
+        """URL pública de `recurso` (el valor de `Foto.archivo`), opcionalmente transformada."""
+
+
+class AlmacenamientoCloudinary(AlmacenamientoFotos):
+
+    def guardar(self, ruta):
+        recurso = uploader.upload_resource(str(ruta), type='upload', resource_type='image')
+        return recurso.get_prep_value()
+
+    def url(self, recurso, **transformacion):
+        return recurso.build_url(**transformacion) if transformacion else recurso.url
+
+
+class AlmacenamientoLocal(AlmacenamientoFotos):
+    """Guarda las fotos en MEDIA_ROOT/fotos; las transformaciones se ignoran."""
+
+    carpeta = 'fotos'
+
+    def guardar(self, ruta):
+        ruta = Path(ruta)
+        nombre = f'{self.carpeta}/{uuid.uuid4().hex}{ruta.suffix.lower() or ".jpg"}'
+        destino = Path(settings.MEDIA_ROOT) / nombre
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(ruta, destino)
+        return f'image/upload/{nombre}'
+
+    def url(self, recurso, **transformacion):
+        return f'{settings.MEDIA_URL}{recurso.public_id}.{recurso.format}'
+
+
+@lru_cache(maxsize=None)
+def almacenamiento():
+    return import_string(settings.FOTOS_ALMACENAMIENTO)()
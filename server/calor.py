@@ -0,0 +1,139 @@
+"""Capa de calor del mapa: densidad de incidentes aprobados estimada con un kernel gaussiano."""
+
+import base64
+import math
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Case, FloatField, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .geo import METROS_POR_GRADO, VALDIVIA_BBOX
+from .mapa import TILE_TIMEOUT, etag_mapa, filtrar_reportes_mapa, filtros_mapa
+
+# (zoom mínimo, nombre, columnas de la grilla, ancho de banda del kernel en metros)
+BANDAS_ZOOM = (
+    (0, 'baja', 64, 800),
+    (12, 'media', 128, 350),
+    (15, 'alta', 192, 150),
+)
+
+PESOS_GRAVEDAD = {'leve': 1.0, 'moderado': 2.0, 'grave': 3.0}
+
+
+def banda_zoom(zoom):
+    banda = BANDAS_ZOOM[0]
+    for candidata in BANDAS_ZOOM:
+        if zoom >= candidata[0]:
+            banda = candidata
+    return banda
+
+
+def matriz_gaussiana(n, sigma):
+    """Matriz n x n que suaviza un eje de la grilla con un kernel gaussiano de `sigma` celdas."""
+    indices = np.arange(n)
+    distancia = indices[:, None] - indices[None, :]
+    return np.exp(-0.5 * (distancia / sigma) ** 2)
+
+
+def densidad_kernel(lats, lons, pesos, bbox, columnas, ancho_m):
+    """Densidad (incidentes por km²) en una grilla sobre el bbox, ordenada de norte a sur.
+
+    Primero se acumulan los puntos en un histograma 2D y luego se suaviza con un
+    kernel gaussiano separable, aplicado como dos productos de matrices.
+    """
+    oeste, sur, este, norte = bbox
+    ancho_total_m = (este - oeste) * METROS_POR_GRADO * math.cos(math.radians((sur + norte) / 2))
+    alto_total_m = (norte - sur) * METROS_POR_GRADO
+    filas = max(1, round(columnas * alto_total_m / ancho_total_m))
+
+    celda_x_m = ancho_total_m / columnas
+    celda_y_m = alto_total_m / filas
+    sigma_x = ancho_m / celda_x_m
+    sigma_y = ancho_m / celda_y_m
+
+    histograma, _, _ = np.histogram2d(
+        lats, lons,
+        bins=(filas, columnas),
+        range=((sur, norte), (oeste, este)),
+        weights=pesos,
+    )
+
+    suavizado = matriz_gaussiana(filas, sigma_y) @ histograma @ matriz_gaussiana(columnas, sigma_x).T
+
+    # Normaliza el kernel para que la grilla quede en incidentes por km².
+    area_kernel_m2 = 2 * math.pi * sigma_x * sigma_y * celda_x_m * celda_y_m
+    return np.flipud(suavizado) * (1e6 / area_kernel_m2)
+
+
+def clave_calor(zoom, params, version):
+    """Clave de caché (y base del ETag) de la capa: banda de zoom, filtros y versión de los datos."""
+    nombre = banda_zoom(zoom)[1]
+    ponderar = params.get('ponderar') == '1'
+
+    filtros = filtros_mapa(params)
+    if 'periodo' in filtros:
+        filtros['hoy'] = timezone.localdate().isoformat()
+
+    return 'mapa:calor:{}:{}:{}:{}'.format(
+        nombre,
+        int(ponderar),
+        ','.join(f'{k}={v}' for k, v in sorted(filtros.items())),
+        etag_mapa(version),
+    )
+
+
+def capa_calor(reportes, zoom, params, version):
+    """Grilla de densidad cacheada por banda de zoom, filtros y versión de los datos."""
+    _, nombre, columnas, ancho_m = banda_zoom(zoom)
+    clave = clave_calor(zoom, params, version)
+
+    datos = cache.get(clave)
+    if datos is None:
+        datos = calcular_capa_calor(
+            filtrar_reportes_mapa(reportes, params), columnas, ancho_m, params.get('ponderar') == '1'
+        )
+        datos['banda'] = nombre
+        cache.set(clave, datos, TILE_TIMEOUT)
+
+    return datos
+
+
+def calcular_capa_calor(reportes, columnas, ancho_m, ponderar):
+    # La base de datos entrega floats (y el peso de cada gravedad) y NumPy arma
+    # la matriz de una vez, sin convertir Decimal por Decimal en Python.
+    campos = {'lat': Cast('latitud', FloatField()), 'lon': Cast('longitud', FloatField())}
+    if ponderar:
+        campos['peso'] = Case(
+            *[When(gravedad=g, then=Value(p)) for g, p in PESOS_GRAVEDAD.items()],
+            default=Value(1.0),
+            output_field=FloatField(),
+        )
+    filas = (
+        reportes.dentro_de_bbox(VALDIVIA_BBOX)
+        .order_by()
+        .annotate(**campos)
+        .values_list(*campos)
+    )
+    puntos = np.array(list(filas), dtype=float).reshape(-1, len(campos))
+    lats, lons = puntos[:, 0], puntos[:, 1]
+    pesos = puntos[:, 2] if ponderar else None
+
+    densidad = densidad_kernel(lats, lons, pesos, VALDIVIA_BBOX, columnas, ancho_m)
+    maximo = float(densidad.max()) if densidad.size else 0.0
+
+    # Se envía cuantizada a 0-255 para que el navegador la pinte como una imagen.
+    if maximo > 0:
+        niveles = np.rint(densidad / maximo * 255).astype(np.uint8)
+    else:
+        niveles = np.zeros(densidad.shape, dtype=np.uint8)
+
+    return {
+        'bbox': list(VALDIVIA_BBOX),
+        'filas': int(niveles.shape[0]),
+        'columnas': int(niveles.shape[1]),
+        'maximo': round(maximo, 3),
+        'total': len(puntos),
+        'valores': base64.b64encode(niveles.tobytes()).decode('ascii'),
+    }
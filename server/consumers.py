@@ -0,0 +1,33 @@
+"""Consumidor WebSocket del panel de moderación en vivo."""
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .tiempo_real import GRUPO_MODERACION
+from .views import es_moderador
+
+
+class ModeracionConsumer(AsyncJsonWebsocketConsumer):
+    """Reenvía a cada panel abierto los reportes pendientes nuevos y las decisiones de moderación.
+
+    Solo acepta moderadores y administradores; el panel no envía mensajes.
+    """
+
+    async def connect(self):
+        if not await database_sync_to_async(es_moderador)(self.scope['user']):
+            await self.close()
+            return
+        await self.channel_layer.group_add(GRUPO_MODERACION, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        await self.channel_layer.group_discard(GRUPO_MODERACION, self.channel_name)
+
+    async def reporte_nuevo(self, evento):
+        await self.send_json({'tipo': 'reporte_nuevo', 'reporte': evento['datos']})
+
+    async def reportes_moderados(self, evento):
+        await self.send_json({'tipo': 'reportes_moderados', **evento['datos']})
+
+    async def reportes_reclamados(self, evento):
+        await self.send_json({'tipo': 'reportes_reclamados', **evento['datos']})
@@ -0,0 +1,95 @@
+"""Detección de fotos repetidas entre reportes.
+
+Una foto con el mismo contenido (misma `huella`) que otra ya subida reutiliza
+sus archivos en vez de subirse de nuevo. Las parecidas (un recorte, otra
+compresión) se encuentran por distancia de Hamming entre sus `dhash`: el hash
+se parte en BANDAS bandas indexadas y dos hashes a distancia menor que BANDAS
+coinciden en al menos una, así basta buscar por banda y medir solo a esas
+candidatas. Las parecidas quedan marcadas con `duplicado_de` para moderación.
+"""
+
+from django.db.models import Q
+
+from .imagenes import TAMANOS
+from .models import Foto
+
+BANDAS = 4
+LARGO_BANDA = 16 // BANDAS
+# Menor que BANDAS: la búsqueda por bandas encuentra todas las fotos a esta distancia.
+DISTANCIA_DHASH = 3
+# El aHash confirma el parecido; descarta colisiones del dHash en imágenes planas.
+DISTANCIA_AHASH = 10
+
+CAMPOS_ARCHIVO = ('archivo', *TAMANOS, 'ancho', 'alto', 'dhash', 'ahash')
+
+
+def bandas(dhash):
+    return {
+        f'banda_{n + 1}': dhash[n * LARGO_BANDA:(n + 1) * LARGO_BANDA]
+        for n in range(BANDAS)
+    }
+
+
+def distancia(a, b):
+    return (int(a, 16) ^ int(b, 16)).bit_count()
+
+
+def foto_identica(foto):
+    """Primera foto ya subida con el mismo contenido que `foto`, o None."""
+    if not foto.huella:
+        return None
+    return (
+        Foto.objects.filter(huella=foto.huella, estado_subida='lista')
+        .exclude(pk=foto.pk)
+        .exclude(archivo__isnull=True).exclude(archivo='')
+        .order_by('id')
+        .only('id', *CAMPOS_ARCHIVO)
+        .first()
+    )
+
+
+def reutilizar(original):
+    """Valores para guardar en una foto idéntica a `original` sin volver a subirla."""
+    valores = {campo: getattr(original, campo) for campo in CAMPOS_ARCHIVO}
+    valores.update(bandas(original.dhash) if original.dhash else {})
+    valores.update(duplicado_de=original, distancia_duplicado=0)
+    return valores
+
+
+def foto_parecida(foto, dhash, ahash):
+    """(foto, distancia) de la foto de otro reporte más parecida a `foto`, o None."""
+    coincide = Q()
+    for campo, valor in bandas(dhash).items():
+        coincide |= Q(**{campo: valor})
+    # Sin límite: cortar las candidatas podría dejar fuera justo a la parecida.
+    # Coincidir en 16 bits de una banda es raro entre fotos distintas, así que
+    # son pocas y la distancia completa se mide a todas.
+    candidatas = (
+        Foto.objects.filter(coincide, estado_subida='lista')
+        .exclude(reporte_id=foto.reporte_id)
+        .order_by()
+        .values_list('id', 'dhash', 'ahash')
+    )
+
+    mejor = None
+    for pk, otro_dhash, otro_ahash in candidatas:
+        d = distancia(dhash, otro_dhash)
+        if d <= DISTANCIA_DHASH and distancia(ahash, otro_ahash) <= DISTANCIA_AHASH:
+            # A igual distancia, la más antigua: la original antes que sus copias.
+            if mejor is None or (d, pk) < (mejor[1], mejor[0]):
+                mejor = (pk, d)
+    if mejor is None:
+        return None
+    return Foto(pk=mejor[0]), mejor[1]
+
+
+def marcar_parecida(foto, valores):
+    """Agrega a los `valores` de una foto recién subida sus bandas y, si la hay, la foto parecida."""
+    dhash = valores.get('dhash')
+    if not dhash:
+        return valores
+    valores.update(bandas(dhash))
+    parecida = foto_parecida(foto, dhash, valores['ahash'])
+    if parecida is not None:
+        valores['duplicado_de'], valores['distancia_duplicado'] = parecida
+    return valores
@@ -0,0 +1,24 @@
+"""Ejecutor de `manage.py test`: las pruebas no tocan la caché en disco del proyecto.
+
+Guardar reportes invalida tiles y estadísticas; con la FileBasedCache de
+settings las pruebas dejarían archivos en CACHE_DIR y compartirían estado
+entre corridas. Se cambia por una caché en memoria antes de crear la base de
+pruebas.
+"""
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+CACHE_PRUEBAS = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class EjecutorPruebas(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_pruebas = override_settings(CACHES=CACHE_PRUEBAS)
+        self.cache_pruebas.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_pruebas.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,403 @@
+"""Tabla resumen de estadísticas: conteos de reportes por día y dimensión.
+
+Cada fila de EstadisticaReporte cuenta los reportes que comparten la misma
+clave (fecha, estado, sector, gravedad, tipo de animal, franja horaria, día
+de la semana y si tienen foto). Las señales la mantienen al día al crear,
+moderar o borrar reportes; `reconstruir` la recalcula desde cero.
+"""
+
+import hashlib
+import json
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, Exists, F, IntegerField, OuterRef, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, ExtractWeekDay, TruncMonth
+from django.utils import timezone
+from django.utils.dateformat import DateFormat
+from django.utils.dateparse import parse_date
+
+from .models import EstadisticaReporte, Foto, NuevoReporte
+
+# Límites superiores (exclusivos) de las franjas que muestra la página de estadísticas.
+FRANJAS_HORA = (6, 9, 12, 15, 18, 21, 24)
+ETIQUETAS_FRANJAS = ['0-6h', '6-9h', '9-12h', '12-15h', '15-18h', '18-21h', '21-24h']
+
+CAMPOS_CLAVE = ('fecha', 'estado', 'sector', 'gravedad', 'tipo_animal', 'franja_hora', 'dia_semana', 'con_foto')
+# Campos del reporte que cambian su clave sin necesidad de recalcular franja o día.
+CAMPOS_DIRECTOS = ('estado', 'sector', 'gravedad', 'tipo_animal')
+# `duplicado_de` saca o devuelve el reporte de la tabla (ver `agrupar`).
+CAMPOS_REPORTE = ('fecha', 'hora', 'duplicado_de') + CAMPOS_DIRECTOS
+
+DIAS_NOMBRES = ['Dom', 'Lun', 'Mar', 'Mié', 'Jue', 'Vie', 'Sáb']
+
+CLAVE_VERSION = 'estadisticas:version'
+CACHE_TIMEOUT = 60 * 60
+ESTADISTICAS_MAX_AGE = 300
+
+
+def franja_hora():
+    """Expresión SQL con la franja horaria del reporte (-1 si no tiene hora)."""
+    casos = [When(hora__isnull=True, then=Value(-1))]
+    casos += [When(hora__hour__lt=limite, then=Value(i)) for i, limite in enumerate(FRANJAS_HORA)]
+    return Case(*casos, output_field=IntegerField())
+
+
+def agrupar(reportes):
+    """Claves de la tabla resumen con la cantidad de reportes de cada una, calculadas en SQL.
+
+    Los reportes enlazados a otro del mismo incidente no se cuentan.
+    """
+    filas = (
+        reportes.filter(duplicado_de__isnull=True).order_by()
+        .annotate(
+            clave_sector=Coalesce('sector', Value('')),
+            clave_franja=franja_hora(),
+            clave_dia=ExtractWeekDay('fecha'),
+            clave_foto=Exists(Foto.objects.filter(reporte=OuterRef('pk'))),
+        )
+        .values('fecha', 'estado', 'clave_sector', 'gravedad', 'tipo_animal',
+                'clave_franja', 'clave_dia', 'clave_foto')
+        .annotate(total=Count('id'))
+    )
+    for fila in filas:
+        clave = {
+            'fecha': fila['fecha'],
+            'estado': fila['estado'],
+            'sector': fila['clave_sector'],
+            'gravedad': fila['gravedad'],
+            'tipo_animal': fila['tipo_animal'],
+            'franja_hora': fila['clave_franja'],
+            'dia_semana': fila['clave_dia'],
+            'con_foto': bool(fila['clave_foto']),
+        }
+        yield clave, fila['total']
+
+
+def clave_de(valores):
+    """La misma clave que calcula `agrupar`, a partir de los valores de un reporte (dict).
+
+    None si el reporte está enlazado a otro incidente y no se cuenta.
+    """
+    if valores.get('duplicado_de') is not None:
+        return None
+    hora = valores['hora']
+    return {
+        'fecha': valores['fecha'],
+        'estado': valores['estado'],
+        'sector': valores['sector'] or '',
+        'gravedad': valores['gravedad'],
+        'tipo_animal': valores['tipo_animal'],
+        'franja_hora': -1 if hora is None else next(i for i, limite in enumerate(FRANJAS_HORA) if hora.hour < limite),
+        # Como ExtractWeekDay: 1 es domingo.
+        'dia_semana': valores['fecha'].isoweekday() % 7 + 1,
+        'con_foto': bool(valores['con_foto']),
+    }
+
+
+def clave_reporte(reporte, con_foto):
+    """Clave de un reporte a partir de sus atributos en memoria, sin consultar la base de datos."""
+    campos = NuevoReporte._meta
+    return clave_de({
+        **{campo: getattr(reporte, campo) for campo in CAMPOS_DIRECTOS},
+        'fecha': campos.get_field('fecha').to_python(reporte.fecha),
+        'hora': campos.get_field('hora').to_python(reporte.hora),
+        'duplicado_de': reporte.duplicado_de_id,
+        'con_foto': con_foto,
+    })
+
+
+def valores_guardados(pk):
+    """Valores en la base de datos del reporte `pk` que necesitan las señales, en una consulta.
+
+    Incluye los campos de la clave resumen, la ubicación y si tiene fotos; None si no existe.
+    """
+    if pk is None:
+        return None
+    return (
+        NuevoReporte.objects.filter(pk=pk)
+        .annotate(con_foto=Exists(Foto.objects.filter(reporte=OuterRef('pk'))))
+        .values(*CAMPOS_REPORTE, 'latitud', 'longitud', 'con_foto')
+        .first()
+    )
+
+
+def clave_guardada(pk):
+    """Clave actual en la base de datos del reporte `pk`, o None si no existe."""
+    if pk is None:
+        return None
+    return next((clave for clave, _ in agrupar(NuevoReporte.objects.filter(pk=pk))), None)
+
+
+def ajustar(clave, delta):
+    """Suma `delta` al conteo de la clave, creando o eliminando la fila según corresponda."""
+    if not delta:
+        return
+
+    filas = EstadisticaReporte.objects.filter(**clave)
+    if not filas.update(total=F('total') + delta) and delta > 0:
+        try:
+            with transaction.atomic():
+                EstadisticaReporte.objects.create(total=delta, **clave)
+        except IntegrityError:
+            # Otro proceso creó la fila entre el update y el insert.
+            filas.update(total=F('total') + delta)
+
+    if delta < 0:
+        filas.filter(total__lte=0).delete()
+
+
+def mover(anterior, nueva, cantidad=1):
+    """Traslada `cantidad` reportes de una clave a otra (cualquiera de las dos puede ser None)."""
+    if anterior == nueva:
+        return
+    if anterior is not None:
+        ajustar(anterior, -cantidad)
+    if nueva is not None:
+        ajustar(nueva, cantidad)
+    invalidar_cache()
+
+
+def aplicar_deltas(deltas):
+    """Aplica varios ajustes de una vez; `deltas` va de tuplas de CAMPOS_CLAVE a cantidades.
+
+    Usa una consulta para leer las filas afectadas, un UPDATE con CASE para
+    sumar los deltas, un DELETE para las que quedan en cero y un INSERT para
+    las claves nuevas.
+    """
+    deltas = {clave: delta for clave, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    indice_fecha = CAMPOS_CLAVE.index('fecha')
+    existentes = {
+        tuple(fila[c] for c in CAMPOS_CLAVE): fila['id']
+        for fila in EstadisticaReporte.objects.filter(
+            fecha__in={clave[indice_fecha] for clave in deltas}
+        ).values('id', *CAMPOS_CLAVE)
+    }
+
+    sumar = {existentes[clave]: delta for clave, delta in deltas.items() if clave in existentes}
+    if sumar:
+        casos = [When(id=pk, then=Value(delta)) for pk, delta in sumar.items()]
+        filas = EstadisticaReporte.objects.filter(id__in=sumar)
+        filas.update(total=F('total') + Case(*casos, default=Value(0), output_field=IntegerField()))
+        filas.filter(total__lte=0).delete()
+
+    nuevas = [
+        dict(zip(CAMPOS_CLAVE, clave, strict=True))
+        for clave, delta in deltas.items() if clave not in existentes and delta > 0
+    ]
+    if nuevas:
+        try:
+            with transaction.atomic():
+                EstadisticaReporte.objects.bulk_create([
+                    EstadisticaReporte(total=deltas[tuple(c[k] for k in CAMPOS_CLAVE)], **c) for c in nuevas
+                ])
+        except IntegrityError:
+            # Otro proceso creó alguna de las filas: se ajustan de a una.
+            for clave in nuevas:
+                ajustar(clave, deltas[tuple(clave[k] for k in CAMPOS_CLAVE)])
+
+    invalidar_cache()
+
+
+def actualizar_reportes(reportes, **cambios):
+    """Equivalente a `reportes.update(**cambios)` que mantiene la tabla resumen.
+
+    Solo estado, sector, gravedad y tipo de animal se reflejan directamente; si
+    cambian la fecha o la hora conviene guardar cada reporte con save().
+    """
+    directos = {
+        campo: ('' if valor is None and campo == 'sector' else valor)
+        for campo, valor in cambios.items() if campo in CAMPOS_DIRECTOS
+    }
+
+    with transaction.atomic():
+        claves = list(agrupar(reportes)) if directos else []
+        actualizados = reportes.update(**cambios)
+
+        deltas = Counter()
+        for clave, total in claves:
+            deltas[tuple(clave[c] for c in CAMPOS_CLAVE)] -= total
+            deltas[tuple({**clave, **directos}[c] for c in CAMPOS_CLAVE)] += total
+
+        aplicar_deltas(deltas)
+
+    return actualizados
+
+
+def reconstruir(reportes=None, lote=2000):
+    """Vacía la tabla resumen y la vuelve a calcular a partir de los reportes."""
+    reportes = NuevoReporte.objects.all() if reportes is None else reportes
+
+    with transaction.atomic():
+        EstadisticaReporte.objects.all().delete()
+        filas = [EstadisticaReporte(total=cantidad, **clave) for clave, cantidad in agrupar(reportes)]
+        EstadisticaReporte.objects.bulk_create(filas, batch_size=lote)
+        total = len(filas)
+        invalidar_cache()
+
+    return total
+
+
+def filtros_estadisticas(params):
+    """Filtros válidos de la página de estadísticas (rango de fechas, sector, gravedad y animal).
+
+    Los valores fuera de las opciones del modelo se ignoran; una fecha mal escrita
+    lanza ValueError.
+    """
+    filtros = {}
+
+    for campo in ('desde', 'hasta'):
+        valor = (params.get(campo) or '').strip()
+        if valor:
+            try:
+                fecha = parse_date(valor)
+            except ValueError:
+                fecha = None
+            if fecha is None:
+                raise ValueError(f'La fecha "{campo}" debe tener el formato AAAA-MM-DD.')
+            filtros[campo] = fecha
+
+    if 'desde' in filtros and 'hasta' in filtros and filtros['desde'] > filtros['hasta']:
+        raise ValueError('La fecha "desde" es posterior a "hasta".')
+
+    opciones = {
+        'sector': NuevoReporte.SECTOR_CHOICES,
+        'gravedad': NuevoReporte.GRAVEDAD_CHOICES,
+        'tipo_animal': NuevoReporte.TIPO_ANIMAL_CHOICES,
+    }
+    for campo, choices in opciones.items():
+        valor = params.get(campo)
+        if valor in dict(choices):
+            filtros[campo] = valor
+
+    return filtros
+
+
+def filtrar_resumen(resumen, filtros):
+    if 'desde' in filtros:
+        resumen = resumen.filter(fecha__gte=filtros['desde'])
+    if 'hasta' in filtros:
+        resumen = resumen.filter(fecha__lte=filtros['hasta'])
+    for campo in ('sector', 'gravedad', 'tipo_animal'):
+        if campo in filtros:
+            resumen = resumen.filter(**{campo: filtros[campo]})
+    return resumen
+
+
+def series_estadisticas(filtros=None):
+    """Todas las cifras y series de la página de estadísticas, leídas de la tabla resumen."""
+    resumen = filtrar_resumen(EstadisticaReporte.objects.all(), filtros or {})
+    aprobados = resumen.filter(estado='aprobado')
+
+    totales = resumen.aggregate(
+        reportes=Sum('total'),
+        verificados=Sum('total', filter=Q(estado='aprobado')),
+        graves=Sum('total', filter=Q(gravedad='grave')),
+        con_foto=Sum('total', filter=Q(estado='aprobado', con_foto=True)),
+    )
+    total_reportes = totales['reportes'] or 0
+    verificados = totales['verificados'] or 0
+    reportes_con_foto = totales['con_foto'] or 0
+
+    def por_mes(filas):
+        filas = (
+            filas.annotate(mes=TruncMonth('fecha'))
+            .values('mes')
+            .annotate(cantidad=Sum('total'))
+            .order_by('mes')
+        )
+        return [DateFormat(m['mes']).format('M') for m in filas], [m['cantidad'] for m in filas]
+
+    meses, totales_mes = por_mes(aprobados)
+
+    hace_12_meses = timezone.localdate() - timedelta(days=365)
+    meses_tendencia, totales_tendencia = por_mes(aprobados.filter(fecha__gte=hace_12_meses))
+
+    gravedades = dict(aprobados.values_list('gravedad').annotate(cantidad=Sum('total')))
+
+    sector_nombres = dict(NuevoReporte.SECTOR_CHOICES)
+    sectores_ranking = [
+        {'sector': sector_nombres.get(s['sector'], s['sector']), 'total': s['cantidad']}
+        for s in (
+            aprobados.exclude(sector='')
+            .values('sector')
+            .annotate(cantidad=Sum('total'))
+            .order_by('-cantidad')[:10]
+        )
+    ]
+
+    totales_horas = [0] * len(ETIQUETAS_FRANJAS)
+    for franja, cantidad in aprobados.filter(franja_hora__gte=0).values_list('franja_hora').annotate(cantidad=Sum('total')):
+        totales_horas[franja] = cantidad
+
+    totales_dias = [0] * 7
+    for dia, cantidad in aprobados.values_list('dia_semana').annotate(cantidad=Sum('total')):
+        totales_dias[dia - 1] = cantidad
+
+    return {
+        'total_reportes': total_reportes,
+        'verificados': verificados,
+        'ataques_graves': totales['graves'] or 0,
+        'sectores_afectados': resumen.values('sector').distinct().count(),
+
+        'meses': meses,
+        'totales_mes': totales_mes,
+
+        'graves': gravedades.get('grave', 0),
+        'moderados': gravedades.get('moderado', 0),
+        'leves': gravedades.get('leve', 0),
+
+        'sectores_ranking': sectores_ranking,
+        'max_sector': sectores_ranking[0]['total'] if sectores_ranking else 1,
+
+        'meses_tendencia': meses_tendencia,
+        'totales_tendencia': totales_tendencia,
+
+        'etiquetas_horas': list(ETIQUETAS_FRANJAS),
+        'totales_horas': totales_horas,
+
+        # Semana de lunes a domingo.
+        'dias_ordenados': DIAS_NOMBRES[1:] + DIAS_NOMBRES[:1],
+        'totales_dias': totales_dias[1:] + totales_dias[:1],
+
+        'tasa_aprobacion': round(verificados / total_reportes * 100) if total_reportes else 0,
+        'porcentaje_con_foto': round(reportes_con_foto / verificados * 100) if verificados else 0,
+    }
+
+
+def invalidar_cache():
+    """Descarta las respuestas en caché de la API de estadísticas al confirmar la transacción."""
+    transaction.on_commit(lambda: cache.set(CLAVE_VERSION, time.time_ns(), None))
+
+
+def datos_estadisticas(filtros):
+    """Series de estadísticas en JSON como (cuerpo, etag), cacheadas por combinación de filtros.
+
+    La tendencia depende del día, así que la fecha también forma parte de la clave.
+    """
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        cache.add(CLAVE_VERSION, time.time_ns(), None)
+        version = cache.get(CLAVE_VERSION)
+
+    clave = 'estadisticas:{}:{}:{}'.format(
+        version,
+        timezone.localdate().isoformat(),
+        ','.join(f'{k}={v}' for k, v in sorted(filtros.items())),
+    )
+
+    entrada = cache.get(clave)
+    if entrada is None:
+        datos = series_estadisticas(filtros)
+        datos['filtros'] = {k: str(v) for k, v in filtros.items()}
+        cuerpo = json.dumps(datos, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        entrada = (cuerpo, '"%s"' % hashlib.sha1(cuerpo).hexdigest())
+        cache.set(clave, entrada, CACHE_TIMEOUT)
+
+    return entrada
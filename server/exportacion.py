@@ -0,0 +1,411 @@
+"""Exportación de reportes con los filtros del panel de moderación.
+
+Los reportes se recorren en lotes por id (keyset), pidiendo solo las columnas
+exportadas, así la memoria no crece con el tamaño de la exportación y cada
+consulta usa la clave primaria. Formatos: CSV, NDJSON, GeoJSON y Parquet
+(este último requiere pyarrow).
+
+Las exportaciones grandes se piden como ExportacionJob y las genera el
+comando `procesar_exportaciones` en un directorio local; pedidos iguales
+dentro de VENTANA_REUTILIZACION reutilizan el mismo archivo.
+"""
+
+import csv
+import hashlib
+import importlib.util
+import io
+import json
+import os
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .estadisticas import filtros_estadisticas
+from .models import ExportacionJob, NuevoReporte
+
+LOTE_EXPORTACION = 2000
+
+# Parámetros de filtro que admite una exportación.
+PARAMETROS_FILTRO = ('estado', 'gravedad', 'animal', 'anonimo', 'desde', 'hasta')
+
+VENTANA_REUTILIZACION = timedelta(minutes=15)
+RETENCION_EXPORTACIONES = timedelta(days=1)
+# Un trabajo "procesando" por más de esto se considera abandonado y se reintenta.
+TIEMPO_MAXIMO_PROCESO = timedelta(hours=1)
+
+# (encabezado, campo) en el orden del archivo.
+COLUMNAS = [
+    ('ID', 'id'),
+    ('Título', 'titulo'),
+    ('Descripción', 'descripcion'),
+    ('Estado', 'estado'),
+    ('Gravedad', 'gravedad'),
+    ('Tipo Animal', 'tipo_animal'),
+    ('Cantidad Perros', 'cantidad_perros'),
+    ('Dirección', 'direccion'),
+    ('Latitud', 'latitud'),
+    ('Longitud', 'longitud'),
+    ('Fecha', 'fecha'),
+    ('Hora', 'hora'),
+    ('Usuario', 'usuario__username'),
+    ('Email', 'email_reportante'),
+    ('Teléfono', 'telefono_reportante'),
+    ('Moderador', 'moderador__username'),
+    ('Comentario Moderación', 'comentario_moderacion'),
+]
+CAMPOS = [campo for _, campo in COLUMNAS]
+
+# Formatos tipados (NDJSON, GeoJSON, Parquet): nombre de la columna -> campo.
+COLUMNAS_DATOS = {
+    'id': 'id',
+    'titulo': 'titulo',
+    'descripcion': 'descripcion',
+    'estado': 'estado',
+    'gravedad': 'gravedad',
+    'tipo_animal': 'tipo_animal',
+    'cantidad_perros': 'cantidad_perros',
+    'sector': 'sector',
+    'direccion': 'direccion',
+    'latitud': 'latitud',
+    'longitud': 'longitud',
+    'fecha': 'fecha',
+    'hora': 'hora',
+    'anonimo': 'anonimo',
+    'usuario': 'usuario__username',
+    'email': 'email_reportante',
+    'telefono': 'telefono_reportante',
+    'moderador': 'moderador__username',
+    'comentario_moderacion': 'comentario_moderacion',
+    'fecha_creacion': 'fecha_creacion',
+}
+
+# formato -> (content type, extensión)
+FORMATOS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'geojson': ('application/geo+json', 'geojson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+def filtros_reportes(params, fechas=True):
+    """Q con los filtros del panel (estado, gravedad, animal, anonimo) y, si `fechas`, desde/hasta.
+
+    Una fecha mal escrita lanza ValueError.
+    """
+    filtros = Q()
+
+    estado = params.get('estado')
+    if estado and estado != 'todos':
+        filtros &= Q(estado=estado)
+
+    gravedad = params.get('gravedad')
+    if gravedad and gravedad != 'all':
+        filtros &= Q(gravedad=gravedad)
+
+    animal = params.get('animal')
+    if animal and animal != 'all':
+        filtros &= Q(tipo_animal=animal)
+
+    anonimo = params.get('anonimo')
+    if anonimo == 'true':
+        filtros &= Q(anonimo=True)
+    elif anonimo == 'false':
+        filtros &= Q(anonimo=False)
+
+    if fechas:
+        rango = filtros_estadisticas({campo: params.get(campo) for campo in ('desde', 'hasta')})
+        if 'desde' in rango:
+            filtros &= Q(fecha__gte=rango['desde'])
+        if 'hasta' in rango:
+            filtros &= Q(fecha__lte=rango['hasta'])
+
+    return filtros
+
+
+def por_lotes(reportes, campos=CAMPOS, lote=LOTE_EXPORTACION):
+    """Listas de filas (tuplas de `campos`) de `reportes` en orden de id, una por consulta."""
+    campos = list(campos)
+    if 'id' not in campos:
+        campos.insert(0, 'id')
+    posicion_id = campos.index('id')
+
+    reportes = reportes.order_by('id').values_list(*campos)
+    ultimo = 0
+    while True:
+        filas = list(reportes.filter(id__gt=ultimo)[:lote])
+        if filas:
+            yield filas
+        if len(filas) < lote:
+            return
+        ultimo = filas[-1][posicion_id]
+
+
+class Eco:
+    """Pseudo-archivo para csv.writer: devuelve lo escrito en vez de guardarlo."""
+
+    def write(self, valor):
+        return valor
+
+
+def fila_csv(fila):
+    datos = dict(zip(CAMPOS, fila))
+    datos['fecha'] = datos['fecha'].strftime('%d-%m-%Y') if datos['fecha'] else ''
+    datos['hora'] = datos['hora'].strftime('%H:%M') if datos['hora'] else ''
+    datos['usuario__username'] = datos['usuario__username'] or 'Anónimo'
+    datos['moderador__username'] = datos['moderador__username'] or ''
+    datos['comentario_moderacion'] = datos['comentario_moderacion'] or ''
+    return [datos[campo] for campo in CAMPOS]
+
+
+def bloques_csv(reportes, lote=LOTE_EXPORTACION):
+    """Genera el CSV de a un bloque de texto por lote, empezando por el encabezado."""
+    escritor = csv.writer(Eco())
+    yield escritor.writerow([encabezado for encabezado, _ in COLUMNAS])
+    for filas in por_lotes(reportes, lote=lote):
+        yield ''.join(escritor.writerow(fila_csv(fila)) for fila in filas)
+
+
+def registros(reportes, lote=LOTE_EXPORTACION):
+    """Listas de diccionarios con COLUMNAS_DATOS y tipos nativos, una por lote."""
+    nombres = list(COLUMNAS_DATOS)
+    for filas in por_lotes(reportes, COLUMNAS_DATOS.values(), lote):
+        yield [dict(zip(nombres, fila)) for fila in filas]
+
+
+def a_json(registro):
+    """Registro listo para json.dumps: fechas ISO 8601 y coordenadas como números."""
+    datos = dict(registro)
+    datos['latitud'] = float(datos['latitud'])
+    datos['longitud'] = float(datos['longitud'])
+    datos['fecha'] = datos['fecha'].isoformat()
+    datos['hora'] = datos['hora'].strftime('%H:%M') if datos['hora'] else None
+    datos['fecha_creacion'] = datos['fecha_creacion'].isoformat()
+    return datos
+
+
+def bloques_ndjson(reportes, lote=LOTE_EXPORTACION):
+    for lista in registros(reportes, lote):
+        yield ''.join(json.dumps(a_json(r), ensure_ascii=False) + '\n' for r in lista)
+
+
+def bloques_geojson(reportes, lote=LOTE_EXPORTACION):
+    """FeatureCollection de puntos; se escribe de a un lote de features por vez."""
+    yield '{"type": "FeatureCollection", "features": ['
+    separador = ''
+    for lista in registros(reportes, lote):
+        features = []
+        for r in lista:
+            propiedades = a_json(r)
+            coordenadas = [propiedades.pop('longitud'), propiedades.pop('latitud')]
+            features.append(json.dumps({
+                'type': 'Feature',
+                'id': propiedades['id'],
+                'geometry': {'type': 'Point', 'coordinates': coordenadas},
+                'properties': propiedades,
+            }, ensure_ascii=False))
+        yield separador + ', '.join(features)
+        separador = ', '
+    yield ']}'
+
+
+class Tubo(io.RawIOBase):
+    """Archivo de solo escritura que guarda lo escrito hasta que se lo vacía.
+
+    tell() informa la posición total, que el escritor de Parquet usa para los
+    offsets del pie del archivo.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.partes = []
+        self.posicion = 0
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        self.posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self.posicion
+
+    def vaciar(self):
+        datos = b''.join(self.partes)
+        self.partes = []
+        return datos
+
+
+def parquet_disponible():
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def esquema_parquet(pa):
+    categoria = pa.dictionary(pa.int8(), pa.string())
+    return pa.schema([
+        ('id', pa.int64()),
+        ('titulo', pa.string()),
+        ('descripcion', pa.string()),
+        ('estado', categoria),
+        ('gravedad', categoria),
+        ('tipo_animal', categoria),
+        ('cantidad_perros', pa.int16()),
+        ('sector', categoria),
+        ('direccion', pa.string()),
+        ('latitud', pa.float64()),
+        ('longitud', pa.float64()),
+        ('fecha', pa.date32()),
+        ('hora', pa.time32('ms')),
+        ('anonimo', pa.bool_()),
+        ('usuario', pa.string()),
+        ('email', pa.string()),
+        ('telefono', pa.string()),
+        ('moderador', pa.string()),
+        ('comentario_moderacion', pa.string()),
+        ('fecha_creacion', pa.timestamp('us', tz='UTC')),
+    ])
+
+
+def bloques_parquet(reportes, lote=LOTE_EXPORTACION):
+    """Parquet con columnas tipadas; cada lote es un row group que se envía al escribirse.
+
+    Lanza ImportError si pyarrow no está instalado.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    esquema = esquema_parquet(pa)
+    salida = Tubo()
+    escritor = pq.ParquetWriter(salida, esquema, compression='zstd')
+    pendiente = salida.vaciar
+
+    try:
+        for lista in registros(reportes, lote):
+            columnas = {nombre: [r[nombre] for r in lista] for nombre in esquema.names}
+            columnas['latitud'] = [float(v) for v in columnas['latitud']]
+            columnas['longitud'] = [float(v) for v in columnas['longitud']]
+            escritor.write_table(pa.Table.from_pydict(columnas, schema=esquema))
+            yield pendiente()
+    finally:
+        escritor.close()
+    yield pendiente()
+
+
+def exportar(reportes, formato, lote=LOTE_EXPORTACION):
+    """Generador de bloques (str o bytes) de `reportes` en `formato`."""
+    generadores = {
+        'csv': bloques_csv,
+        'ndjson': bloques_ndjson,
+        'geojson': bloques_geojson,
+        'parquet': bloques_parquet,
+    }
+    return generadores[formato](reportes, lote=lote)
+
+
+def normalizar_filtros(params):
+    """Filtros de `params` que cambian el resultado; ValueError si no son válidos."""
+    filtros_reportes(params)
+    return {
+        campo: params.get(campo)
+        for campo in PARAMETROS_FILTRO
+        if params.get(campo) and params.get(campo) not in ('all', 'todos')
+    }
+
+
+def clave_exportacion(formato, filtros):
+    return hashlib.sha256(json.dumps([formato, filtros], sort_keys=True).encode()).hexdigest()
+
+
+def solicitar_exportacion(usuario, formato, params):
+    """Devuelve (trabajo, reutilizado) para exportar en `formato` con los filtros de `params`.
+
+    Si ya hay uno igual en curso o terminado dentro de la ventana de
+    reutilización se devuelve ese. Lanza ValueError si el formato o los
+    filtros no son válidos.
+    """
+    if formato not in FORMATOS:
+        raise ValueError('Formato de exportación desconocido.')
+    if formato == 'parquet' and not parquet_disponible():
+        raise ValueError('La exportación a Parquet no está disponible en este servidor (falta pyarrow).')
+
+    filtros = normalizar_filtros(params)
+    clave = clave_exportacion(formato, filtros)
+    vigentes = ExportacionJob.objects.filter(clave=clave).filter(
+        Q(estado__in=['pendiente', 'procesando'])
+        | Q(estado='listo', terminado__gte=timezone.now() - VENTANA_REUTILIZACION)
+    )
+    existente = vigentes.order_by('-creado').first()
+    if existente is not None:
+        return existente, True
+
+    trabajo = ExportacionJob.objects.create(usuario=usuario, formato=formato, filtros=filtros, clave=clave)
+    return trabajo, False
+
+
+def ruta_archivo(trabajo):
+    return Path(settings.EXPORTACIONES_DIR) / trabajo.archivo
+
+
+def tomar_exportacion():
+    """Marca como 'procesando' la exportación pendiente más antigua y la devuelve (None si no hay).
+
+    El cambio de estado es condicional, así varios workers pueden correr a la vez.
+    """
+    ahora = timezone.now()
+    disponibles = ExportacionJob.objects.filter(
+        Q(estado='pendiente') | Q(estado='procesando', iniciado__lt=ahora - TIEMPO_MAXIMO_PROCESO)
+    ).order_by('creado')
+
+    for pk, estado, iniciado in disponibles.values_list('id', 'estado', 'iniciado')[:10]:
+        tomado = ExportacionJob.objects.filter(pk=pk, estado=estado, iniciado=iniciado).update(
+            estado='procesando', iniciado=ahora
+        )
+        if tomado:
+            return ExportacionJob.objects.get(pk=pk)
+    return None
+
+
+def generar_exportacion(trabajo, lote=LOTE_EXPORTACION):
+    """Escribe el archivo de `trabajo` y lo marca como listo (o con error)."""
+    _, extension = FORMATOS[trabajo.formato]
+    trabajo.archivo = f'reportes_{trabajo.id}_{trabajo.clave[:12]}.{extension}'
+    destino = ruta_archivo(trabajo)
+    parcial = destino.with_name(destino.name + '.parcial')
+
+    try:
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        reportes = NuevoReporte.objects.filter(filtros_reportes(trabajo.filtros))
+        filas = reportes.count()
+        with open(parcial, 'wb') as archivo:
+            for bloque in exportar(reportes, trabajo.formato, lote):
+                archivo.write(bloque.encode('utf-8') if isinstance(bloque, str) else bloque)
+        os.replace(parcial, destino)
+    except Exception as e:
+        parcial.unlink(missing_ok=True)
+        trabajo.estado = 'error'
+        trabajo.error = str(e)
+        trabajo.terminado = timezone.now()
+        trabajo.save(update_fields=['estado', 'error', 'terminado', 'archivo'])
+        raise
+
+    trabajo.estado = 'listo'
+    trabajo.filas = filas
+    trabajo.tamano = destino.stat().st_size
+    trabajo.terminado = timezone.now()
+    trabajo.save(update_fields=['estado', 'archivo', 'filas', 'tamano', 'terminado'])
+    return trabajo
+
+
+def limpiar_exportaciones(retencion=RETENCION_EXPORTACIONES):
+    """Borra los trabajos terminados hace más de `retencion` junto con sus archivos."""
+    viejos = ExportacionJob.objects.filter(
+        estado__in=['listo', 'error'], terminado__lt=timezone.now() - retencion
+    )
+    for trabajo in viejos.exclude(archivo=''):
+        ruta_archivo(trabajo).unlink(missing_ok=True)
+    return viejos.delete()[0]
@@ -0,0 +1,212 @@
+"""Subida diferida de las fotos de los reportes.
+
+El formulario solo copia cada foto a FOTOS_STAGING_DIR y crea la fila `Foto`
+en estado 'pendiente', así el envío no espera a Cloudinary. El comando
+`subir_fotos` toma las pendientes, las normaliza y genera sus miniaturas
+(server/imagenes.py), las sube en paralelo (con un tope de hilos) al backend
+de almacenamiento y reintenta con espera creciente las que fallan. Una foto
+idéntica a otra ya subida no se vuelve a subir (server/duplicados.py).
+"""
+
+import hashlib
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import duplicados
+from .almacenamiento import almacenamiento
+from .imagenes import TAMANOS, ImagenInvalida, procesar_imagen
+from .mapa import invalidar_tiles
+from .models import Foto, NuevoReporte, SesionSubida
+
+logger = logging.getLogger(__name__)
+
+HILOS_SUBIDA = 4
+LOTE_SUBIDA = 20
+MAX_INTENTOS_SUBIDA = 5
+# Espera antes del reintento n: ESPERA_REINTENTO * 2 ** (n - 1).
+ESPERA_REINTENTO = timedelta(seconds=30)
+# Una foto 'subiendo' por más de esto se considera abandonada por su worker.
+TIEMPO_MAXIMO_SUBIDA = timedelta(minutes=10)
+
+
+def ruta_staging(nombre):
+    return Path(settings.FOTOS_STAGING_DIR) / nombre
+
+
+def guardar_en_staging(archivo):
+    """Copia un UploadedFile a FOTOS_STAGING_DIR por partes.
+
+    Devuelve el nombre asignado y el SHA-256 del contenido.
+    """
+    extension = Path(archivo.name or '').suffix.lower()[:10]
+    nombre = f'{uuid.uuid4().hex}{extension}'
+    destino = ruta_staging(nombre)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    huella = hashlib.sha256()
+    with open(destino, 'wb') as salida:
+        for parte in archivo.chunks():
+            salida.write(parte)
+            huella.update(parte)
+    return nombre, huella.hexdigest()
+
+
+def preparar_fotos(reporte, archivos, sesiones=()):
+    """Deja las fotos de `reporte` en espera de subida y devuelve las filas creadas.
+
+    `archivos` llegan con el formulario; `sesiones` son subidas por partes ya
+    completas (server/subidas.py) cuyo archivo ya está en staging.
+    """
+    fotos = []
+    for archivo in archivos:
+        nombre, huella = guardar_en_staging(archivo)
+        fotos.append(Foto.objects.create(
+            reporte=reporte,
+            orden=len(fotos) + 1,
+            archivo_local=nombre,
+            huella=huella,
+            estado_subida='pendiente',
+        ))
+    for sesion in sesiones:
+        # Borrar la sesión la reserva: una misma subida no sirve para dos reportes.
+        if not SesionSubida.objects.filter(pk=sesion.pk, estado='completa').delete()[0]:
+            continue
+        fotos.append(Foto.objects.create(
+            reporte=reporte,
+            orden=len(fotos) + 1,
+            archivo_local=sesion.archivo_local,
+            huella=sesion.huella,
+            estado_subida='pendiente',
+        ))
+    return fotos
+
+
+def tomar_fotos(cantidad=LOTE_SUBIDA):
+    """Marca como 'subiendo' hasta `cantidad` fotos listas para (re)intentar y las devuelve.
+
+    El cambio de estado es condicional, así varios workers pueden correr a la vez.
+    """
+    ahora = timezone.now()
+    disponibles = Foto.objects.filter(
+        Q(estado_subida='pendiente') | Q(estado_subida='subiendo'),
+        Q(proximo_intento__isnull=True) | Q(proximo_intento__lte=ahora),
+    )
+    candidatas = list(disponibles.order_by('subida_en', 'id').values_list('id', flat=True)[:cantidad])
+    if not candidatas:
+        return []
+
+    marca = ahora + TIEMPO_MAXIMO_SUBIDA
+    disponibles.filter(id__in=candidatas).update(estado_subida='subiendo', proximo_intento=marca)
+    # `marca` identifica las fotos de esta llamada: las que tomó otro worker tienen otra.
+    return list(
+        Foto.objects.filter(id__in=candidatas, estado_subida='subiendo', proximo_intento=marca)
+        .order_by('subida_en', 'id')
+    )
+
+
+def subir(foto):
+    """Normaliza la foto en staging y sube el resultado y sus tamaños fijos.
+
+    Devuelve los campos a guardar en la fila o lanza la excepción (ImagenInvalida
+    o la del backend).
+    """
+    rutas = procesar_imagen(ruta_staging(foto.archivo_local))
+    try:
+        valores = {campo: rutas[campo] for campo in ('ancho', 'alto', 'dhash', 'ahash')}
+        for campo in ('archivo', *TAMANOS):
+            valores[campo] = almacenamiento().guardar(rutas[campo])
+        return valores
+    finally:
+        for campo in ('archivo', *TAMANOS):
+            rutas[campo].unlink(missing_ok=True)
+
+
+def publicar_foto(reporte_id):
+    """Marca el reporte como modificado e invalida sus tiles: el mapa ya puede mostrar la foto.
+
+    La foto pasa a 'lista' con un UPDATE que no toca el reporte; sin esto la
+    versión del mapa, los deltas y los tiles seguirían sin la foto.
+    """
+    reportes = NuevoReporte.objects.filter(pk=reporte_id)
+    reportes.update(fecha_actualizacion=timezone.now())
+    coordenadas = list(reportes.values_list('latitud', 'longitud'))
+    transaction.on_commit(lambda: invalidar_tiles(coordenadas))
+
+
+def registrar_resultado(foto, valores=None, error=None):
+    ahora = timezone.now()
+    tomada = Foto.objects.filter(pk=foto.pk, estado_subida='subiendo', proximo_intento=foto.proximo_intento)
+
+    if error is None:
+        if tomada.update(**valores, estado_subida='lista', archivo_local='', proximo_intento=None, error_subida=''):
+            ruta_staging(foto.archivo_local).unlink(missing_ok=True)
+            publicar_foto(foto.reporte_id)
+        return 'lista'
+
+    intentos = foto.intentos_subida + 1
+    # Un archivo que no es imagen no mejora con reintentos.
+    if intentos >= MAX_INTENTOS_SUBIDA or isinstance(error, ImagenInvalida):
+        tomada.update(estado_subida='error', intentos_subida=intentos, proximo_intento=None, error_subida=str(error))
+        return 'error'
+
+    tomada.update(
+        estado_subida='pendiente',
+        intentos_subida=intentos,
+        proximo_intento=ahora + ESPERA_REINTENTO * 2 ** (intentos - 1),
+        error_subida=str(error),
+    )
+    return 'reintento'
+
+
+def procesar_fotos(hilos=HILOS_SUBIDA, lote=LOTE_SUBIDA):
+    """Sube un lote de fotos pendientes y devuelve un conteo por resultado.
+
+    Los hilos solo hablan con el backend de almacenamiento; las escrituras y
+    consultas a la base de datos se hacen en el hilo principal.
+    """
+    fotos = tomar_fotos(lote)
+    conteo = {'lista': 0, 'reutilizada': 0, 'reintento': 0, 'error': 0}
+    if not fotos:
+        return conteo
+
+    # Las fotos del lote con el mismo contenido se suben una vez: la primera
+    # (la más antigua) se sube y las demás reutilizan sus archivos.
+    por_subir = {}
+    for foto in fotos:
+        original = duplicados.foto_identica(foto)
+        if original is None:
+            por_subir.setdefault(foto.huella or foto.pk, []).append(foto)
+        elif registrar_resultado(foto, valores=duplicados.reutilizar(original)) == 'lista':
+            conteo['reutilizada'] += 1
+
+    with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+        futuros = [(grupo, ejecutor.submit(subir, grupo[0])) for grupo in por_subir.values()]
+        for (foto, *copias), futuro in futuros:
+            error = None
+            try:
+                valores = duplicados.marcar_parecida(foto, futuro.result())
+                resultado = registrar_resultado(foto, valores=valores)
+            except Exception as e:
+                logger.warning('No se pudo subir la foto %s: %s', foto.pk, e)
+                error = e
+                resultado = registrar_resultado(foto, error=e)
+            conteo[resultado] += 1
+
+            for copia in copias:
+                if error is not None:
+                    conteo[registrar_resultado(copia, error=error)] += 1
+                    continue
+                # Sin original (otro worker se quedó con la foto) la copia se retoma al vencer su marca.
+                original = duplicados.foto_identica(copia)
+                if original is not None:
+                    if registrar_resultado(copia, valores=duplicados.reutilizar(original)) == 'lista':
+                        conteo['reutilizada'] += 1
+
+    return conteo
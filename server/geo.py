@@ -0,0 +1,130 @@
+"""Utilidades geográficas: bounding boxes, grillas de agrupación e índice espacial."""
+
+import math
+
+VALDIVIA_CENTRO = (-39.8142, -73.2459)
+# Área cubierta por la capa de calor: (oeste, sur, este, norte).
+VALDIVIA_BBOX = (-73.45, -39.95, -73.05, -39.70)
+
+# Desde este zoom se envían puntos individuales en vez de clusters.
+ZOOM_PUNTOS = 16
+ZOOM_MAXIMO = 22
+
+# Tamaño aproximado (en pixeles de pantalla) de cada celda de agrupación.
+PIXELES_CELDA = 64
+PIXELES_TILE = 256
+
+
+def parsear_bbox(valor):
+    """Convierte 'oeste,sur,este,norte' (formato de Leaflet) en una tupla de floats."""
+    partes = [p.strip() for p in (valor or '').split(',')]
+    if len(partes) != 4:
+        raise ValueError('El bbox debe tener 4 valores: oeste,sur,este,norte.')
+
+    oeste, sur, este, norte = (float(p) for p in partes)
+    # float() acepta 'nan' e 'inf', que los topes de abajo no descartan.
+    if not all(math.isfinite(v) for v in (oeste, sur, este, norte)):
+        raise ValueError('El bbox debe tener valores numéricos finitos.')
+
+    sur, norte = max(sur, -90.0), min(norte, 90.0)
+    oeste, este = max(oeste, -180.0), min(este, 180.0)
+
+    if sur > norte or oeste > este:
+        raise ValueError('El bbox está invertido.')
+
+    return oeste, sur, este, norte
+
+
+def parsear_zoom(valor):
+    """Valida el nivel de zoom recibido desde el cliente."""
+    zoom = int(valor)
+    if not 0 <= zoom <= ZOOM_MAXIMO:
+        raise ValueError(f'El zoom debe estar entre 0 y {ZOOM_MAXIMO}.')
+    return zoom
+
+
+def tamano_celda(zoom):
+    """Grados que ocupa una celda de PIXELES_CELDA pixeles al zoom indicado."""
+    return 360.0 / (PIXELES_TILE * 2 ** zoom) * PIXELES_CELDA
+
+
+# Índice espacial: grilla fija de CELDA_INDICE grados (~1.1 km en latitud).
+CELDA_INDICE = 0.01
+COLUMNAS_INDICE = 36000
+# Más filas que esto y conviene filtrar solo por latitud/longitud.
+MAX_FILAS_INDICE = 64
+
+RADIO_TIERRA_M = 6371008.8
+METROS_POR_GRADO = math.pi * RADIO_TIERRA_M / 180.0
+
+
+def celda_indice(lat, lon):
+    """Número de celda de la grilla del índice espacial que contiene el punto."""
+    fila = min(math.floor((float(lat) + 90.0) / CELDA_INDICE), int(180 / CELDA_INDICE) - 1)
+    columna = min(math.floor((float(lon) + 180.0) / CELDA_INDICE), COLUMNAS_INDICE - 1)
+    return fila * COLUMNAS_INDICE + columna
+
+
+def rangos_celdas(bbox):
+    """Rangos contiguos (inicio, fin) de celdas que cubren el bbox, uno por fila de la grilla.
+
+    Devuelve None cuando el bbox abarca demasiadas filas para que el índice ayude.
+    """
+    oeste, sur, este, norte = bbox
+    inicio = celda_indice(sur, oeste)
+    fin = celda_indice(norte, este)
+
+    fila_inicio, columna_inicio = divmod(inicio, COLUMNAS_INDICE)
+    fila_fin, columna_fin = divmod(fin, COLUMNAS_INDICE)
+
+    if fila_fin - fila_inicio + 1 > MAX_FILAS_INDICE:
+        return None
+
+    return [
+        (fila * COLUMNAS_INDICE + columna_inicio, fila * COLUMNAS_INDICE + columna_fin)
+        for fila in range(fila_inicio, fila_fin + 1)
+    ]
+
+
+def bbox_radio(lat, lon, metros):
+    """Bbox que contiene el círculo de `metros` alrededor del punto."""
+    dlat = metros / METROS_POR_GRADO
+    dlon = metros / (METROS_POR_GRADO * max(math.cos(math.radians(lat)), 1e-6))
+    return (
+        max(lon - dlon, -180.0),
+        max(lat - dlat, -90.0),
+        min(lon + dlon, 180.0),
+        min(lat + dlat, 90.0),
+    )
+
+
+def distancia_metros(lat1, lon1, lat2, lon2):
+    """Distancia haversine en metros."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * RADIO_TIERRA_M * math.asin(math.sqrt(a))
+
+
+def tile_valido(z, x, y):
+    return 0 <= z <= ZOOM_MAXIMO and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def tile_bbox(z, x, y):
+    """Bbox (oeste, sur, este, norte) de un tile z/x/y del esquema slippy map."""
+    n = 2 ** z
+
+    def latitud(fila):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * fila / n))))
+
+    return x / n * 360.0 - 180.0, latitud(y + 1), (x + 1) / n * 360.0 - 180.0, latitud(y)
+
+
+def tile_de_punto(lat, lon, z):
+    """Coordenadas (x, y) del tile que contiene el punto al zoom z."""
+    n = 2 ** z
+    lat = max(min(float(lat), 85.0511), -85.0511)
+    x = int((float(lon) + 180.0) / 360.0 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
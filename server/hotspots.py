@@ -0,0 +1,295 @@
+"""Detección de hotspots: grupos de ataques aprobados cercanos en el espacio y en el tiempo.
+
+Se usa DBSCAN sobre una grilla de celdas del tamaño del radio, de modo que cada
+punto solo se compara con los de su celda y las 8 vecinas. La detección es
+incremental: cada pasada recalcula solo la zona alrededor de las celdas del
+índice espacial (celda_geo) con reportes modificados desde la pasada anterior.
+"""
+
+import math
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .geo import CELDA_INDICE, COLUMNAS_INDICE, METROS_POR_GRADO
+from .models import EjecucionHotspots, Hotspot, NuevoReporte
+
+RADIO_M = 250.0
+MINIMO_REPORTES = 5
+DIAS = 90
+
+# Cantidad máxima de celdas por consulta `celda_geo__in`.
+LOTE_CELDAS = 5000
+
+
+def dbscan_grilla(x, y, radio, minimo):
+    """DBSCAN sobre coordenadas planas en metros; devuelve la etiqueta de cada punto (-1 = ruido).
+
+    Los puntos se ordenan por celda de `radio` metros y las distancias se calculan
+    en bloque entre cada celda y sus vecinas.
+    """
+    n = len(x)
+    etiquetas = np.full(n, -1, dtype=np.int64)
+    if n == 0:
+        return etiquetas
+
+    cx = np.floor(x / radio).astype(np.int64)
+    cy = np.floor(y / radio).astype(np.int64)
+    cx -= cx.min()
+    cy -= cy.min()
+    # Con este ancho, cy ± 1 nunca cae en la columna de otra fila de celdas.
+    ancho = int(cy.max()) + 3
+    clave = cx * ancho + cy
+
+    orden = np.argsort(clave, kind='stable')
+    claves, inicios, cuentas = np.unique(clave[orden], return_index=True, return_counts=True)
+
+    radio2 = radio * radio
+    pares_i, pares_j = [], []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            vecinas = claves + dx * ancho + dy
+            posiciones = np.searchsorted(claves, vecinas)
+            existe = posiciones < len(claves)
+            existe[existe] = claves[posiciones[existe]] == vecinas[existe]
+
+            for a, b in zip(np.nonzero(existe)[0], posiciones[existe]):
+                ia = orden[inicios[a]:inicios[a] + cuentas[a]]
+                ib = orden[inicios[b]:inicios[b] + cuentas[b]]
+                d2 = (x[ia, None] - x[None, ib]) ** 2 + (y[ia, None] - y[None, ib]) ** 2
+                ii, jj = np.nonzero(d2 <= radio2)
+                pares_i.append(ia[ii])
+                pares_j.append(ib[jj])
+
+    i = np.concatenate(pares_i)
+    j = np.concatenate(pares_j)
+
+    # Cada punto es vecino de sí mismo, igual que en DBSCAN.
+    nucleo = np.bincount(i, minlength=n) >= minimo
+
+    # Componentes conexas de los núcleos: propagación de la etiqueta mínima con
+    # salto de punteros. Los pares son simétricos, basta una dirección.
+    enlace = nucleo[i] & nucleo[j]
+    ci, cj = i[enlace], j[enlace]
+    componente = np.arange(n)
+    while True:
+        nueva = componente.copy()
+        np.minimum.at(nueva, ci, componente[cj])
+        nueva = nueva[nueva]
+        if np.array_equal(nueva, componente):
+            break
+        componente = nueva
+
+    etiquetas[nucleo] = componente[nucleo]
+    borde = ~nucleo[i] & nucleo[j]
+    etiquetas[i[borde]] = componente[j[borde]]
+
+    agrupados = etiquetas >= 0
+    etiquetas[agrupados] = np.unique(etiquetas[agrupados], return_inverse=True)[1]
+    return etiquetas
+
+
+def anillo_celdas(radio, celdas):
+    """Cantidad de celdas del índice que hay que agregar alrededor para cubrir `radio` metros."""
+    filas = [c // COLUMNAS_INDICE for c in celdas]
+    latitud = max(max(abs(f * CELDA_INDICE - 90.0), abs((f + 1) * CELDA_INDICE - 90.0)) for f in filas)
+    ancho_m = CELDA_INDICE * METROS_POR_GRADO * max(math.cos(math.radians(min(latitud, 89.0))), 1e-6)
+    return max(1, math.ceil(radio / ancho_m))
+
+
+def vecindad_celdas(celdas, anillo):
+    fila_columna = [divmod(c, COLUMNAS_INDICE) for c in celdas]
+    return {
+        (fila + df) * COLUMNAS_INDICE + columna + dc
+        for fila, columna in fila_columna
+        for df in range(-anillo, anillo + 1)
+        for dc in range(-anillo, anillo + 1)
+    }
+
+
+def cargar_puntos(reportes, zona=None):
+    """Reportes de la ventana como arreglos; si se indica `zona`, solo los de esas celdas."""
+    campos = ('id', 'latitud', 'longitud', 'celda_geo', 'fecha', 'gravedad')
+    if zona is None:
+        filas = list(reportes.values_list(*campos))
+    else:
+        zona = sorted(zona)
+        filas = []
+        for inicio in range(0, len(zona), LOTE_CELDAS):
+            lote = zona[inicio:inicio + LOTE_CELDAS]
+            filas.extend(reportes.filter(celda_geo__in=lote).values_list(*campos))
+
+    return {
+        'id': np.array([f[0] for f in filas], dtype=np.int64),
+        'lat': np.array([float(f[1]) for f in filas], dtype=float),
+        'lon': np.array([float(f[2]) for f in filas], dtype=float),
+        'celda': np.array([f[3] for f in filas], dtype=np.int64),
+        'fecha': [f[4] for f in filas],
+        'grave': np.array([f[5] == 'grave' for f in filas], dtype=bool),
+    }
+
+
+def proyectar(lats, lons):
+    """Proyección equirectangular local a metros, suficiente para distancias de cientos de metros."""
+    if not len(lats):
+        return lats, lons
+    cos_lat = math.cos(math.radians(float(lats.mean())))
+    return lons * METROS_POR_GRADO * cos_lat, lats * METROS_POR_GRADO
+
+
+def agrupar_puntos(puntos, radio, minimo):
+    x, y = proyectar(puntos['lat'], puntos['lon'])
+    etiquetas = dbscan_grilla(x, y, radio, minimo)
+    grupos = defaultdict(list)
+    for indice, etiqueta in enumerate(etiquetas.tolist()):
+        if etiqueta >= 0:
+            grupos[etiqueta].append(indice)
+    return [np.array(indices) for indices in grupos.values()], x, y
+
+
+def crear_hotspot(puntos, indices, x, y):
+    cx, cy = x[indices].mean(), y[indices].mean()
+    radio = float(np.sqrt((x[indices] - cx) ** 2 + (y[indices] - cy) ** 2).max())
+    fechas = [puntos['fecha'][i] for i in indices]
+
+    hotspot = Hotspot(
+        latitud=Decimal(f"{puntos['lat'][indices].mean():.6f}"),
+        longitud=Decimal(f"{puntos['lon'][indices].mean():.6f}"),
+        radio_m=round(radio, 1),
+        total_reportes=len(indices),
+        graves=int(puntos['grave'][indices].sum()),
+        fecha_inicio=min(fechas),
+        fecha_fin=max(fechas),
+        celdas=sorted(set(puntos['celda'][indices].tolist())),
+    )
+    return hotspot, puntos['id'][indices].tolist()
+
+
+def detectar(reportes, radio, minimo, celdas=None):
+    """Hotspots nuevos y ids de los existentes que reemplazan.
+
+    Con `celdas=None` se recalcula todo. Si no, se parte de esas celdas y la
+    región crece hasta contener por completo cada grupo que las toca y cada
+    hotspot existente que se superpone con ella.
+    """
+    existentes = {pk: set(c) for pk, c in Hotspot.objects.values_list('id', 'celdas')}
+
+    if celdas is None:
+        puntos = cargar_puntos(reportes)
+        grupos, x, y = agrupar_puntos(puntos, radio, minimo)
+        return [crear_hotspot(puntos, g, x, y) for g in grupos], list(existentes)
+
+    region = set(celdas)
+    while True:
+        creciendo = True
+        while creciendo:
+            tamano = len(region)
+            for c in existentes.values():
+                if c & region:
+                    region |= c
+            creciendo = len(region) > tamano
+
+        # Con dos anillos, los puntos del primero tienen su vecindad completa y
+        # su condición de núcleo es correcta.
+        zona = vecindad_celdas(region, 2 * anillo_celdas(radio, region))
+        puntos = cargar_puntos(reportes, zona)
+        grupos, x, y = agrupar_puntos(puntos, radio, minimo)
+
+        en_region = np.isin(puntos['celda'], list(region))
+        grupos = [g for g in grupos if en_region[g].any()]
+
+        faltantes = set()
+        for g in grupos:
+            faltantes |= set(puntos['celda'][g].tolist()) - region
+        if not faltantes:
+            break
+        region |= faltantes
+
+    reemplazados = [pk for pk, c in existentes.items() if c & region]
+    return [crear_hotspot(puntos, g, x, y) for g in grupos], reemplazados
+
+
+def celdas_modificadas(ejecucion, ventana_desde):
+    """Celdas con reportes que cambiaron desde la última pasada o que salieron de la ventana."""
+    celdas = set(
+        NuevoReporte.objects.filter(fecha_actualizacion__gt=ejecucion.marca, celda_geo__isnull=False)
+        .values_list('celda_geo', flat=True)
+    )
+    celdas |= set(
+        NuevoReporte.objects.filter(
+            estado='aprobado',
+            fecha__gte=ejecucion.ventana_desde,
+            fecha__lt=ventana_desde,
+            celda_geo__isnull=False,
+        ).values_list('celda_geo', flat=True)
+    )
+
+    # Hotspots con reportes movidos o borrados: sus celdas antiguas también cambian.
+    afectados = set(
+        Hotspot.objects.filter(reportes__fecha_actualizacion__gt=ejecucion.marca).values_list('id', flat=True)
+    )
+    afectados |= set(
+        Hotspot.objects.annotate(vigentes=Count('reportes'))
+        .filter(vigentes__lt=F('total_reportes'))
+        .values_list('id', flat=True)
+    )
+    for c in Hotspot.objects.filter(id__in=afectados).values_list('celdas', flat=True):
+        celdas |= set(c)
+
+    return celdas
+
+
+def actualizar_hotspots(radio=RADIO_M, minimo=MINIMO_REPORTES, dias=DIAS, completo=False):
+    """Ejecuta una pasada de detección y devuelve (creados, eliminados, celdas revisadas).
+
+    Es incremental salvo que se pida `completo` o cambien los parámetros.
+    """
+    ahora = timezone.now()
+    hoy = timezone.localdate()
+    ventana_desde = hoy - timedelta(days=dias)
+
+    reportes = NuevoReporte.objects.filter(
+        estado='aprobado',
+        fecha__gte=ventana_desde,
+        fecha__lte=hoy,
+        celda_geo__isnull=False,
+    ).order_by()
+
+    with transaction.atomic():
+        ejecucion = EjecucionHotspots.objects.select_for_update().first()
+        mismos_parametros = ejecucion is not None and (
+            (ejecucion.radio_m, ejecucion.minimo_reportes, ejecucion.dias) == (radio, minimo, dias)
+        )
+
+        celdas = None
+        if mismos_parametros and not completo:
+            celdas = celdas_modificadas(ejecucion, ventana_desde)
+
+        creados, eliminados = [], []
+        if celdas is None or celdas:
+            creados, eliminados = detectar(reportes, radio, minimo, celdas)
+
+            Hotspot.objects.filter(id__in=eliminados).delete()
+            Hotspot.objects.bulk_create([h for h, _ in creados])
+            Hotspot.reportes.through.objects.bulk_create([
+                Hotspot.reportes.through(hotspot_id=hotspot.id, nuevoreporte_id=reporte_id)
+                for hotspot, ids in creados
+                for reporte_id in ids
+            ])
+
+        if ejecucion is None:
+            ejecucion = EjecucionHotspots()
+        ejecucion.radio_m = radio
+        ejecucion.minimo_reportes = minimo
+        ejecucion.dias = dias
+        ejecucion.ventana_desde = ventana_desde
+        ejecucion.marca = ahora
+        ejecucion.save()
+
+    revisadas = None if celdas is None else len(celdas)
+    return len(creados), len(eliminados), revisadas
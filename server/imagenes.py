@@ -0,0 +1,108 @@
+"""Normalización de las fotos subidas con Pillow.
+
+Cada foto se decodifica, se endereza según su orientación EXIF, se reduce a
+MAX_LADO píxeles y se vuelve a codificar sin metadatos (el EXIF puede traer
+la ubicación de quien reporta). Además se generan tamaños fijos para los
+listados, así ninguna vista carga el original para mostrarlo en chico, y
+los hashes perceptuales con que se buscan fotos repetidas (server/duplicados.py).
+"""
+
+from pathlib import Path
+
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+from .models import MINIATURA_ALTO, MINIATURA_ANCHO
+
+MAX_LADO = 1920
+CALIDAD = 82
+FORMATO, EXTENSION = ('WEBP', '.webp') if features.check('webp') else ('JPEG', '.jpg')
+
+# campo de Foto -> (ancho, alto, recortar). Sin recorte la imagen entra completa en la caja.
+TAMANOS = {
+    'miniatura': (MINIATURA_ANCHO, MINIATURA_ALTO, True),
+    'vista_previa': (1024, 1024, False),
+}
+
+
+class ImagenInvalida(Exception):
+    """El archivo no es una imagen que Pillow pueda decodificar."""
+
+
+def abrir(ruta):
+    try:
+        imagen = Image.open(ruta)
+        imagen.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as e:
+        raise ImagenInvalida(f'No es una imagen válida: {e}') from e
+    return imagen
+
+
+def normalizar(imagen):
+    """Imagen enderezada, en RGB (o RGBA si tiene transparencia) y de a lo sumo MAX_LADO píxeles."""
+    imagen = ImageOps.exif_transpose(imagen)
+    transparente = imagen.mode in ('RGBA', 'LA') or (imagen.mode == 'P' and 'transparency' in imagen.info)
+    modo = 'RGBA' if transparente and FORMATO == 'WEBP' else 'RGB'
+    if imagen.mode != modo:
+        imagen = imagen.convert(modo)
+    imagen.thumbnail((MAX_LADO, MAX_LADO), Image.Resampling.LANCZOS)
+    return imagen
+
+
+def reducir(imagen, ancho, alto, recortar):
+    if recortar:
+        return ImageOps.fit(imagen, (ancho, alto), Image.Resampling.LANCZOS)
+    copia = imagen.copy()
+    copia.thumbnail((ancho, alto), Image.Resampling.LANCZOS)
+    return copia
+
+
+def dhash(imagen):
+    """Hash de diferencias de 64 bits, en hexadecimal: cada bit dice si un píxel
+    es más claro que su vecino de la derecha en una versión gris de 9x8."""
+    gris = imagen.convert('L').resize((9, 8), Image.Resampling.LANCZOS)
+    pixeles = list(gris.getdata())
+    valor = 0
+    for fila in range(8):
+        for columna in range(8):
+            izquierda = pixeles[fila * 9 + columna]
+            valor = (valor << 1) | (izquierda > pixeles[fila * 9 + columna + 1])
+    return f'{valor:016x}'
+
+
+def ahash(imagen):
+    """Hash promedio de 64 bits: cada bit dice si el píxel de una versión gris de
+    8x8 supera el promedio."""
+    pixeles = list(imagen.convert('L').resize((8, 8), Image.Resampling.LANCZOS).getdata())
+    promedio = sum(pixeles) / len(pixeles)
+    valor = 0
+    for pixel in pixeles:
+        valor = (valor << 1) | (pixel > promedio)
+    return f'{valor:016x}'
+
+
+def guardar(imagen, ruta):
+    # Sin `exif` ni `icc_profile`: el archivo sale sin metadatos.
+    opciones = {'quality': CALIDAD, 'optimize': True}
+    if FORMATO == 'WEBP':
+        opciones['method'] = 4
+    imagen.save(ruta, FORMATO, **opciones)
+
+
+def procesar_imagen(ruta):
+    """Genera junto a `ruta` la imagen normalizada y sus tamaños fijos.
+
+    Devuelve {'archivo': Path, <campo de TAMANOS>: Path, ..., 'ancho': int, 'alto': int,
+    'dhash': str, 'ahash': str}.
+    Lanza ImagenInvalida si no se puede decodificar.
+    """
+    ruta = Path(ruta)
+    with abrir(ruta) as original:
+        imagen = normalizar(original)
+
+    resultado = {'ancho': imagen.width, 'alto': imagen.height, 'dhash': dhash(imagen), 'ahash': ahash(imagen)}
+    resultado['archivo'] = ruta.with_name(f'{ruta.stem}.normal{EXTENSION}')
+    guardar(imagen, resultado['archivo'])
+    for campo, (ancho, alto, recortar) in TAMANOS.items():
+        resultado[campo] = ruta.with_name(f'{ruta.stem}.{campo}{EXTENSION}')
+        guardar(reducir(imagen, ancho, alto, recortar), resultado[campo])
+    return resultado
@@ -0,0 +1,120 @@
+"""Agrupación de reportes del mismo incidente.
+
+Varios vecinos suelen reportar el mismo ataque. Al recibir un reporte se
+buscan reportes cercanos (INCIDENTES_RADIO_METROS, con el índice de celdas de
+`dentro_de_radio`) y cercanos en el tiempo (INCIDENTES_VENTANA según fecha y
+hora). Si hay uno, el nuevo queda enlazado con `duplicado_de` al reporte
+principal del incidente. Los enlazados no cuentan en las estadísticas y el
+incidente completo se modera con una sola acción. Si el principal se rechaza
+o se borra, el incidente pasa a uno de sus enlazados.
+"""
+
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from . import estadisticas, moderacion
+from .models import NuevoReporte
+
+
+def radio_metros():
+    return settings.INCIDENTES_RADIO_METROS
+
+
+def ventana():
+    return timedelta(minutes=settings.INCIDENTES_VENTANA_MINUTOS)
+
+
+def separacion(fecha, hora, otra_fecha, otra_hora):
+    """Tiempo entre dos reportes, o None si alguno no tiene hora y son de días distintos."""
+    if hora is None or otra_hora is None:
+        return timedelta(0) if fecha == otra_fecha else None
+    return abs(datetime.combine(fecha, hora) - datetime.combine(otra_fecha, otra_hora))
+
+
+def buscar_principal(reporte):
+    """Reporte principal del incidente al que pertenece `reporte` (todavía sin guardar), o None."""
+    if reporte.latitud is None or reporte.longitud is None or not reporte.fecha:
+        return None
+
+    # La ventana puede cruzar la medianoche: se buscan los días que abarca.
+    dias = timedelta(days=ventana().days + 1)
+    candidatos = (
+        NuevoReporte.objects.dentro_de_radio(reporte.latitud, reporte.longitud, radio_metros())
+        .filter(fecha__range=(reporte.fecha - dias, reporte.fecha + dias))
+        .exclude(estado='rechazado')
+        .exclude(pk=reporte.pk)
+        .order_by()
+        .values_list('id', 'fecha', 'hora', 'duplicado_de_id', 'distancia_m')
+    )
+
+    mejor = None
+    for pk, fecha, hora, principal, distancia in candidatos:
+        tiempo = separacion(reporte.fecha, reporte.hora, fecha, hora)
+        if tiempo is None or tiempo > ventana():
+            continue
+        if mejor is None or (tiempo, distancia) < mejor[:2]:
+            mejor = (tiempo, distancia, principal or pk)
+    if mejor is None:
+        return None
+    return NuevoReporte(pk=mejor[2])
+
+
+def ids_incidente(reporte_id):
+    """Ids del incidente de `reporte_id`: su principal y todos los enlazados a él."""
+    principal = (
+        NuevoReporte.objects.filter(pk=reporte_id).values_list('duplicado_de_id', flat=True).first()
+        or reporte_id
+    )
+    return list(
+        NuevoReporte.objects.filter(Q(pk=principal) | Q(duplicado_de=principal))
+        .order_by('id').values_list('id', flat=True)
+    )
+
+
+def moderar_incidente(reporte_id, decision, moderador, motivo=None):
+    """Aprueba o rechaza de una vez los reportes pendientes del incidente de `reporte_id`."""
+    return moderacion.moderar_reportes(ids_incidente(reporte_id), decision, moderador, motivo)
+
+
+def separar(reporte):
+    """Saca `reporte` de su incidente; vuelve a contar en las estadísticas."""
+    if reporte.duplicado_de_id is None:
+        return False
+    reporte.duplicado_de = None
+    reporte.save(update_fields=['duplicado_de'])
+    return True
+
+
+def promover_principal(reporte):
+    """Pasa el incidente de `reporte`, que deja de ser su principal, al enlazado más antiguo.
+
+    Se prefiere un enlazado no rechazado, igual que en `buscar_principal`.
+    Devuelve el nuevo principal, o None si `reporte` no tenía enlazados.
+    """
+    enlazados = list(reporte.duplicados.order_by('id').values_list('id', 'estado'))
+    if not enlazados:
+        return None
+    nuevo = next((pk for pk, estado in enlazados if estado != 'rechazado'), enlazados[0][0])
+    with transaction.atomic():
+        NuevoReporte.objects.filter(duplicado_de=reporte.pk).exclude(pk=nuevo).update(duplicado_de=nuevo)
+        NuevoReporte.objects.filter(pk=nuevo).update(duplicado_de=None)
+        # El nuevo principal empieza a contar en las estadísticas.
+        estadisticas.mover(None, estadisticas.clave_guardada(nuevo))
+    return nuevo
+
+
+def reasignar_rechazados(ids):
+    """Los principales rechazados entre `ids` dejan su incidente al enlazado más antiguo sin rechazar.
+
+    Sin esto los enlazados aprobados o pendientes no se contarían en ningún lado.
+    """
+    principales = (
+        NuevoReporte.objects.filter(duplicado_de__in=ids, duplicado_de__estado='rechazado')
+        .exclude(estado='rechazado')
+        .values_list('duplicado_de', flat=True)
+        .distinct()
+    )
+    return [promover_principal(NuevoReporte(pk=pk)) for pk in list(principales)]
@@ -0,0 +1,127 @@
+import random
+import statistics
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from server.geo import VALDIVIA_CENTRO, celda_indice, distancia_metros
+from server.models import NuevoReporte
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara consultas por bbox y radio con y sin el índice espacial sobre datos sintéticos. '
+        'Los reportes se crean dentro de una transacción que se revierte al terminar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=1_000_000)
+        parser.add_argument('--consultas', type=int, default=50)
+        parser.add_argument('--consultas-escaneo', type=int, default=3,
+                            help='Consultas de radio sin índice (recorren toda la tabla en Python).')
+        parser.add_argument('--radio', type=float, default=500.0, help='Radio en metros.')
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['semilla'])
+
+        with transaction.atomic():
+            self.poblar(options['filas'])
+            self.medir(options)
+            transaction.set_rollback(True)
+
+        self.stdout.write('Datos sintéticos revertidos.')
+
+    def punto_aleatorio(self):
+        lat0, lon0 = VALDIVIA_CENTRO
+        return lat0 + self.rng.uniform(-0.15, 0.15), lon0 + self.rng.uniform(-0.15, 0.15)
+
+    def poblar(self, filas):
+        self.stdout.write(f'Creando {filas} reportes sintéticos...')
+        inicio = time.perf_counter()
+        hoy = date.today()
+        lote = []
+
+        for i in range(filas):
+            lat, lon = self.punto_aleatorio()
+            lat, lon = Decimal(f'{lat:.6f}'), Decimal(f'{lon:.6f}')
+            lote.append(NuevoReporte(
+                titulo=f'Benchmark {i}',
+                fecha=hoy - timedelta(days=self.rng.randint(0, 730)),
+                tipo_animal='perro',
+                gravedad=self.rng.choice(['leve', 'moderado', 'grave']),
+                descripcion='Reporte sintético',
+                direccion='Sin dirección',
+                latitud=lat,
+                longitud=lon,
+                estado='aprobado',
+                celda_geo=celda_indice(lat, lon),
+            ))
+            if len(lote) >= 5000:
+                NuevoReporte.objects.bulk_create(lote)
+                lote = []
+
+        if lote:
+            NuevoReporte.objects.bulk_create(lote)
+
+        self.stdout.write(f'  listo en {time.perf_counter() - inicio:.1f}s')
+
+    def cronometrar(self, consultas, funcion):
+        tiempos, resultados = [], []
+        for args in consultas:
+            inicio = time.perf_counter()
+            resultados.append(funcion(*args))
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        return statistics.median(tiempos), resultados
+
+    def informar(self, nombre, mediana_sin, mediana_con):
+        self.stdout.write(
+            f'{nombre}: sin índice {mediana_sin:.1f} ms, con índice {mediana_con:.1f} ms '
+            f'(x{mediana_sin / max(mediana_con, 0.001):.0f})'
+        )
+
+    def medir(self, options):
+        bboxes = []
+        for _ in range(options['consultas']):
+            lat, lon = self.punto_aleatorio()
+            bboxes.append(((lon - 0.01, lat - 0.01, lon + 0.01, lat + 0.01),))
+
+        def bbox_sin_indice(bbox):
+            oeste, sur, este, norte = bbox
+            return NuevoReporte.objects.filter(
+                latitud__gte=sur, latitud__lte=norte, longitud__gte=oeste, longitud__lte=este,
+            ).count()
+
+        def bbox_con_indice(bbox):
+            return NuevoReporte.objects.dentro_de_bbox(bbox).count()
+
+        sin, conteos_sin = self.cronometrar(bboxes, bbox_sin_indice)
+        con, conteos_con = self.cronometrar(bboxes, bbox_con_indice)
+        self.informar('bbox ~2 km', sin, con)
+        if conteos_sin != conteos_con:
+            self.stderr.write('  ¡Los conteos por bbox no coinciden!')
+
+        radio = options['radio']
+        centros = [self.punto_aleatorio() + (radio,) for _ in range(options['consultas'])]
+
+        def radio_sin_indice(lat, lon, metros):
+            return sum(
+                1 for la, lo in NuevoReporte.objects.values_list('latitud', 'longitud').iterator(chunk_size=5000)
+                if distancia_metros(lat, lon, float(la), float(lo)) <= metros
+            )
+
+        def radio_con_indice(lat, lon, metros):
+            return NuevoReporte.objects.dentro_de_radio(lat, lon, metros).count()
+
+        escaneo = centros[:options['consultas_escaneo']]
+        sin, conteos_sin = self.cronometrar(escaneo, radio_sin_indice)
+        con, conteos_con = self.cronometrar(centros, radio_con_indice)
+        self.informar(f'radio {radio:.0f} m', sin, con)
+
+        # La proyección local puede diferir de haversine en puntos justo en el borde.
+        diferencias = [abs(a - b) for a, b in zip(conteos_sin, conteos_con)]
+        if diferencias and max(diferencias) > 1:
+            self.stderr.write(f'  Diferencia máxima en conteos por radio: {max(diferencias)}')
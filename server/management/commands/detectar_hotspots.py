@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from server.hotspots import DIAS, MINIMO_REPORTES, RADIO_M, actualizar_hotspots
+
+
+class Command(BaseCommand):
+    help = (
+        'Detecta hotspots de ataques aprobados (grupos dentro de --radio metros en los últimos --dias). '
+        'Pensado para ejecutarse periódicamente; cada pasada revisa solo las zonas con cambios.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--radio', type=float, default=RADIO_M, help='Radio de vecindad en metros.')
+        parser.add_argument('--minimo', type=int, default=MINIMO_REPORTES,
+                            help='Reportes mínimos dentro del radio para formar un hotspot.')
+        parser.add_argument('--dias', type=int, default=DIAS, help='Ventana de tiempo en días.')
+        parser.add_argument('--completo', action='store_true',
+                            help='Recalcula todos los hotspots en vez de solo las zonas modificadas.')
+
+    def handle(self, *args, **options):
+        creados, eliminados, revisadas = actualizar_hotspots(
+            radio=options['radio'],
+            minimo=options['minimo'],
+            dias=options['dias'],
+            completo=options['completo'],
+        )
+
+        alcance = 'detección completa' if revisadas is None else f'{revisadas} celda(s) modificada(s)'
+        self.stdout.write(self.style.SUCCESS(
+            f'{creados} hotspot(s) creado(s), {eliminados} reemplazado(s) ({alcance}).'
+        ))
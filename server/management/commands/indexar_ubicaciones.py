@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from server.geo import celda_indice
+from server.models import NuevoReporte
+
+
+class Command(BaseCommand):
+    help = 'Recalcula la celda del índice espacial (celda_geo) de los reportes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todos', action='store_true',
+                            help='Recalcula todos los reportes, no solo los que no tienen celda.')
+        parser.add_argument('--lote', type=int, default=2000,
+                            help='Cantidad de reportes por actualización.')
+
+    def handle(self, *args, **options):
+        reportes = NuevoReporte.objects.only('id', 'latitud', 'longitud', 'celda_geo').order_by('id')
+        if not options['todos']:
+            reportes = reportes.filter(celda_geo__isnull=True)
+
+        lote = options['lote']
+        pendientes = []
+        total = 0
+
+        for reporte in reportes.iterator(chunk_size=lote):
+            if reporte.latitud is None or reporte.longitud is None:
+                continue
+
+            celda = celda_indice(reporte.latitud, reporte.longitud)
+            if celda == reporte.celda_geo:
+                continue
+
+            reporte.celda_geo = celda
+            pendientes.append(reporte)
+
+            if len(pendientes) >= lote:
+                NuevoReporte.objects.bulk_update(pendientes, ['celda_geo'])
+                total += len(pendientes)
+                pendientes = []
+
+        if pendientes:
+            NuevoReporte.objects.bulk_update(pendientes, ['celda_geo'])
+            total += len(pendientes)
+
+        self.stdout.write(self.style.SUCCESS(f'{total} reporte(s) indexado(s).'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from server.calor import BANDAS_ZOOM, capa_calor
+from server.mapa import PERIODOS_DIAS, version_mapa
+from server.models import NuevoReporte
+
+
+class Command(BaseCommand):
+    help = 'Calcula por adelantado la capa de calor para cada banda de zoom y período.'
+
+    def handle(self, *args, **options):
+        reportes = NuevoReporte.objects.filter(estado='aprobado')
+        version = version_mapa()
+        periodos = ['all', *PERIODOS_DIAS, 'year']
+
+        for zoom, nombre, _, _ in BANDAS_ZOOM:
+            for periodo in periodos:
+                for ponderar in ('0', '1'):
+                    capa_calor(reportes, zoom, {'periodo': periodo, 'ponderar': ponderar}, version)
+            self.stdout.write(f'Banda {nombre} lista.')
+
+        self.stdout.write(self.style.SUCCESS('Capa de calor precalculada.'))
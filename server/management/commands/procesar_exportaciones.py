@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from server.exportacion import generar_exportacion, limpiar_exportaciones, tomar_exportacion
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera los archivos de las exportaciones pendientes (ExportacionJob). '
+        'Se pueden correr varios workers a la vez; cada trabajo lo toma uno solo.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--continuo', action='store_true',
+                            help='Seguir esperando trabajos nuevos en vez de terminar al vaciar la cola.')
+        parser.add_argument('--intervalo', type=float, default=2.0,
+                            help='Segundos entre consultas a la cola en modo continuo.')
+
+    def handle(self, *args, **options):
+        procesados = 0
+        while True:
+            trabajo = tomar_exportacion()
+            if trabajo is None:
+                borrados = limpiar_exportaciones()
+                if borrados:
+                    self.stdout.write(f'{borrados} exportación(es) vencida(s) eliminada(s).')
+                if not options['continuo']:
+                    break
+                time.sleep(options['intervalo'])
+                continue
+
+            try:
+                generar_exportacion(trabajo)
+            except Exception as e:
+                self.stderr.write(f'Exportación #{trabajo.id} falló: {e}')
+            else:
+                procesados += 1
+                self.stdout.write(f'Exportación #{trabajo.id}: {trabajo.filas} reporte(s), {trabajo.tamano} bytes.')
+
+        self.stdout.write(self.style.SUCCESS(f'{procesados} exportación(es) generada(s).'))
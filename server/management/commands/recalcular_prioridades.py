@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from server.models import NuevoReporte
+from server.prioridad import recalcular
+
+
+class Command(BaseCommand):
+    help = 'Recalcula la prioridad de moderación de los reportes (por defecto solo los pendientes).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todos', action='store_true',
+                            help='Recalcular también los reportes ya moderados.')
+        parser.add_argument('--lote', type=int, default=2000,
+                            help='Cantidad de filas por actualización.')
+
+    def handle(self, *args, **options):
+        reportes = NuevoReporte.objects.all()
+        if not options['todos']:
+            reportes = reportes.filter(estado='pendiente')
+        total = recalcular(reportes, lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'Prioridad recalculada para {total} reporte(s).'))
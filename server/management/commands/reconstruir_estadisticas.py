@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from server.estadisticas import reconstruir
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde cero la tabla resumen de estadísticas (EstadisticaReporte).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=2000,
+                            help='Cantidad de filas por inserción.')
+
+    def handle(self, *args, **options):
+        total = reconstruir(lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'{total} fila(s) de estadísticas generada(s).'))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from server.fotos import HILOS_SUBIDA, LOTE_SUBIDA, procesar_fotos
+from server.subidas import limpiar_subidas
+
+
+class Command(BaseCommand):
+    help = (
+        'Sube al almacenamiento las fotos que los reportes dejaron en espera. '
+        'Las que fallan se reintentan con espera creciente. También borra las '
+        'subidas por partes abandonadas.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=HILOS_SUBIDA,
+                            help='Subidas simultáneas.')
+        parser.add_argument('--lote', type=int, default=LOTE_SUBIDA,
+                            help='Fotos que se toman de la cola por vez.')
+        parser.add_argument('--continuo', action='store_true',
+                            help='Seguir esperando fotos nuevas en vez de terminar al vaciar la cola.')
+        parser.add_argument('--intervalo', type=float, default=2.0,
+                            help='Segundos entre consultas a la cola en modo continuo.')
+
+    def handle(self, *args, **options):
+        total = {'lista': 0, 'reutilizada': 0, 'reintento': 0, 'error': 0}
+        while True:
+            conteo = procesar_fotos(hilos=options['hilos'], lote=options['lote'])
+            for clave, cantidad in conteo.items():
+                total[clave] += cantidad
+
+            if not any(conteo.values()):
+                borradas = limpiar_subidas()
+                if borradas:
+                    self.stdout.write(f'{borradas} subida(s) por partes abandonada(s) eliminada(s).')
+                if not options['continuo']:
+                    break
+                time.sleep(options['intervalo'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{total['lista']} foto(s) subida(s), {total['reutilizada']} repetida(s) sin volver a subir, "
+            f"{total['reintento']} para reintentar, {total['error']} con error."
+        ))
@@ -0,0 +1,437 @@
+"""Construcción de las respuestas JSON del mapa público."""
+
+import gzip
+import hashlib
+import json
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.db.models import (
+    Avg, Case, Count, FloatField, IntegerField, Max, OuterRef, Prefetch, Q, Subquery, Value, When,
+)
+from django.db.models.functions import Cast, Coalesce, Floor
+from django.utils import timezone
+
+from .almacenamiento import almacenamiento
+from .models import Foto, NuevoReporte
+from .geo import ZOOM_MAXIMO, ZOOM_PUNTOS, tamano_celda, tile_bbox, tile_de_punto
+
+RANGO_GRAVEDAD = {'leve': 1, 'moderado': 2, 'grave': 3}
+GRAVEDAD_POR_RANGO = {rango: gravedad for gravedad, rango in RANGO_GRAVEDAD.items()}
+
+PERIODOS_DIAS = {'7d': 7, '30d': 30, '3m': 90, '6m': 180}
+
+# Tope de puntos individuales por respuesta, aun con zoom alto.
+MAX_PUNTOS = 2000
+
+# Columnas de la respuesta completa del mapa; las de CODIGOS_MAPA viajan como índices.
+CAMPOS_MAPA = (
+    'id', 'titulo', 'descripcion', 'tipo_animal', 'cantidad_perros', 'gravedad',
+    'hora', 'sector', 'fecha', 'lat', 'lon', 'direccion', 'foto',
+)
+CODIGOS_MAPA = {
+    'tipo_animal': [codigo for codigo, _ in NuevoReporte.TIPO_ANIMAL_CHOICES],
+    'gravedad': [codigo for codigo, _ in NuevoReporte.GRAVEDAD_CHOICES],
+    'sector': [codigo for codigo, _ in NuevoReporte.SECTOR_CHOICES],
+}
+SECTOR_NOMBRES = dict(NuevoReporte.SECTOR_CHOICES)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+# Cursor más grande que se acepta: un valor mayor no cabe en un datetime.
+MAX_CURSOR = (datetime.max.replace(tzinfo=dt_timezone.utc) - EPOCH) // timedelta(microseconds=1)
+# Margen de solapamiento de `?since=` para cambios confirmados con un timestamp anterior.
+MARGEN_DELTA = timedelta(seconds=5)
+
+# Reportes que muestra el mapa de la página de inicio.
+LIMITE_RECIENTES = 100
+
+# Los tiles se guardan en caché hasta que un cambio de moderación los invalida.
+TILE_TIMEOUT = 60 * 60 * 24
+TILE_MAX_AGE = 60 * 10
+TILE_STALE_WHILE_REVALIDATE = 60 * 60 * 24
+
+
+def filtros_mapa(params):
+    """Filtros válidos del panel lateral del mapa (gravedad, sector y período)."""
+    filtros = {}
+
+    gravedad = params.get('gravedad')
+    if gravedad in RANGO_GRAVEDAD:
+        filtros['gravedad'] = gravedad
+
+    sector = params.get('sector')
+    if sector and sector != 'all':
+        filtros['sector'] = sector
+
+    periodo = params.get('periodo')
+    if periodo in PERIODOS_DIAS or periodo == 'year':
+        filtros['periodo'] = periodo
+
+    return filtros
+
+
+def filtrar_reportes_mapa(reportes, params):
+    """Aplica los filtros del panel lateral del mapa (gravedad, sector y período)."""
+    filtros = filtros_mapa(params)
+
+    if 'gravedad' in filtros:
+        reportes = reportes.filter(gravedad=filtros['gravedad'])
+
+    if 'sector' in filtros:
+        reportes = reportes.filter(sector=filtros['sector'])
+
+    periodo = filtros.get('periodo')
+    hoy = timezone.localdate()
+    if periodo in PERIODOS_DIAS:
+        reportes = reportes.filter(fecha__gte=hoy - timedelta(days=PERIODOS_DIAS[periodo]))
+    elif periodo == 'year':
+        reportes = reportes.filter(fecha__year=hoy.year)
+
+    return reportes
+
+
+def agrupar_reportes(reportes, zoom):
+    """Agrupa los reportes en una grilla dependiente del zoom, directamente en la base de datos."""
+    celda = tamano_celda(zoom)
+    lat = Cast('latitud', FloatField())
+    lon = Cast('longitud', FloatField())
+
+    grupos = (
+        reportes
+        .annotate(
+            fila=Floor(lat / celda),
+            columna=Floor(lon / celda),
+            rango=Case(
+                *[When(gravedad=g, then=Value(r)) for g, r in RANGO_GRAVEDAD.items()],
+                default=Value(1),
+                output_field=IntegerField(),
+            ),
+        )
+        .values('fila', 'columna')
+        .annotate(total=Count('id'), lat=Avg(lat), lon=Avg(lon), peor=Max('rango'))
+        .order_by()
+    )
+
+    return [
+        {
+            'lat': round(g['lat'], 6),
+            'lon': round(g['lon'], 6),
+            'total': g['total'],
+            'gravedad': GRAVEDAD_POR_RANGO.get(g['peor'], 'leve'),
+        }
+        for g in grupos
+    ]
+
+
+def serializar_punto(r):
+    fotos = list(r.fotos.all())
+    return {
+        'id': r.id,
+        'titulo': r.titulo,
+        'descripcion': r.descripcion,
+        'tipo_animal': r.tipo_animal,
+        'cantidad_perros': r.cantidad_perros,
+        'gravedad': r.gravedad,
+        'hora': r.hora.strftime('%H:%M') if r.hora else '',
+        'sector': r.get_sector_display() if r.sector else 'Sin sector',
+        'fecha': r.fecha.strftime('%d/%m/%Y'),
+        'lat': float(r.latitud),
+        'lon': float(r.longitud),
+        'direccion': r.direccion,
+        'foto': fotos[0].url_miniatura() if fotos else '',
+    }
+
+
+def datos_viewport(reportes, bbox, zoom):
+    """Clusters por debajo de ZOOM_PUNTOS y puntos individuales (acotados) desde ese zoom."""
+    reportes = reportes.dentro_de_bbox(bbox)
+
+    if zoom < ZOOM_PUNTOS:
+        return {'modo': 'clusters', 'zoom': zoom, 'items': agrupar_reportes(reportes, zoom)}
+
+    puntos = list(
+        reportes.prefetch_related(Prefetch('fotos', queryset=Foto.objects.filter(estado_subida='lista')))
+        .order_by('-fecha', '-id')[:MAX_PUNTOS + 1]
+    )
+    return {
+        'modo': 'puntos',
+        'zoom': zoom,
+        'truncado': len(puntos) > MAX_PUNTOS,
+        'items': [serializar_punto(r) for r in puntos[:MAX_PUNTOS]],
+    }
+
+
+def clave_version_tile(z, x, y):
+    return f'mapa:tile:version:{z}:{x}:{y}'
+
+
+def tile_geojson(reportes, z, x, y, params):
+    """GeoJSON del tile z/x/y como (cuerpo, etag), reutilizando la versión en caché si existe.
+
+    La clave incluye la versión del tile, que `invalidar_tiles` cambia cuando se
+    modera un reporte dentro de él, y los filtros del mapa. Los filtros por período
+    dependen del día, así que la fecha también forma parte de la clave.
+    """
+    filtros = filtros_mapa(params)
+    if 'periodo' in filtros:
+        filtros['hoy'] = timezone.localdate().isoformat()
+
+    clave_version = clave_version_tile(z, x, y)
+    version = cache.get(clave_version)
+    if version is None:
+        # Sin versión registrada (o descartada por la caché) se parte de una nueva,
+        # para no reutilizar cuerpos guardados bajo una versión anterior.
+        cache.add(clave_version, time.time_ns(), None)
+        version = cache.get(clave_version)
+    clave = 'mapa:tile:{}:{}:{}:{}:{}'.format(
+        z, x, y, version, ','.join(f'{k}={v}' for k, v in sorted(filtros.items()))
+    )
+
+    entrada = cache.get(clave)
+    if entrada is None:
+        reportes = filtrar_reportes_mapa(reportes, params)
+        datos = datos_viewport(reportes, tile_bbox(z, x, y), z)
+
+        features = []
+        for item in datos['items']:
+            propiedades = dict(item)
+            lon, lat = propiedades.pop('lon'), propiedades.pop('lat')
+            if datos['modo'] == 'clusters':
+                propiedades['cluster'] = True
+            features.append({
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+                'properties': propiedades,
+            })
+
+        cuerpo = json.dumps(
+            {'type': 'FeatureCollection', 'features': features},
+            ensure_ascii=False,
+            separators=(',', ':'),
+        ).encode('utf-8')
+        entrada = (cuerpo, '"%s"' % hashlib.sha1(cuerpo).hexdigest())
+        cache.set(clave, entrada, TILE_TIMEOUT)
+
+    return entrada
+
+
+def invalidar_tiles(coordenadas):
+    """Invalida, en todos los zoom, los tiles que contienen las coordenadas (lat, lon) dadas."""
+    version = time.time_ns()
+    claves = {}
+    for lat, lon in coordenadas:
+        if lat is None or lon is None:
+            continue
+        for z in range(ZOOM_MAXIMO + 1):
+            x, y = tile_de_punto(lat, lon, z)
+            claves[clave_version_tile(z, x, y)] = version
+
+    if claves:
+        cache.set_many(claves, None)
+
+
+def primera_foto():
+    """Subconsulta con la miniatura de la primera foto (según `orden`) de cada reporte.
+
+    Las fotos anteriores a las miniaturas guardadas caen al archivo original.
+    """
+    return Subquery(
+        Foto.objects.filter(reporte=OuterRef('pk'), estado_subida='lista')
+        .order_by('orden', '-subida_en')
+        .values(archivo_listado=Coalesce('miniatura', 'archivo'))[:1]
+    )
+
+
+def url_foto(archivo):
+    """URL pública a partir del valor guardado en `Foto.archivo`, sin consultar Cloudinary."""
+    if not archivo:
+        return ''
+    return almacenamiento().url(Foto._meta.get_field('archivo').to_python(archivo))
+
+
+def filas_mapa(reportes):
+    """Filas planas del mapa con la URL de la primera foto, en una sola consulta."""
+    filas = (
+        reportes
+        .annotate(foto_archivo=primera_foto())
+        .values(
+            'id', 'titulo', 'descripcion', 'tipo_animal', 'cantidad_perros', 'gravedad',
+            'hora', 'sector', 'fecha', 'latitud', 'longitud', 'direccion', 'foto_archivo',
+        )
+        .order_by('id')
+    )
+
+    for f in filas.iterator(chunk_size=2000):
+        f['foto'] = url_foto(f.pop('foto_archivo'))
+        f['lat'] = round(float(f.pop('latitud')), 6)
+        f['lon'] = round(float(f.pop('longitud')), 6)
+        yield f
+
+
+def lista_mapa(filas):
+    """Formato histórico: una lista de objetos, uno por reporte."""
+    return [
+        {
+            **f,
+            'hora': f['hora'].strftime('%H:%M') if f['hora'] else '',
+            'sector': SECTOR_NOMBRES.get(f['sector'], 'Sin sector') if f['sector'] else 'Sin sector',
+            'fecha': f['fecha'].strftime('%d/%m/%Y'),
+        }
+        for f in filas
+    ]
+
+
+def columnas_mapa(filas):
+    """Formato compacto: un arreglo paralelo por campo y códigos numéricos para los enums.
+
+    Los enums se envían como índice dentro de `codigos[campo]` (-1 si no hay valor).
+    """
+    indices = {
+        campo: {codigo: i for i, codigo in enumerate(codigos)}
+        for campo, codigos in CODIGOS_MAPA.items()
+    }
+    columnas = {campo: [] for campo in CAMPOS_MAPA}
+
+    for f in filas:
+        f['hora'] = f['hora'].strftime('%H:%M') if f['hora'] else ''
+        f['fecha'] = f['fecha'].isoformat()
+        for campo in CAMPOS_MAPA:
+            valor = f[campo]
+            if campo in indices:
+                valor = indices[campo].get(valor, -1)
+            columnas[campo].append(valor)
+
+    return {
+        'total': len(columnas['id']),
+        'codigos': CODIGOS_MAPA,
+        'sectores': SECTOR_NOMBRES,
+        'columnas': columnas,
+    }
+
+
+def version_mapa():
+    """Versión del conjunto de reportes del mapa: (último cambio, cantidad de aprobados)."""
+    datos = NuevoReporte.objects.aggregate(
+        ultima=Max('fecha_actualizacion'),
+        total=Count('id', filter=Q(estado='aprobado')),
+    )
+    return datos['ultima'], datos['total']
+
+
+def etag_mapa(version, *variantes):
+    ultima, total = version
+    base = ':'.join([ultima.isoformat() if ultima else '-', str(total), *map(str, variantes)])
+    return '"%s"' % hashlib.sha1(base.encode('utf-8')).hexdigest()
+
+
+def mapa_completo(reportes, formato, version):
+    """JSON completo del mapa como (cuerpo, cuerpo_gzip), ya codificado y cacheado por versión."""
+    clave = f'mapa:completo:{formato}:{etag_mapa(version)}'
+    entrada = cache.get(clave)
+
+    if entrada is None:
+        filas = filas_mapa(reportes)
+        datos = columnas_mapa(filas) if formato == 'columnar' else lista_mapa(filas)
+        cuerpo = json.dumps(datos, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        entrada = (cuerpo, gzip.compress(cuerpo, compresslevel=6, mtime=0))
+        cache.set(clave, entrada, TILE_TIMEOUT)
+
+    return entrada
+
+
+def acepta_gzip(cabecera):
+    """Si el cliente acepta gzip según Accept-Encoding, respetando `q=0` ("gzip;q=0" lo rechaza).
+
+    Una entrada explícita de gzip tiene prioridad sobre el comodín `*`.
+    """
+    calidades = {}
+    for entrada in cabecera.split(','):
+        codificacion, *parametros = [parte.strip() for parte in entrada.split(';')]
+        calidad = 1.0
+        for parametro in parametros:
+            nombre, _, valor = parametro.partition('=')
+            if nombre.strip().lower() == 'q':
+                try:
+                    calidad = float(valor)
+                except ValueError:
+                    calidad = 0.0
+        calidades[codificacion.lower()] = calidad
+    calidad = calidades.get('gzip', calidades.get('*', 0.0))
+    return calidad > 0
+
+
+def cursor_mapa(ultima):
+    """Cursor opaco para `?since=`: microsegundos desde epoch del último cambio."""
+    if ultima is None:
+        return '0'
+    return str((ultima - EPOCH) // timedelta(microseconds=1))
+
+
+def parsear_cursor(valor):
+    microsegundos = int(valor)
+    if not 0 <= microsegundos <= MAX_CURSOR:
+        raise ValueError('Cursor inválido.')
+    return EPOCH + timedelta(microseconds=microsegundos)
+
+
+def delta_mapa(reportes, desde, formato, version):
+    """Cambios desde el cursor: reportes aprobados nuevos o editados y bajas del mapa.
+
+    Las bajas (`eliminados`) son reportes ya moderados que no están aprobados, por
+    ejemplo rechazados después de su aprobación. Se consulta con un margen hacia
+    atrás para no perder transacciones confirmadas tarde; el cliente aplica los
+    cambios de forma idempotente y puede comparar `total` con su copia local para
+    detectar reportes borrados y pedir el conjunto completo.
+    """
+    desde = desde - MARGEN_DELTA
+
+    filas = filas_mapa(reportes.filter(fecha_actualizacion__gte=desde))
+    actualizados = columnas_mapa(filas) if formato == 'columnar' else lista_mapa(filas)
+
+    eliminados = list(
+        NuevoReporte.objects
+        .filter(fecha_actualizacion__gte=desde, fecha_moderacion__isnull=False)
+        .exclude(estado='aprobado')
+        .order_by('id')
+        .values_list('id', flat=True)
+    )
+
+    ultima, total = version
+    return {
+        'cursor': cursor_mapa(ultima),
+        'total': total,
+        'actualizados': actualizados,
+        'eliminados': eliminados,
+    }
+
+
+def recientes_mapa(reportes, version, limite=LIMITE_RECIENTES):
+    """Últimos reportes aprobados para el mapa de inicio, cacheados por versión de los datos."""
+    clave = f'mapa:recientes:{limite}:{etag_mapa(version)}'
+    datos = cache.get(clave)
+
+    if datos is None:
+        filas = (
+            reportes
+            .annotate(foto_archivo=primera_foto())
+            .order_by('-fecha_creacion')
+            .values('id', 'titulo', 'gravedad', 'sector', 'fecha', 'latitud', 'longitud', 'foto_archivo')
+            [:limite]
+        )
+        datos = [
+            {
+                'id': f['id'],
+                'titulo': f['titulo'],
+                'gravedad': f['gravedad'],
+                'sector': SECTOR_NOMBRES.get(f['sector'], 'Sin sector'),
+                'fecha': f['fecha'].strftime('%d/%m/%Y'),
+                'lat': round(float(f['latitud']), 6),
+                'lon': round(float(f['longitud']), 6),
+                'foto': url_foto(f['foto_archivo']),
+            }
+            for f in filas
+        ]
+        cache.set(clave, datos, TILE_TIMEOUT)
+
+    return datos
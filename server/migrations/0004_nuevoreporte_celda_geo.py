@@ -0,0 +1,47 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:13
+
+import math
+
+from django.db import migrations, models
+
+# Copia de server.geo al momento de esta migración: la grilla no debe cambiar
+# aunque cambie el código de la aplicación.
+CELDA_INDICE = 0.01
+COLUMNAS_INDICE = 36000
+
+
+def celda_indice(lat, lon):
+    fila = min(math.floor((float(lat) + 90.0) / CELDA_INDICE), int(180 / CELDA_INDICE) - 1)
+    columna = min(math.floor((float(lon) + 180.0) / CELDA_INDICE), COLUMNAS_INDICE - 1)
+    return fila * COLUMNAS_INDICE + columna
+
+
+def indexar_reportes(apps, schema_editor):
+    NuevoReporte = apps.get_model('server', 'NuevoReporte')
+    pendientes = []
+    for reporte in NuevoReporte.objects.only('id', 'latitud', 'longitud').iterator(chunk_size=2000):
+        if reporte.latitud is None or reporte.longitud is None:
+            continue
+        reporte.celda_geo = celda_indice(reporte.latitud, reporte.longitud)
+        pendientes.append(reporte)
+        if len(pendientes) >= 2000:
+            NuevoReporte.objects.bulk_update(pendientes, ['celda_geo'])
+            pendientes = []
+    if pendientes:
+        NuevoReporte.objects.bulk_update(pendientes, ['celda_geo'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0003_alter_foto_archivo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nuevoreporte',
+            name='celda_geo',
+            field=models.BigIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(indexar_reportes, migrations.RunPython.noop),
+    ]
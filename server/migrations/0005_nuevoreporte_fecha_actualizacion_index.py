@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0004_nuevoreporte_celda_geo'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='nuevoreporte',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
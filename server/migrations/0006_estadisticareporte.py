@@ -0,0 +1,78 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:26
+
+from django.db import migrations, models
+from django.db.models import Case, Count, Exists, IntegerField, OuterRef, Value, When
+from django.db.models.functions import Coalesce, ExtractWeekDay
+
+# Copia de server.estadisticas al momento de esta migración.
+FRANJAS_HORA = (6, 9, 12, 15, 18, 21, 24)
+
+
+def generar_estadisticas(apps, schema_editor):
+    NuevoReporte = apps.get_model('server', 'NuevoReporte')
+    Foto = apps.get_model('server', 'Foto')
+    EstadisticaReporte = apps.get_model('server', 'EstadisticaReporte')
+
+    franja = [When(hora__isnull=True, then=Value(-1))]
+    franja += [When(hora__hour__lt=limite, then=Value(i)) for i, limite in enumerate(FRANJAS_HORA)]
+    filas = (
+        NuevoReporte.objects.order_by()
+        .annotate(
+            clave_sector=Coalesce('sector', Value('')),
+            clave_franja=Case(*franja, output_field=IntegerField()),
+            clave_dia=ExtractWeekDay('fecha'),
+            clave_foto=Exists(Foto.objects.filter(reporte=OuterRef('pk'))),
+        )
+        .values('fecha', 'estado', 'clave_sector', 'gravedad', 'tipo_animal',
+                'clave_franja', 'clave_dia', 'clave_foto')
+        .annotate(total=Count('id'))
+    )
+    EstadisticaReporte.objects.bulk_create(
+        [
+            EstadisticaReporte(
+                fecha=fila['fecha'],
+                estado=fila['estado'],
+                sector=fila['clave_sector'],
+                gravedad=fila['gravedad'],
+                tipo_animal=fila['tipo_animal'],
+                franja_hora=fila['clave_franja'],
+                dia_semana=fila['clave_dia'],
+                con_foto=fila['clave_foto'],
+                total=fila['total'],
+            )
+            for fila in filas
+        ],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0005_nuevoreporte_fecha_actualizacion_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadisticaReporte',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha del incidente')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('aprobado', 'Aprobado'), ('rechazado', 'Rechazado')], max_length=20)),
+                ('sector', models.CharField(blank=True, default='', max_length=50)),
+                ('gravedad', models.CharField(choices=[('leve', 'Leve'), ('moderado', 'Moderado'), ('grave', 'Grave')], max_length=20)),
+                ('tipo_animal', models.CharField(choices=[('perro', 'Perro doméstico'), ('gato', 'Gato'), ('otro', 'Otro animal')], max_length=20)),
+                ('franja_hora', models.SmallIntegerField(default=-1, verbose_name='Franja horaria')),
+                ('dia_semana', models.SmallIntegerField(verbose_name='Día de la semana (1 = domingo)')),
+                ('con_foto', models.BooleanField(default=False)),
+                ('total', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Estadística de reportes',
+                'verbose_name_plural': 'Estadísticas de reportes',
+                'indexes': [models.Index(fields=['estado', 'fecha'], name='estadistica_estado_fecha')],
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'estado', 'sector', 'gravedad', 'tipo_animal', 'franja_hora', 'dia_semana', 'con_foto'), name='estadistica_reporte_unica')],
+            },
+        ),
+        migrations.RunPython(generar_estadisticas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0006_estadisticareporte'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EjecucionHotspots',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('radio_m', models.FloatField()),
+                ('minimo_reportes', models.IntegerField()),
+                ('dias', models.IntegerField()),
+                ('ventana_desde', models.DateField()),
+                ('marca', models.DateTimeField(verbose_name='Reportes revisados hasta')),
+            ],
+            options={
+                'verbose_name': 'Ejecución de detección de hotspots',
+                'verbose_name_plural': 'Ejecuciones de detección de hotspots',
+            },
+        ),
+        migrations.CreateModel(
+            name='Hotspot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('latitud', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('longitud', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('radio_m', models.FloatField(verbose_name='Radio (m)')),
+                ('total_reportes', models.IntegerField()),
+                ('graves', models.IntegerField(default=0)),
+                ('fecha_inicio', models.DateField(verbose_name='Primer incidente')),
+                ('fecha_fin', models.DateField(verbose_name='Último incidente')),
+                ('celdas', models.JSONField(default=list, editable=False)),
+                ('detectado_en', models.DateTimeField(auto_now_add=True)),
+                ('reportes', models.ManyToManyField(blank=True, related_name='hotspots', to='server.nuevoreporte')),
+            ],
+            options={
+                'verbose_name': 'Hotspot',
+                'verbose_name_plural': 'Hotspots',
+                'ordering': ['-total_reportes'],
+                'indexes': [models.Index(fields=['latitud', 'longitud'], name='hotspot_ubicacion')],
+            },
+        ),
+    ]
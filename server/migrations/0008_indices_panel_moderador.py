@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0007_hotspots'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='nuevoreporte',
+            index=models.Index(fields=['fecha', 'id'], name='reporte_fecha_id'),
+        ),
+        migrations.AddIndex(
+            model_name='nuevoreporte',
+            index=models.Index(fields=['estado', 'fecha', 'id'], name='reporte_estado_fecha_id'),
+        ),
+        migrations.AddIndex(
+            model_name='nuevoreporte',
+            index=models.Index(fields=['estado', 'gravedad', 'fecha', 'id'], name='reporte_estado_grav_fecha_id'),
+        ),
+        migrations.AddIndex(
+            model_name='nuevoreporte',
+            index=models.Index(fields=['estado', 'tipo_animal', 'fecha', 'id'], name='reporte_estado_animal_fecha_id'),
+        ),
+        migrations.AddIndex(
+            model_name='nuevoreporte',
+            index=models.Index(fields=['estado', 'anonimo', 'fecha', 'id'], name='reporte_estado_anon_fecha_id'),
+        ),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:39
+
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Exists, OuterRef
+from django.utils import timezone
+
+# Copia de server.prioridad al momento de esta migración.
+PRIORIDAD_BASE = 100
+PUNTOS_GRAVEDAD = {'leve': 0, 'moderado': 30, 'grave': 60}
+PUNTOS_POR_PERRO = 5
+MAX_PERROS = 5
+PUNTOS_FOTO = 10
+MAX_DIAS_ANTIGUEDAD = 30
+DIAS_DENSIDAD = 30
+PUNTOS_DENSIDAD = 2
+MAX_DENSIDAD = 10
+
+
+def puntos(gravedad, cantidad_perros, con_foto, dias_antiguedad, densidad):
+    return (
+        PRIORIDAD_BASE
+        + PUNTOS_GRAVEDAD.get(gravedad, 0)
+        + PUNTOS_POR_PERRO * min(max(cantidad_perros or 1, 1), MAX_PERROS)
+        + (PUNTOS_FOTO if con_foto else 0)
+        - min(max(dias_antiguedad, 0), MAX_DIAS_ANTIGUEDAD)
+        + PUNTOS_DENSIDAD * min(densidad, MAX_DENSIDAD)
+    )
+
+
+def calcular_prioridades(apps, schema_editor):
+    NuevoReporte = apps.get_model('server', 'NuevoReporte')
+    Foto = apps.get_model('server', 'Foto')
+
+    # Conteo acumulado por (sector, fecha) para la ventana de densidad.
+    por_sector = defaultdict(lambda: ([], []))
+    conteos = (
+        NuevoReporte.objects.exclude(estado='rechazado').exclude(sector__isnull=True).exclude(sector='')
+        .values('sector', 'fecha').annotate(cantidad=Count('id')).order_by('sector', 'fecha')
+    )
+    for fila in conteos:
+        fechas, acumulado = por_sector[fila['sector']]
+        fechas.append(fila['fecha'])
+        acumulado.append((acumulado[-1] if acumulado else 0) + fila['cantidad'])
+
+    def densidad(sector, fecha, estado):
+        if not sector or sector not in por_sector:
+            return 0
+        fechas, acumulado = por_sector[sector]
+        hasta = bisect_right(fechas, fecha)
+        desde = bisect_left(fechas, fecha - timedelta(days=DIAS_DENSIDAD - 1))
+        total = (acumulado[hasta - 1] if hasta else 0) - (acumulado[desde - 1] if desde else 0)
+        # El propio reporte no cuenta.
+        return total - (0 if estado == 'rechazado' else 1)
+
+    filas = NuevoReporte.objects.annotate(
+        con_foto=Exists(Foto.objects.filter(reporte_id=OuterRef('pk')))
+    ).values_list('id', 'gravedad', 'cantidad_perros', 'fecha', 'fecha_creacion', 'sector', 'estado', 'con_foto')
+
+    cambios = []
+    for pk, gravedad, perros, fecha, creado, sector, estado, con_foto in filas.iterator(chunk_size=2000):
+        dias = (timezone.localdate(creado) - fecha).days if creado else 0
+        cambios.append(NuevoReporte(
+            pk=pk, prioridad=puntos(gravedad, perros, con_foto, dias, densidad(sector, fecha, estado))
+        ))
+    NuevoReporte.objects.bulk_update(cambios, ['prioridad'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0009_reclamo_reportes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nuevoreporte',
+            name='prioridad',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(calcular_prioridades, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='nuevoreporte',
+            index=models.Index(fields=['estado', 'prioridad', 'fecha', 'id'], name='reporte_estado_prio'),
+        ),
+        migrations.AddIndex(
+            model_name='nuevoreporte',
+            index=models.Index(fields=['estado', 'gravedad', 'prioridad', 'fecha', 'id'], name='reporte_estado_grav_prio'),
+        ),
+        migrations.AddIndex(
+            model_name='nuevoreporte',
+            index=models.Index(fields=['estado', 'tipo_animal', 'prioridad', 'fecha', 'id'], name='reporte_estado_animal_prio'),
+        ),
+        migrations.AddIndex(
+            model_name='nuevoreporte',
+            index=models.Index(fields=['estado', 'anonimo', 'prioridad', 'fecha', 'id'], name='reporte_estado_anon_prio'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0010_prioridad_reportes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportacionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('formato', models.CharField(choices=[('csv', 'CSV'), ('ndjson', 'NDJSON'), ('geojson', 'GeoJSON'), ('parquet', 'Parquet')], max_length=10)),
+                ('filtros', models.JSONField(default=dict)),
+                ('clave', models.CharField(max_length=64)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('listo', 'Listo'), ('error', 'Error')], default='pendiente', max_length=12)),
+                ('archivo', models.CharField(blank=True, default='', max_length=255)),
+                ('filas', models.IntegerField(blank=True, null=True)),
+                ('tamano', models.BigIntegerField(blank=True, null=True, verbose_name='Tamaño (bytes)')),
+                ('error', models.TextField(blank=True, default='')),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('iniciado', models.DateTimeField(blank=True, null=True)),
+                ('terminado', models.DateTimeField(blank=True, null=True)),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='exportaciones', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Exportación',
+                'verbose_name_plural': 'Exportaciones',
+                'ordering': ['-creado'],
+                'indexes': [models.Index(fields=['clave', 'estado', 'terminado'], name='exportacion_clave'), models.Index(fields=['estado', 'creado'], name='exportacion_estado_creado')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:45
+
+import cloudinary.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0011_exportaciones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='foto',
+            name='archivo_local',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='foto',
+            name='error_subida',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='foto',
+            name='estado_subida',
+            field=models.CharField(choices=[('pendiente', 'Pendiente'), ('subiendo', 'Subiendo'), ('lista', 'Lista'), ('error', 'Error')], default='lista', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='foto',
+            name='intentos_subida',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='foto',
+            name='proximo_intento',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='foto',
+            name='archivo',
+            field=cloudinary.models.CloudinaryField(blank=True, max_length=255, null=True, verbose_name='imagen'),
+        ),
+        migrations.AddIndex(
+            model_name='foto',
+            index=models.Index(fields=['estado_subida', 'proximo_intento'], name='foto_cola_subida'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:46
+
+import cloudinary.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0012_subida_diferida_fotos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='foto',
+            name='alto',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='foto',
+            name='ancho',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='foto',
+            name='miniatura',
+            field=cloudinary.models.CloudinaryField(blank=True, max_length=255, null=True, verbose_name='miniatura'),
+        ),
+        migrations.AddField(
+            model_name='foto',
+            name='vista_previa',
+            field=cloudinary.models.CloudinaryField(blank=True, max_length=255, null=True, verbose_name='vista previa'),
+        ),
+    ]
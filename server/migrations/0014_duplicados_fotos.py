@@ -0,0 +1,79 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0013_miniaturas_fotos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='foto',
+            name='ahash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='foto',
+            name='banda_1',
+            field=models.CharField(blank=True, default='', editable=False, max_length=4),
+        ),
+        migrations.AddField(
+            model_name='foto',
+            name='banda_2',
+            field=models.CharField(blank=True, default='', editable=False, max_length=4),
+        ),
+        migrations.AddField(
+            model_name='foto',
+            name='banda_3',
+            field=models.CharField(blank=True, default='', editable=False, max_length=4),
+        ),
+        migrations.AddField(
+            model_name='foto',
+            name='banda_4',
+            field=models.CharField(blank=True, default='', editable=False, max_length=4),
+        ),
+        migrations.AddField(
+            model_name='foto',
+            name='dhash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='foto',
+            name='distancia_duplicado',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='foto',
+            name='duplicado_de',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicados', to='server.foto', verbose_name='Posible duplicado de'),
+        ),
+        migrations.AddField(
+            model_name='foto',
+            name='huella',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='foto',
+            index=models.Index(fields=['huella'], name='foto_huella'),
+        ),
+        migrations.AddIndex(
+            model_name='foto',
+            index=models.Index(fields=['banda_1'], name='foto_banda_1'),
+        ),
+        migrations.AddIndex(
+            model_name='foto',
+            index=models.Index(fields=['banda_2'], name='foto_banda_2'),
+        ),
+        migrations.AddIndex(
+            model_name='foto',
+            index=models.Index(fields=['banda_3'], name='foto_banda_3'),
+        ),
+        migrations.AddIndex(
+            model_name='foto',
+            index=models.Index(fields=['banda_4'], name='foto_banda_4'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0014_duplicados_fotos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nuevoreporte',
+            name='duplicado_de',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicados', to='server.nuevoreporte', verbose_name='Mismo incidente que'),
+        ),
+        migrations.AddIndex(
+            model_name='nuevoreporte',
+            index=models.Index(fields=['celda_geo', 'fecha'], name='reporte_celda_fecha'),
+        ),
+    ]
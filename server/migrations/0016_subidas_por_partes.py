@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0015_incidentes_reportes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SesionSubida',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=32, unique=True)),
+                ('nombre', models.CharField(blank=True, default='', max_length=255)),
+                ('tamano', models.PositiveIntegerField(verbose_name='Tamaño (bytes)')),
+                ('recibido', models.PositiveIntegerField(default=0)),
+                ('archivo_local', models.CharField(max_length=255)),
+                ('huella', models.CharField(blank=True, default='', max_length=64)),
+                ('estado', models.CharField(choices=[('abierta', 'Abierta'), ('completa', 'Completa')], default='abierta', max_length=10)),
+                ('creada', models.DateTimeField(auto_now_add=True)),
+                ('actualizada', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Subida de foto',
+                'verbose_name_plural': 'Subidas de fotos',
+                'indexes': [models.Index(fields=['actualizada'], name='subida_actualizada')],
+            },
+        ),
+    ]
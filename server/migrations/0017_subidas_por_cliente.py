@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0016_subidas_por_partes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sesionsubida',
+            name='cliente',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+        migrations.AddIndex(
+            model_name='sesionsubida',
+            index=models.Index(fields=['cliente'], name='subida_cliente'),
+        ),
+    ]
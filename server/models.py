@@ -1,8 +1,14 @@
+import math
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models import Count, FloatField, OuterRef, Prefetch, Q, Subquery
+from django.db.models.functions import Cast, Coalesce, Sqrt
 from cloudinary.models import CloudinaryField
+from . import geo
+from .almacenamiento import almacenamiento
 
 class PerfilUsuario(models.Model):
     ROLES = [
@@ -18,6 +24,81 @@ class PerfilUsuario(models.Model):
         return f"{self.user.username} ({self.rol})"
 
 
+class NuevoReporteQuerySet(models.QuerySet):
+
+    def dentro_de_bbox(self, bbox):
+        """Reportes dentro de (oeste, sur, este, norte), usando el índice de celdas."""
+        oeste, sur, este, norte = bbox
+        reportes = self.filter(
+            latitud__gte=sur,
+            latitud__lte=norte,
+            longitud__gte=oeste,
+            longitud__lte=este,
+        )
+
+        rangos = geo.rangos_celdas(bbox)
+        if rangos is None:
+            return reportes
+
+        celdas = Q()
+        for inicio, fin in rangos:
+            celdas |= Q(celda_geo__range=(inicio, fin))
+        return reportes.filter(celdas)
+
+    def dentro_de_radio(self, lat, lon, metros):
+        """Reportes a menos de `metros` del punto, anotados con `distancia_m`.
+
+        Usa una proyección equirectangular local, precisa para radios urbanos.
+        """
+        lat, lon = float(lat), float(lon)
+        kx = geo.METROS_POR_GRADO * math.cos(math.radians(lat))
+        ky = geo.METROS_POR_GRADO
+
+        dx = (Cast('longitud', FloatField()) - lon) * kx
+        dy = (Cast('latitud', FloatField()) - lat) * ky
+
+        return (
+            self.dentro_de_bbox(geo.bbox_radio(lat, lon, metros))
+            .alias(distancia2=dx * dx + dy * dy)
+            .filter(distancia2__lte=float(metros) ** 2)
+            .annotate(distancia_m=Sqrt('distancia2'))
+        )
+
+    def con_incidente(self):
+        """Anota `total_duplicados`: cuántos reportes están enlazados a cada uno como mismo incidente."""
+        total = (
+            NuevoReporte.objects.filter(duplicado_de=OuterRef('pk'))
+            .order_by()
+            .values('duplicado_de')
+            .annotate(total=Count('id'))
+            .values('total')
+        )
+        return self.annotate(total_duplicados=Coalesce(Subquery(total), 0))
+
+    def con_fotos(self):
+        """Anota `total_fotos` y precarga las fotos ya subidas, en dos consultas para toda la página."""
+        total = (
+            Foto.objects.filter(reporte=OuterRef('pk'), estado_subida='lista')
+            .order_by()
+            .values('reporte')
+            .annotate(total=Count('id'))
+            .values('total')
+        )
+        return self.annotate(
+            total_fotos=Coalesce(Subquery(total), 0)
+        ).prefetch_related(
+            Prefetch(
+                'fotos',
+                queryset=Foto.objects.filter(estado_subida='lista')
+                .select_related('duplicado_de')
+                .only(
+                    'id', 'reporte_id', 'archivo', 'miniatura', 'vista_previa', 'orden', 'subida_en',
+                    'distancia_duplicado', 'duplicado_de__id', 'duplicado_de__reporte_id',
+                ),
+            )
+        )
+
+
 class NuevoReporte(models.Model):
     TIPO_ANIMAL_CHOICES = [
         ('perro', 'Perro doméstico'),
@@ -113,17 +194,73 @@ class NuevoReporte(models.Model):
     fecha_moderacion = models.DateTimeField(null=True, blank=True)
     comentario_moderacion = models.TextField(null=True, blank=True)
 
+    # Reclamo temporal de un reporte pendiente por un moderador; vence en reclamado_hasta.
+    reclamado_por = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='reportes_reclamados'
+    )
+    reclamado_hasta = models.DateTimeField(null=True, blank=True)
+
     fecha_creacion = models.DateTimeField(auto_now_add=True)
-    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True, db_index=True)
+
+    celda_geo = models.BigIntegerField(null=True, blank=True, editable=False, db_index=True)
+
+    # Prioridad de moderación calculada al recibir el reporte (ver server/prioridad.py).
+    prioridad = models.IntegerField(default=0, editable=False)
+
+    # Reporte principal del incidente cuando otro vecino ya reportó el mismo ataque
+    # (ver server/incidentes.py). Los enlazados no cuentan en las estadísticas.
+    duplicado_de = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='duplicados',
+        verbose_name='Mismo incidente que'
+    )
+
+    objects = NuevoReporteQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Reporte'
         verbose_name_plural = 'Reportes'
         ordering = ['-fecha_creacion']
+        # Índices para la paginación por cursor (fecha, id) del panel de moderación,
+        # uno por combinación de filtros habitual.
+        indexes = [
+            models.Index(fields=['fecha', 'id'], name='reporte_fecha_id'),
+            models.Index(fields=['estado', 'fecha', 'id'], name='reporte_estado_fecha_id'),
+            models.Index(fields=['estado', 'gravedad', 'fecha', 'id'], name='reporte_estado_grav_fecha_id'),
+            models.Index(fields=['estado', 'tipo_animal', 'fecha', 'id'], name='reporte_estado_animal_fecha_id'),
+            models.Index(fields=['estado', 'anonimo', 'fecha', 'id'], name='reporte_estado_anon_fecha_id'),
+            # Cola de pendientes ordenada por prioridad.
+            models.Index(fields=['estado', 'prioridad', 'fecha', 'id'], name='reporte_estado_prio'),
+            models.Index(fields=['estado', 'gravedad', 'prioridad', 'fecha', 'id'], name='reporte_estado_grav_prio'),
+            models.Index(fields=['estado', 'tipo_animal', 'prioridad', 'fecha', 'id'], name='reporte_estado_animal_prio'),
+            models.Index(fields=['estado', 'anonimo', 'prioridad', 'fecha', 'id'], name='reporte_estado_anon_prio'),
+            # Búsqueda de reportes del mismo incidente: rangos de celdas y luego fecha.
+            models.Index(fields=['celda_geo', 'fecha'], name='reporte_celda_fecha'),
+        ]
 
     def __str__(self):
         return f"{self.titulo} ({self.get_gravedad_display()} - {self.sector})"
 
+    def save(self, *args, **kwargs):
+        if self.latitud is not None and self.longitud is not None:
+            self.celda_geo = geo.celda_indice(self.latitud, self.longitud)
+        else:
+            self.celda_geo = None
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitud', 'longitud'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'celda_geo'}
+
+        super().save(*args, **kwargs)
+
     def nombre_visible(self):
         return "Anónimo" if self.anonimo else (self.nombre_reportante or "Anónimo")
 
@@ -137,6 +274,10 @@ class NuevoReporte(models.Model):
             raise ValidationError("Debes seleccionar una ubicación válida en el mapa.")
 
 
+MINIATURA_ANCHO = 320
+MINIATURA_ALTO = 240
+
+
 class Foto(models.Model):
     ESTADOS_MODERACION = [
         ('pendiente', 'Pendiente'),
@@ -144,6 +285,13 @@ class Foto(models.Model):
         ('rechazada', 'Rechazada'),
     ]
 
+    ESTADOS_SUBIDA = [
+        ('pendiente', 'Pendiente'),
+        ('subiendo', 'Subiendo'),
+        ('lista', 'Lista'),
+        ('error', 'Error'),
+    ]
+
     reporte = models.ForeignKey(
         'NuevoReporte',
         related_name='fotos',
@@ -151,8 +299,37 @@ class Foto(models.Model):
         verbose_name='Reporte asociado'
     )
 
-    archivo = CloudinaryField('imagen')
-
+    # Vacío mientras la foto espera en FOTOS_STAGING_DIR a que subir_fotos la suba.
+    archivo = CloudinaryField('imagen', blank=True, null=True)
+    archivo_local = models.CharField(max_length=255, blank=True, default='', editable=False)
+    # Tamaños fijos generados al procesar la foto (ver server/imagenes.py).
+    miniatura = CloudinaryField('miniatura', blank=True, null=True)
+    vista_previa = CloudinaryField('vista previa', blank=True, null=True)
+    ancho = models.PositiveIntegerField(null=True, blank=True)
+    alto = models.PositiveIntegerField(null=True, blank=True)
+    # SHA-256 del archivo recibido: una foto idéntica reutiliza lo ya subido.
+    huella = models.CharField(max_length=64, blank=True, default='', editable=False)
+    # Hashes perceptuales (server/imagenes.py). `dhash` se parte en cuatro bandas
+    # de 16 bits indexadas para buscar fotos parecidas (server/duplicados.py).
+    dhash = models.CharField(max_length=16, blank=True, default='', editable=False)
+    ahash = models.CharField(max_length=16, blank=True, default='', editable=False)
+    banda_1 = models.CharField(max_length=4, blank=True, default='', editable=False)
+    banda_2 = models.CharField(max_length=4, blank=True, default='', editable=False)
+    banda_3 = models.CharField(max_length=4, blank=True, default='', editable=False)
+    banda_4 = models.CharField(max_length=4, blank=True, default='', editable=False)
+    duplicado_de = models.ForeignKey(
+        'self',
+        related_name='duplicados',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name='Posible duplicado de'
+    )
+    distancia_duplicado = models.PositiveSmallIntegerField(null=True, blank=True)
+    estado_subida = models.CharField(max_length=10, choices=ESTADOS_SUBIDA, default='lista')
+    intentos_subida = models.PositiveSmallIntegerField(default=0)
+    proximo_intento = models.DateTimeField(null=True, blank=True)
+    error_subida = models.TextField(blank=True, default='')
 
     subida_en = models.DateTimeField(auto_now_add=True, verbose_name='Fecha de subida')
     orden = models.IntegerField(default=0, verbose_name='Orden de visualización')
@@ -171,10 +348,42 @@ class Foto(models.Model):
         verbose_name = 'Fotografía'
         verbose_name_plural = 'Fotografías'
         ordering = ['orden', '-subida_en']
+        indexes = [
+            models.Index(fields=['estado_subida', 'proximo_intento'], name='foto_cola_subida'),
+            models.Index(fields=['huella'], name='foto_huella'),
+            models.Index(fields=['banda_1'], name='foto_banda_1'),
+            models.Index(fields=['banda_2'], name='foto_banda_2'),
+            models.Index(fields=['banda_3'], name='foto_banda_3'),
+            models.Index(fields=['banda_4'], name='foto_banda_4'),
+        ]
 
     def __str__(self):
         return f"Foto {self.id} - {self.reporte.titulo}"
 
+    @property
+    def url(self):
+        if not self.archivo:
+            return ''
+        return almacenamiento().url(self.archivo)
+
+    @property
+    def url_vista_previa(self):
+        """Versión de hasta 1024 px para ver la foto ampliada; el original si es una foto antigua."""
+        if self.vista_previa:
+            return almacenamiento().url(self.vista_previa)
+        return self.url
+
+    def url_miniatura(self, ancho=MINIATURA_ANCHO, alto=MINIATURA_ALTO):
+        """URL de la miniatura guardada; para otros tamaños (o fotos antiguas), una
+        versión reducida que Cloudinary genera y cachea a pedido."""
+        if self.miniatura and (ancho, alto) == (MINIATURA_ANCHO, MINIATURA_ALTO):
+            return almacenamiento().url(self.miniatura)
+        if not self.archivo:
+            return ''
+        return almacenamiento().url(
+            self.archivo, width=ancho, height=alto, crop='fill', quality='auto', fetch_format='auto'
+        )
+
 
 
 class ModeracionLog(models.Model):
@@ -201,3 +410,167 @@ class ModeracionLog(models.Model):
 
     def __str__(self):
         return f"{self.moderador} → {self.accion} ({self.reporte.titulo})"
+
+
+class EstadisticaReporte(models.Model):
+    """Conteo de reportes por día y dimensión, mantenido al crear, moderar o borrar reportes."""
+
+    fecha = models.DateField(verbose_name='Fecha del incidente')
+    estado = models.CharField(max_length=20, choices=NuevoReporte.ESTADO_CHOICES)
+    # '' cuando el reporte no tiene sector; -1 cuando no tiene hora.
+    sector = models.CharField(max_length=50, blank=True, default='')
+    gravedad = models.CharField(max_length=20, choices=NuevoReporte.GRAVEDAD_CHOICES)
+    tipo_animal = models.CharField(max_length=20, choices=NuevoReporte.TIPO_ANIMAL_CHOICES)
+    franja_hora = models.SmallIntegerField(default=-1, verbose_name='Franja horaria')
+    dia_semana = models.SmallIntegerField(verbose_name='Día de la semana (1 = domingo)')
+    con_foto = models.BooleanField(default=False)
+
+    total = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Estadística de reportes'
+        verbose_name_plural = 'Estadísticas de reportes'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['fecha', 'estado', 'sector', 'gravedad', 'tipo_animal',
+                        'franja_hora', 'dia_semana', 'con_foto'],
+                name='estadistica_reporte_unica',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['estado', 'fecha'], name='estadistica_estado_fecha'),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.estado} {self.sector or 'sin sector'}: {self.total}"
+
+
+class Hotspot(models.Model):
+    """Concentración de ataques aprobados detectada por el comando detectar_hotspots."""
+
+    latitud = models.DecimalField(max_digits=9, decimal_places=6)
+    longitud = models.DecimalField(max_digits=9, decimal_places=6)
+    radio_m = models.FloatField(verbose_name='Radio (m)')
+
+    total_reportes = models.IntegerField()
+    graves = models.IntegerField(default=0)
+    fecha_inicio = models.DateField(verbose_name='Primer incidente')
+    fecha_fin = models.DateField(verbose_name='Último incidente')
+
+    # Celdas del índice espacial (celda_geo) que ocupan sus reportes; permiten
+    # recalcular solo los hotspots cercanos a los reportes modificados.
+    celdas = models.JSONField(default=list, editable=False)
+    reportes = models.ManyToManyField(NuevoReporte, related_name='hotspots', blank=True)
+
+    detectado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Hotspot'
+        verbose_name_plural = 'Hotspots'
+        ordering = ['-total_reportes']
+        indexes = [
+            models.Index(fields=['latitud', 'longitud'], name='hotspot_ubicacion'),
+        ]
+
+    def __str__(self):
+        return f"Hotspot de {self.total_reportes} reportes ({self.latitud}, {self.longitud})"
+
+
+class EjecucionHotspots(models.Model):
+    """Parámetros y marca de tiempo de la última detección de hotspots."""
+
+    radio_m = models.FloatField()
+    minimo_reportes = models.IntegerField()
+    dias = models.IntegerField()
+    ventana_desde = models.DateField()
+    marca = models.DateTimeField(verbose_name='Reportes revisados hasta')
+
+    class Meta:
+        verbose_name = 'Ejecución de detección de hotspots'
+        verbose_name_plural = 'Ejecuciones de detección de hotspots'
+
+    def __str__(self):
+        return f"Hotspots hasta {self.marca:%d/%m/%Y %H:%M}"
+
+
+class ExportacionJob(models.Model):
+    """Exportación de reportes generada en segundo plano por `procesar_exportaciones`."""
+
+    FORMATO_CHOICES = [
+        ('csv', 'CSV'),
+        ('ndjson', 'NDJSON'),
+        ('geojson', 'GeoJSON'),
+        ('parquet', 'Parquet'),
+    ]
+
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('listo', 'Listo'),
+        ('error', 'Error'),
+    ]
+
+    usuario = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='exportaciones'
+    )
+    formato = models.CharField(max_length=10, choices=FORMATO_CHOICES)
+    filtros = models.JSONField(default=dict)
+    # Hash de formato + filtros: dos pedidos iguales tienen la misma clave.
+    clave = models.CharField(max_length=64)
+    estado = models.CharField(max_length=12, choices=ESTADO_CHOICES, default='pendiente')
+    archivo = models.CharField(max_length=255, blank=True, default='')
+    filas = models.IntegerField(null=True, blank=True)
+    tamano = models.BigIntegerField(null=True, blank=True, verbose_name='Tamaño (bytes)')
+    error = models.TextField(blank=True, default='')
+    creado = models.DateTimeField(auto_now_add=True)
+    iniciado = models.DateTimeField(null=True, blank=True)
+    terminado = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Exportación'
+        verbose_name_plural = 'Exportaciones'
+        ordering = ['-creado']
+        indexes = [
+            models.Index(fields=['clave', 'estado', 'terminado'], name='exportacion_clave'),
+            models.Index(fields=['estado', 'creado'], name='exportacion_estado_creado'),
+        ]
+
+    def __str__(self):
+        return f"Exportación {self.get_formato_display()} #{self.id} ({self.get_estado_display()})"
+
+
+class SesionSubida(models.Model):
+    """Subida por partes de una foto, reanudable; el reporte la usa por su `token` (ver server/subidas.py)."""
+
+    ESTADO_CHOICES = [
+        ('abierta', 'Abierta'),
+        ('completa', 'Completa'),
+    ]
+
+    token = models.CharField(max_length=32, unique=True)
+    nombre = models.CharField(max_length=255, blank=True, default='')
+    tamano = models.PositiveIntegerField(verbose_name='Tamaño (bytes)')
+    recibido = models.PositiveIntegerField(default=0)
+    # Nombre en FOTOS_STAGING_DIR; mientras está abierta se escribe en "<archivo_local>.parcial".
+    archivo_local = models.CharField(max_length=255)
+    huella = models.CharField(max_length=64, blank=True, default='')
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='abierta')
+    # Clave de la sesión de Django que abrió la subida; limita las subidas sin usar por cliente.
+    cliente = models.CharField(max_length=40, blank=True, default='')
+    creada = models.DateTimeField(auto_now_add=True)
+    actualizada = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Subida de foto'
+        verbose_name_plural = 'Subidas de fotos'
+        indexes = [
+            models.Index(fields=['actualizada'], name='subida_actualizada'),
+            models.Index(fields=['cliente'], name='subida_cliente'),
+        ]
+
+    def __str__(self):
+        return f"Subida {self.token} ({self.recibido}/{self.tamano})"
@@ -0,0 +1,167 @@
+"""Moderación de reportes en lote: una transacción, un UPDATE condicional y un bulk_create de logs.
+
+Para repartir la cola entre varios moderadores, cada uno reclama los
+siguientes reportes pendientes libres por un tiempo limitado. El reclamo es
+un UPDATE condicional (compare-and-set): si otro moderador se adelantó, la
+fila ya no cumple la condición y no se toca.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import incidentes
+from .estadisticas import actualizar_reportes
+from .mapa import invalidar_tiles
+from .models import ModeracionLog, NuevoReporte
+from .tiempo_real import avisar_moderados, avisar_reclamados
+
+# Cantidad máxima de reportes por llamada a la API de moderación en lote.
+MAX_LOTE_MODERACION = 500
+
+# Reclamos: cuánto dura y cuántos reportes puede tomar un moderador a la vez.
+DURACION_RECLAMO = timedelta(minutes=10)
+MAX_RECLAMO = 50
+# Reintentos cuando otro moderador gana parte de los candidatos.
+INTENTOS_RECLAMO = 3
+
+# decisión -> (estado nuevo, acción del log, comentario por defecto, motivo por defecto del log)
+DECISIONES = {
+    'aprobar': ('aprobado', 'verificado', 'Reporte aprobado y publicado.', 'Aprobado por moderador'),
+    'rechazar': ('rechazado', 'rechazado', None, None),
+}
+
+
+def moderar_reportes(ids, decision, moderador, motivo=None):
+    """Aprueba o rechaza los reportes `ids` y devuelve el resultado de cada uno.
+
+    Solo se deciden reportes pendientes. Los resultados posibles son el estado
+    nuevo ('aprobado' o 'rechazado'), 'ya_moderado' si otro moderador lo
+    decidió antes y 'no_encontrado'. Rechazar exige un motivo.
+    Decidir un reporte libera su reclamo. La tabla de estadísticas, los tiles del mapa y
+    los paneles de moderación abiertos se actualizan junto con los reportes, y un
+    principal rechazado sin el resto de su incidente lo deja a un enlazado.
+    """
+    if decision not in DECISIONES:
+        raise ValueError('La decisión debe ser "aprobar" o "rechazar".')
+
+    estado, accion, comentario, motivo_log = DECISIONES[decision]
+    motivo = (motivo or '').strip()
+    if decision == 'rechazar' and not motivo:
+        raise ValueError('Debes escribir un motivo de rechazo.')
+
+    ids = list(dict.fromkeys(int(i) for i in ids))
+    ahora = timezone.now()
+
+    with transaction.atomic():
+        actuales = {
+            fila['id']: fila
+            for fila in NuevoReporte.objects.select_for_update()
+            .filter(id__in=ids)
+            .values('id', 'estado', 'latitud', 'longitud')
+        }
+        cambiar = [i for i, fila in actuales.items() if fila['estado'] == 'pendiente']
+
+        actualizados = 0
+        if cambiar:
+            # La condición sobre el estado se repite en el UPDATE para no pisar
+            # decisiones tomadas por otra transacción.
+            actualizados = actualizar_reportes(
+                NuevoReporte.objects.filter(id__in=cambiar, estado='pendiente'),
+                estado=estado,
+                moderador=moderador,
+                fecha_moderacion=ahora,
+                comentario_moderacion=motivo or comentario,
+                fecha_actualizacion=ahora,
+                reclamado_por=None,
+                reclamado_hasta=None,
+            )
+
+            if estado == 'rechazado':
+                incidentes.reasignar_rechazados(cambiar)
+
+            ModeracionLog.objects.bulk_create([
+                ModeracionLog(reporte_id=i, moderador=moderador, accion=accion, motivo=motivo or motivo_log)
+                for i in cambiar
+            ])
+
+            coordenadas = [(actuales[i]['latitud'], actuales[i]['longitud']) for i in cambiar]
+            transaction.on_commit(lambda: invalidar_tiles(coordenadas))
+            avisar_moderados({i: actuales[i]['estado'] for i in cambiar}, estado, moderador)
+
+    resultados = {}
+    for i in ids:
+        if i not in actuales:
+            resultados[i] = 'no_encontrado'
+        elif i in cambiar:
+            resultados[i] = estado
+        else:
+            resultados[i] = 'ya_moderado'
+
+    return resultados, actualizados
+
+
+def reclamo_libre(moderador, ahora):
+    """Pendientes sin reclamo vigente de otro moderador."""
+    return Q(estado='pendiente') & (
+        Q(reclamado_hasta__isnull=True) | Q(reclamado_hasta__lte=ahora) | Q(reclamado_por=moderador)
+    )
+
+
+def reclamar_reportes(moderador, cantidad, duracion=DURACION_RECLAMO):
+    """Reclama hasta `cantidad` reportes pendientes para `moderador` y devuelve el queryset reclamado.
+
+    Los reclamos vigentes del moderador se renuevan y cuentan dentro de
+    `cantidad`. Los candidatos se toman por prioridad, igual que en el panel.
+    """
+    cantidad = max(1, min(int(cantidad), MAX_RECLAMO))
+    ahora = timezone.now()
+    hasta = ahora + duracion
+    pendientes = NuevoReporte.objects.order_by('-prioridad', '-fecha', '-id')
+
+    propios = list(
+        pendientes.filter(estado='pendiente', reclamado_por=moderador, reclamado_hasta__gt=ahora)
+        .values_list('id', flat=True)[:cantidad]
+    )
+    NuevoReporte.objects.filter(id__in=propios, estado='pendiente', reclamado_por=moderador).update(
+        reclamado_hasta=hasta
+    )
+
+    faltan = cantidad - len(propios)
+    for _ in range(INTENTOS_RECLAMO):
+        if faltan <= 0:
+            break
+        candidatos = list(
+            pendientes.filter(reclamo_libre(moderador, ahora))
+            .exclude(id__in=propios)
+            .values_list('id', flat=True)[:faltan]
+        )
+        if not candidatos:
+            break
+        # Compare-and-set: solo se toman las filas que siguen libres.
+        ganados = NuevoReporte.objects.filter(id__in=candidatos).filter(
+            reclamo_libre(moderador, ahora)
+        ).update(reclamado_por=moderador, reclamado_hasta=hasta)
+        propios.extend(candidatos)
+        faltan -= ganados
+
+    # `hasta` identifica las filas de esta llamada: las que otro ganó tienen otro valor.
+    reclamados = pendientes.filter(estado='pendiente', reclamado_por=moderador, reclamado_hasta=hasta)
+    avisar_reclamados(list(reclamados.values_list('id', flat=True)), moderador, hasta)
+    return reclamados
+
+
+def liberar_reportes(moderador, ids=None):
+    """Suelta los reclamos de `moderador` (todos o solo los de `ids`) y devuelve cuántos liberó."""
+    reportes = NuevoReporte.objects.filter(reclamado_por=moderador)
+    if ids is not None:
+        reportes = reportes.filter(id__in=ids)
+    liberados = list(reportes.values_list('id', flat=True))
+    if liberados:
+        NuevoReporte.objects.filter(id__in=liberados, reclamado_por=moderador).update(
+            reclamado_por=None, reclamado_hasta=None
+        )
+        avisar_reclamados(liberados, None, None)
+    return len(liberados)
@@ -0,0 +1,101 @@
+"""Paginación por cursor (keyset) sobre campos de orden descendente.
+
+En vez de OFFSET, cada página se pide con el último (o primer) registro de la
+página vecina como cursor, así que la consulta usa el índice y cuesta lo mismo
+en la primera página que en la número diez mil. No cuenta el total de filas.
+"""
+
+from django.db.models import Q
+
+SEPARADOR_CURSOR = '_'
+
+
+class PaginaKeyset:
+    """Página de resultados con los cursores para moverse a la anterior y la siguiente."""
+
+    def __init__(self, object_list, campos, has_previous, has_next):
+        self.object_list = object_list
+        self.campos = campos
+        self.has_previous = has_previous
+        self.has_next = has_next
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_previous or self.has_next
+
+    @property
+    def cursor_anterior(self):
+        if self.has_previous and self.object_list:
+            return codificar_cursor(self.object_list[0], self.campos)
+        return None
+
+    @property
+    def cursor_siguiente(self):
+        if self.has_next and self.object_list:
+            return codificar_cursor(self.object_list[-1], self.campos)
+        return None
+
+
+def codificar_cursor(objeto, campos):
+    return SEPARADOR_CURSOR.join(str(getattr(objeto, campo)) for campo in campos)
+
+
+def decodificar_cursor(modelo, valor, campos):
+    """Valores de los campos de orden contenidos en el cursor; ValueError si no es válido."""
+    partes = (valor or '').split(SEPARADOR_CURSOR)
+    if len(partes) != len(campos):
+        raise ValueError('Cursor inválido.')
+    try:
+        return [modelo._meta.get_field(campo).to_python(parte) for campo, parte in zip(campos, partes)]
+    except Exception as e:
+        raise ValueError('Cursor inválido.') from e
+
+
+def filtro_cursor(campos, valores, sentido):
+    """Q que deja solo las filas posteriores al cursor en orden lexicográfico.
+
+    Para (a, b) y sentido 'lt': a < va OR (a = va AND b < vb).
+    """
+    condicion = Q()
+    for i, campo in enumerate(campos):
+        paso = Q(**{f'{campo}__{sentido}': valores[i]})
+        for anterior, valor in zip(campos[:i], valores[:i]):
+            paso &= Q(**{anterior: valor})
+        condicion |= paso
+    return condicion
+
+
+def paginar_keyset(queryset, campos, por_pagina, despues=None, antes=None):
+    """Página de `queryset` ordenada de forma descendente por `campos` (el último debe ser único).
+
+    `despues` avanza desde el cursor de la página actual y `antes` retrocede;
+    sin ninguno se devuelve la primera página. Lanza ValueError si el cursor no es válido.
+    """
+    modelo = queryset.model
+    descendente = [f'-{campo}' for campo in campos]
+
+    if antes:
+        valores = decodificar_cursor(modelo, antes, campos)
+        filas = list(
+            queryset.filter(filtro_cursor(campos, valores, 'gt'))
+            .order_by(*campos)[:por_pagina + 1]
+        )
+        if len(filas) <= por_pagina:
+            # Se llegó al principio: se devuelve la primera página completa.
+            return paginar_keyset(queryset, campos, por_pagina)
+        filas = filas[:por_pagina]
+        filas.reverse()
+        return PaginaKeyset(filas, campos, has_previous=True, has_next=True)
+
+    if despues:
+        valores = decodificar_cursor(modelo, despues, campos)
+        queryset = queryset.filter(filtro_cursor(campos, valores, 'lt'))
+
+    filas = list(queryset.order_by(*descendente)[:por_pagina + 1])
+    hay_mas = len(filas) > por_pagina
+    return PaginaKeyset(filas[:por_pagina], campos, has_previous=bool(despues), has_next=hay_mas)
@@ -0,0 +1,113 @@
+"""Prioridad de moderación de los reportes.
+
+Se calcula al recibir el reporte y se guarda en `NuevoReporte.prioridad`
+(indexado), de modo que la cola de pendientes se ordena con el índice sin
+calcular nada al consultar. Mayor prioridad = se modera antes.
+"""
+
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef
+from django.utils import timezone
+
+from .models import Foto, NuevoReporte
+
+PRIORIDAD_BASE = 100
+PUNTOS_GRAVEDAD = {'leve': 0, 'moderado': 30, 'grave': 60}
+PUNTOS_POR_PERRO = 5
+MAX_PERROS = 5
+PUNTOS_FOTO = 10
+# Un incidente antiguo al momento de reportarse resta un punto por día.
+MAX_DIAS_ANTIGUEDAD = 30
+# Reportes recientes del mismo sector: dos puntos por cada uno.
+DIAS_DENSIDAD = 30
+PUNTOS_DENSIDAD = 2
+MAX_DENSIDAD = 10
+
+
+def puntos(gravedad, cantidad_perros, con_foto, dias_antiguedad, densidad):
+    return (
+        PRIORIDAD_BASE
+        + PUNTOS_GRAVEDAD.get(gravedad, 0)
+        + PUNTOS_POR_PERRO * min(max(cantidad_perros or 1, 1), MAX_PERROS)
+        + (PUNTOS_FOTO if con_foto else 0)
+        - min(max(dias_antiguedad, 0), MAX_DIAS_ANTIGUEDAD)
+        + PUNTOS_DENSIDAD * min(densidad, MAX_DENSIDAD)
+    )
+
+
+def densidad_sector(sector, fecha, excluir=None):
+    """Reportes no rechazados del sector en los DIAS_DENSIDAD días previos a `fecha`."""
+    if not sector or not fecha:
+        return 0
+    reportes = NuevoReporte.objects.filter(
+        sector=sector,
+        fecha__gt=fecha - timedelta(days=DIAS_DENSIDAD),
+        fecha__lte=fecha,
+    ).exclude(estado='rechazado')
+    if excluir is not None:
+        reportes = reportes.exclude(pk=excluir)
+    return reportes.count()
+
+
+def calcular_prioridad(reporte, con_foto=False, hoy=None):
+    """Prioridad de un reporte que se está recibiendo (todavía puede no tener pk)."""
+    hoy = hoy or timezone.localdate()
+    dias = (hoy - reporte.fecha).days if reporte.fecha else 0
+    densidad = densidad_sector(reporte.sector, reporte.fecha, excluir=reporte.pk)
+    return puntos(reporte.gravedad, reporte.cantidad_perros, con_foto, dias, densidad)
+
+
+def ajustar_foto(reporte_id, con_foto):
+    """Suma o resta los puntos de foto cuando el reporte gana su primera foto o pierde la última."""
+    NuevoReporte.objects.filter(pk=reporte_id).update(
+        prioridad=F('prioridad') + (PUNTOS_FOTO if con_foto else -PUNTOS_FOTO)
+    )
+
+
+def recalcular(reportes=None, lote=2000):
+    """Vuelve a calcular la prioridad de `reportes` en bloque y devuelve cuántos actualizó.
+
+    La antigüedad se mide respecto de la fecha de creación y la densidad con
+    la ventana de DIAS_DENSIDAD días, igual que al recibir cada reporte.
+    """
+    reportes = NuevoReporte.objects.all() if reportes is None else reportes
+
+    # Conteo por (sector, fecha) para la ventana deslizante de densidad.
+    por_sector = defaultdict(lambda: ([], []))
+    conteos = (
+        NuevoReporte.objects.exclude(estado='rechazado').exclude(sector__isnull=True).exclude(sector='')
+        .values('sector', 'fecha').annotate(cantidad=Count('id')).order_by('sector', 'fecha')
+    )
+    for fila in conteos:
+        fechas, acumulado = por_sector[fila['sector']]
+        fechas.append(fila['fecha'])
+        acumulado.append((acumulado[-1] if acumulado else 0) + fila['cantidad'])
+
+    def densidad(sector, fecha, estado):
+        if not sector or sector not in por_sector:
+            return 0
+        fechas, acumulado = por_sector[sector]
+        hasta = bisect_right(fechas, fecha)
+        desde = bisect_left(fechas, fecha - timedelta(days=DIAS_DENSIDAD) + timedelta(days=1))
+        total = (acumulado[hasta - 1] if hasta else 0) - (acumulado[desde - 1] if desde else 0)
+        # El propio reporte no cuenta.
+        return total - (0 if estado == 'rechazado' else 1)
+
+    filas = reportes.annotate(
+        con_foto=Exists(Foto.objects.filter(reporte_id=OuterRef('pk')))
+    ).values_list('id', 'gravedad', 'cantidad_perros', 'fecha', 'fecha_creacion', 'sector', 'estado', 'con_foto')
+
+    cambios = []
+    for pk, gravedad, perros, fecha, creado, sector, estado, con_foto in filas.iterator(chunk_size=lote):
+        dias = (timezone.localdate(creado) - fecha).days if creado else 0
+        cambios.append(NuevoReporte(
+            pk=pk, prioridad=puntos(gravedad, perros, con_foto, dias, densidad(sector, fecha, estado))
+        ))
+
+    with transaction.atomic():
+        NuevoReporte.objects.bulk_update(cambios, ['prioridad'], batch_size=lote)
+    return len(cambios)
@@ -1,7 +1,12 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_save, pre_delete, post_delete
+from django.db import transaction
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import PerfilUsuario
+from .models import PerfilUsuario, NuevoReporte, Foto
+from . import estadisticas, incidentes, prioridad
+from .tiempo_real import avisar_reporte_nuevo
+from .mapa import invalidar_tiles
+from .fotos import ruta_staging
 
 @receiver(post_save, sender=User)
 def crear_perfil(sender, instance, created, **kwargs):
@@ -11,3 +16,134 @@ def crear_perfil(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def guardar_perfil(sender, instance, **kwargs):
     instance.perfil.save()
+
+
+# --- Tabla resumen de estadísticas ---
+
+def cambia_estadistica(update_fields):
+    return update_fields is None or bool(set(update_fields) & set(estadisticas.CAMPOS_REPORTE))
+
+
+def cambia_guardado(update_fields):
+    """Si el guardado puede mover el reporte en la tabla resumen o en el mapa."""
+    return cambia_estadistica(update_fields) or bool(set(update_fields) & {'latitud', 'longitud'})
+
+
+@receiver(pre_save, sender=NuevoReporte)
+def recordar_guardado(sender, instance, raw, update_fields, **kwargs):
+    # Una sola lectura de la fila antes de guardar: clave resumen y ubicación anteriores.
+    instance.guardado = None
+    if not raw and not instance._state.adding and cambia_guardado(update_fields):
+        instance.guardado = estadisticas.valores_guardados(instance.pk)
+    instance.clave_estadistica = instance.guardado and estadisticas.clave_de(instance.guardado)
+
+
+@receiver(post_save, sender=NuevoReporte)
+def actualizar_estadistica(sender, instance, raw, update_fields, **kwargs):
+    if raw or not cambia_estadistica(update_fields):
+        return
+    # La clave nueva sale de la instancia; las fotos no cambian al guardar el reporte.
+    guardado = instance.guardado
+    anterior = instance.clave_estadistica
+    instance.clave_estadistica = estadisticas.clave_reporte(instance, guardado['con_foto'] if guardado else False)
+    estadisticas.mover(anterior, instance.clave_estadistica)
+
+
+# --- Tiles del mapa ---
+# La moderación en lote invalida sus propios tiles; estas señales cubren los
+# cambios hechos con save() o delete() (por ejemplo desde el admin).
+
+@receiver(post_save, sender=NuevoReporte)
+def invalidar_tiles_reporte(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    coordenadas = {(instance.latitud, instance.longitud)}
+    anterior = getattr(instance, 'guardado', None)
+    if anterior is not None:
+        coordenadas.add((anterior['latitud'], anterior['longitud']))
+    transaction.on_commit(lambda: invalidar_tiles(coordenadas))
+
+
+@receiver(post_delete, sender=NuevoReporte)
+def invalidar_tiles_borrado(sender, instance, **kwargs):
+    coordenadas = [(instance.latitud, instance.longitud)]
+    transaction.on_commit(lambda: invalidar_tiles(coordenadas))
+
+
+@receiver(pre_delete, sender=NuevoReporte)
+def recordar_estadistica_borrado(sender, instance, **kwargs):
+    instance.clave_estadistica = estadisticas.clave_guardada(instance.pk)
+
+
+@receiver(post_save, sender=NuevoReporte)
+def reasignar_incidente_rechazado(sender, instance, raw, **kwargs):
+    # Rechazado desde el admin: sus enlazados sin rechazar siguen con otro principal.
+    if not raw and instance.estado == 'rechazado' and instance.duplicado_de_id is None:
+        incidentes.reasignar_rechazados([instance.pk])
+
+
+@receiver(pre_delete, sender=NuevoReporte)
+def conservar_incidente(sender, instance, **kwargs):
+    # Si se borra el principal, el incidente sigue con el enlazado más antiguo.
+    if instance.duplicado_de_id is None:
+        incidentes.promover_principal(instance)
+
+
+@receiver(post_delete, sender=NuevoReporte)
+def descontar_estadistica(sender, instance, **kwargs):
+    clave = getattr(instance, 'clave_estadistica', None)
+    if clave is not None:
+        # Las fotos se borran en cascada antes que el reporte y sus señales
+        # ya movieron el conteo a con_foto=False.
+        estadisticas.mover({**clave, 'con_foto': False}, None)
+
+
+@receiver(post_save, sender=Foto)
+def estadistica_primera_foto(sender, instance, created, raw, **kwargs):
+    if raw or not created:
+        return
+    if Foto.objects.filter(reporte_id=instance.reporte_id).count() == 1:
+        prioridad.ajustar_foto(instance.reporte_id, True)
+        clave = estadisticas.clave_guardada(instance.reporte_id)
+        if clave is not None:
+            estadisticas.mover({**clave, 'con_foto': False}, clave)
+
+
+@receiver(pre_delete, sender=Foto)
+def recordar_primera_foto(sender, instance, **kwargs):
+    # Al borrar varias fotos juntas solo la de menor id descuenta el reporte.
+    instance.es_primera = not Foto.objects.filter(
+        reporte_id=instance.reporte_id, pk__lt=instance.pk
+    ).exists()
+
+
+@receiver(post_delete, sender=Foto)
+def borrar_staging(sender, instance, **kwargs):
+    if instance.archivo_local:
+        ruta_staging(instance.archivo_local).unlink(missing_ok=True)
+
+
+@receiver(post_delete, sender=Foto)
+def estadistica_sin_fotos(sender, instance, **kwargs):
+    if not getattr(instance, 'es_primera', False):
+        return
+    clave = estadisticas.clave_guardada(instance.reporte_id)
+    if clave is not None and not clave['con_foto']:
+        estadisticas.mover({**clave, 'con_foto': True}, clave)
+        prioridad.ajustar_foto(instance.reporte_id, False)
+
+
+# --- Prioridad de moderación ---
+
+@receiver(pre_save, sender=NuevoReporte)
+def asignar_prioridad(sender, instance, raw, **kwargs):
+    if instance._state.adding and not raw:
+        instance.prioridad = prioridad.calcular_prioridad(instance)
+
+
+# --- Panel de moderación en vivo ---
+
+@receiver(post_save, sender=NuevoReporte)
+def avisar_pendiente(sender, instance, created, raw, **kwargs):
+    if created and not raw and instance.estado == 'pendiente':
+        avisar_reporte_nuevo(instance)
@@ -0,0 +1,242 @@
+"""Recepción de las fotos de los reportes.
+
+LimiteFotosHandler se pone delante de los upload handlers de Django en
+`nuevo_reporte`: cuenta los archivos, mira los primeros bytes de cada uno y
+lleva su tamaño a medida que llegan los trozos. Un archivo que no es imagen,
+que pasa de MAX_TAMANO_FOTO o que sobra se descarta sin guardarlo en memoria
+ni en disco, y un cuerpo demasiado grande se corta antes de leerlo.
+
+Para conexiones inestables las fotos también pueden subirse antes, por
+partes, con una SesionSubida: cada trozo dice en qué byte empieza, un trozo
+perdido se reenvía desde lo que el servidor ya tiene y al completarse el
+archivo queda en FOTOS_STAGING_DIR. El formulario manda solo los tokens.
+Cada cliente (sesión de Django) puede tener a la vez hasta MAX_SUBIDAS_CLIENTE
+subidas sin usar en un reporte, y el servidor hasta MAX_SUBIDAS_TOTAL: cada
+una reserva hasta MAX_TAMANO_FOTO en disco.
+"""
+
+import hashlib
+import os
+import secrets
+from datetime import timedelta
+from pathlib import Path
+
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.http import QueryDict
+from django.utils import timezone
+from django.utils.datastructures import MultiValueDict
+from django.template.defaultfilters import filesizeformat
+
+from .fotos import ruta_staging
+from .models import SesionSubida
+
+CAMPO_FOTOS = 'fotografias'
+MAX_FOTOS = 5
+MAX_TAMANO_FOTO = 5 * 1024 * 1024
+# Margen para los campos de texto del formulario y las cabeceras multipart.
+MARGEN_CUERPO = 1024 * 1024
+# Subidas por partes: tamaño máximo de cada trozo y tiempo sin actividad antes de borrarlas.
+MAX_TAMANO_TROZO = 1024 * 1024
+VIGENCIA_SUBIDA = timedelta(hours=24)
+# Subidas sin usar por cliente (el formulario admite MAX_FOTOS, con margen para
+# fotos quitadas o reintentos) y en total.
+MAX_SUBIDAS_CLIENTE = 2 * MAX_FOTOS
+MAX_SUBIDAS_TOTAL = 1000
+
+# Firmas (desplazamiento, bytes) de los formatos que acepta el formulario.
+FIRMAS = {
+    'JPEG': [(0, b'\xff\xd8\xff')],
+    'PNG': [(0, b'\x89PNG\r\n\x1a\n')],
+    'GIF': [(0, b'GIF87a'), (0, b'GIF89a')],
+    'WEBP': [(0, b'RIFF'), (8, b'WEBP')],
+}
+
+
+def formato_imagen(cabecera):
+    """Formato según los primeros bytes del archivo, o None si no es una imagen aceptada."""
+    for formato, partes in FIRMAS.items():
+        if all(cabecera[inicio:inicio + len(firma)] == firma for inicio, firma in partes):
+            return formato
+    return None
+
+
+class LimiteFotosHandler(FileUploadHandler):
+    """Aplica los límites de fotos del formulario de reportes durante la subida.
+
+    No guarda nada: deja pasar los trozos a los handlers siguientes y anota en
+    `errores` los archivos descartados.
+    """
+
+    def __init__(self, request=None, maximo=MAX_FOTOS, tamano_maximo=MAX_TAMANO_FOTO):
+        super().__init__(request)
+        self.maximo = maximo
+        self.tamano_maximo = tamano_maximo
+        self.errores = []
+        self.recibidas = 0
+        self.activo = False
+        self.excedido = False
+
+    def cortado(self, request):
+        """Lee el cuerpo de `request` y dice si se cortó por exceder el tamaño total."""
+        request.POST
+        return self.excedido
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length > self.maximo * self.tamano_maximo + MARGEN_CUERPO:
+            self.excedido = True
+            self.errores.append(
+                f'El envío pesa {filesizeformat(content_length)}; se permiten {self.maximo} '
+                f'fotografías de hasta {filesizeformat(self.tamano_maximo)}.'
+            )
+            # Devolver el resultado evita que Django lea el cuerpo.
+            return QueryDict(encoding=encoding), MultiValueDict()
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        super().new_file(field_name, file_name, *args, **kwargs)
+        self.activo = field_name == CAMPO_FOTOS
+        if not self.activo:
+            return
+        self.recibidas += 1
+        if self.recibidas > self.maximo:
+            if self.recibidas == self.maximo + 1:
+                self.errores.append(f'Máximo {self.maximo} fotografías permitidas.')
+            raise SkipFile
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.activo:
+            return raw_data
+        if start == 0 and formato_imagen(raw_data[:16]) is None:
+            self.errores.append(f'{self.file_name} no es una imagen válida.')
+            raise SkipFile
+        if start + len(raw_data) > self.tamano_maximo:
+            self.errores.append(
+                f'{self.file_name} excede los {filesizeformat(self.tamano_maximo)} permitidos.'
+            )
+            raise SkipFile
+        return raw_data
+
+    def file_complete(self, file_size):
+        # Si el archivo llegó vacío nunca se miró su cabecera.
+        if self.activo and file_size == 0:
+            self.errores.append(f'{self.file_name} no es una imagen válida.')
+        return None
+
+
+class SubidaRechazada(Exception):
+    """Pedido inválido sobre una subida por partes; `status` es el código HTTP a responder."""
+
+    def __init__(self, mensaje, status=400, recibido=None):
+        super().__init__(mensaje)
+        self.status = status
+        self.recibido = recibido
+
+
+def ruta_parcial(sesion):
+    return ruta_staging(f'{sesion.archivo_local}.parcial')
+
+
+def iniciar_subida(nombre, tamano, cliente=''):
+    """Abre una subida por partes para un archivo de `tamano` bytes.
+
+    `cliente` es la clave de sesión de quien sube; pasado el límite de subidas
+    sin usar se rechaza con 429.
+    """
+    try:
+        tamano = int(tamano)
+    except (TypeError, ValueError):
+        raise SubidaRechazada('Indica el tamaño del archivo en bytes.')
+    if tamano <= 0:
+        raise SubidaRechazada('El archivo está vacío.')
+    if tamano > MAX_TAMANO_FOTO:
+        raise SubidaRechazada(f'{nombre} excede los {filesizeformat(MAX_TAMANO_FOTO)} permitidos.', status=413)
+
+    # Las subidas usadas por un reporte ya se borraron: las que quedan están sin usar.
+    if cliente and SesionSubida.objects.filter(cliente=cliente).count() >= MAX_SUBIDAS_CLIENTE:
+        raise SubidaRechazada(
+            f'Tienes {MAX_SUBIDAS_CLIENTE} fotografías subidas sin enviar. Envía el reporte o espera antes de subir más.',
+            status=429,
+        )
+    if SesionSubida.objects.count() >= MAX_SUBIDAS_TOTAL:
+        raise SubidaRechazada('Hay demasiadas subidas en curso. Adjunta la foto al formulario.', status=429)
+
+    extension = Path(nombre or '').suffix.lower()[:10]
+    return SesionSubida.objects.create(
+        token=secrets.token_hex(16),
+        nombre=(nombre or '')[:255],
+        tamano=tamano,
+        archivo_local=f'{secrets.token_hex(16)}{extension}',
+        cliente=cliente,
+    )
+
+
+def agregar_trozo(token, inicio, datos):
+    """Escribe `datos` a partir del byte `inicio` y devuelve la sesión actualizada.
+
+    `inicio` tiene que coincidir con lo ya recibido; si no, se rechaza con 409
+    y `recibido` indica desde dónde seguir.
+    """
+    sesion = SesionSubida.objects.filter(token=token).first()
+    if sesion is None:
+        raise SubidaRechazada('La subida no existe o ya venció.', status=404)
+    if sesion.estado == 'completa' or inicio != sesion.recibido:
+        raise SubidaRechazada('El trozo no empieza donde quedó la subida.', status=409, recibido=sesion.recibido)
+    if inicio + len(datos) > sesion.tamano:
+        raise SubidaRechazada('El trozo excede el tamaño anunciado del archivo.', status=413)
+    if not datos:
+        return sesion
+    if inicio == 0 and formato_imagen(datos[:16]) is None:
+        raise SubidaRechazada(f'{sesion.nombre} no es una imagen válida.', status=415)
+
+    parcial = ruta_parcial(sesion)
+    parcial.parent.mkdir(parents=True, exist_ok=True)
+    descriptor = os.open(parcial, os.O_WRONLY | os.O_CREAT, 0o644)
+    with os.fdopen(descriptor, 'wb') as salida:
+        salida.seek(inicio)
+        salida.write(datos)
+
+    # Compare-and-set sobre lo recibido: un reenvío simultáneo del mismo trozo no avanza dos veces.
+    recibido = inicio + len(datos)
+    if not SesionSubida.objects.filter(pk=sesion.pk, estado='abierta', recibido=inicio).update(
+        recibido=recibido, actualizada=timezone.now()
+    ):
+        sesion.refresh_from_db()
+        raise SubidaRechazada('El trozo no empieza donde quedó la subida.', status=409, recibido=sesion.recibido)
+
+    sesion.recibido = recibido
+    if recibido == sesion.tamano:
+        completar(sesion)
+    return sesion
+
+
+def completar(sesion):
+    """Deja el archivo armado en FOTOS_STAGING_DIR con su huella."""
+    parcial = ruta_parcial(sesion)
+    huella = hashlib.sha256()
+    with open(parcial, 'r+b') as archivo:
+        # Un trozo escrito dos veces pudo dejar bytes de más al final.
+        archivo.truncate(sesion.tamano)
+        for parte in iter(lambda: archivo.read(64 * 1024), b''):
+            huella.update(parte)
+    os.replace(parcial, ruta_staging(sesion.archivo_local))
+
+    sesion.huella = huella.hexdigest()
+    sesion.estado = 'completa'
+    SesionSubida.objects.filter(pk=sesion.pk).update(
+        huella=sesion.huella, estado='completa', actualizada=timezone.now()
+    )
+
+
+def sesiones_completas(tokens):
+    """Subidas completas de `tokens`, en el mismo orden; las desconocidas o a medias se omiten."""
+    tokens = list(dict.fromkeys(tokens))
+    sesiones = {s.token: s for s in SesionSubida.objects.filter(token__in=tokens, estado='completa')}
+    return [sesiones[t] for t in tokens if t in sesiones]
+
+
+def limpiar_subidas(vigencia=VIGENCIA_SUBIDA):
+    """Borra las subidas sin actividad por más de `vigencia` que ningún reporte usó, con sus archivos."""
+    viejas = SesionSubida.objects.filter(actualizada__lt=timezone.now() - vigencia)
+    for sesion in viejas:
+        ruta_parcial(sesion).unlink(missing_ok=True)
+        ruta_staging(sesion.archivo_local).unlink(missing_ok=True)
+    return viejas.delete()[0]
@@ -1,3 +1,1753 @@
-from django.test import TestCase
+import base64
+import csv
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import math
+import random
+import shutil
+import tempfile
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+import numpy as np
+from PIL import Image, ImageCms, ImageDraw
+
+from . import duplicados, estadisticas, exportacion, hotspots, prioridad
+from .almacenamiento import almacenamiento
+from .calor import calcular_capa_calor, densidad_kernel
+from .fotos import preparar_fotos, procesar_fotos, registrar_resultado, tomar_fotos
+from .imagenes import FORMATO, MAX_LADO, TAMANOS, ImagenInvalida, normalizar, procesar_imagen
+
+from .geo import METROS_POR_GRADO, ZOOM_MAXIMO, ZOOM_PUNTOS, parsear_bbox, parsear_zoom, tile_de_punto
+from .incidentes import moderar_incidente, separar
+from .mapa import acepta_gzip
+from .models import (
+    MINIATURA_ALTO, MINIATURA_ANCHO, EstadisticaReporte, ExportacionJob, Foto, Hotspot, ModeracionLog, NuevoReporte,
+    SesionSubida,
+)
+from .moderacion import liberar_reportes, moderar_reportes, reclamar_reportes
+from .paginacion import codificar_cursor, decodificar_cursor, paginar_keyset
+from .subidas import MAX_SUBIDAS_CLIENTE
+
+def crear_reporte(**campos):
+    datos = dict(
+        titulo='Ataque en la plaza',
+        fecha=datetime.date(2025, 5, 1),
+        hora=datetime.time(10, 0),
+        tipo_animal='perro',
+        cantidad_perros=2,
+        gravedad='grave',
+        descripcion='x' * 60,
+        direccion='Calle 1',
+        sector='centro',
+        latitud=Decimal('-39.814200'),
+        longitud=Decimal('-73.245900'),
+        estado='aprobado',
+    )
+    datos.update(campos)
+    return NuevoReporte.objects.create(**datos)
+
+
+def imagen_jpeg(semilla=1):
+    """Bytes de una foto JPEG con figuras al azar (reproducibles según `semilla`)."""
+    azar = random.Random(semilla)
+    imagen = Image.new('RGB', (640, 480), 'white')
+    dibujo = ImageDraw.Draw(imagen)
+    for _ in range(30):
+        x, y = azar.randint(0, 560), azar.randint(0, 400)
+        color = tuple(azar.randint(0, 255) for _ in range(3))
+        dibujo.ellipse((x, y, x + azar.randint(20, 200), y + azar.randint(20, 200)), fill=color)
+    salida = io.BytesIO()
+    imagen.save(salida, 'JPEG', quality=90)
+    return salida.getvalue()
+
+
+class CasoPrueba(TestCase):
+    """Cada prueba empieza con la caché vacía (en memoria, ver server/ejecutor_pruebas.py)."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+
+class ConCarpetasTemporales:
+    """Deja staging, MEDIA_ROOT, las exportaciones y el almacenamiento local en carpetas temporales."""
+
+    def setUp(self):
+        super().setUp()
+        carpeta = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, carpeta, ignore_errors=True)
+        self.staging = carpeta / 'staging'
+        self.media = carpeta / 'media'
+        self.exportaciones = carpeta / 'exportaciones'
+        ajustes = override_settings(
+            FOTOS_STAGING_DIR=str(self.staging),
+            MEDIA_ROOT=str(self.media),
+            EXPORTACIONES_DIR=str(self.exportaciones),
+            FOTOS_ALMACENAMIENTO='server.almacenamiento.AlmacenamientoLocal',
+        )
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        almacenamiento.cache_clear()
+        self.addCleanup(almacenamiento.cache_clear)
+
+
+def crear_moderador(nombre='moderador'):
+    usuario = User.objects.create_user(nombre, password='clave-segura')
+    usuario.perfil.rol = 'moderador'
+    usuario.perfil.save()
+    return usuario
+
+
+class TilesMapaTests(CasoPrueba):
+    zoom = 17
+
+    def ids_tile(self, lat, lon):
+        x, y = tile_de_punto(lat, lon, self.zoom)
+        respuesta = self.client.get(f'/mapa/tiles/{self.zoom}/{x}/{y}/')
+        return {f['properties']['id'] for f in respuesta.json()['features']}
+
+    def test_rechazar_desde_save_saca_el_reporte_del_tile(self):
+        reporte = crear_reporte()
+        self.assertIn(reporte.id, self.ids_tile(reporte.latitud, reporte.longitud))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reporte.estado = 'rechazado'
+            reporte.save()
+        self.assertNotIn(reporte.id, self.ids_tile(reporte.latitud, reporte.longitud))
+
+    def test_reporte_nuevo_aparece_en_tile_cacheado(self):
+        primero = crear_reporte()
+        self.assertEqual(self.ids_tile(primero.latitud, primero.longitud), {primero.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            segundo = crear_reporte(latitud=Decimal('-39.814250'))
+        self.assertEqual(self.ids_tile(primero.latitud, primero.longitud), {primero.id, segundo.id})
+
+    def mover(self, **guardar):
+        reporte = crear_reporte()
+        lejos = (Decimal('-39.850000'), Decimal('-73.200000'))
+        self.assertIn(reporte.id, self.ids_tile(reporte.latitud, reporte.longitud))
+        self.assertNotIn(reporte.id, self.ids_tile(*lejos))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            movido = NuevoReporte.objects.get(pk=reporte.pk)
+            movido.latitud, movido.longitud = lejos
+            movido.save(**guardar)
+        self.assertNotIn(reporte.id, self.ids_tile(reporte.latitud, reporte.longitud))
+        self.assertIn(reporte.id, self.ids_tile(*lejos))
+
+    def test_mover_reporte_invalida_tile_anterior_y_nuevo(self):
+        self.mover()
+
+    def test_mover_con_update_fields_invalida_tile_anterior(self):
+        self.mover(update_fields=['latitud', 'longitud'])
+
+    def test_borrar_reporte_lo_saca_del_tile(self):
+        reporte = crear_reporte()
+        lat, lon, pk = reporte.latitud, reporte.longitud, reporte.pk
+        self.assertIn(pk, self.ids_tile(lat, lon))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reporte.delete()
+        self.assertNotIn(pk, self.ids_tile(lat, lon))
+
+
+class ModerarReportesTests(CasoPrueba):
+    def setUp(self):
+        super().setUp()
+        self.moderador = crear_moderador()
+
+    def test_ids_encontrados_y_faltantes(self):
+        pendiente = crear_reporte(estado='pendiente')
+        aprobado = crear_reporte(estado='aprobado')
+        faltante = pendiente.id + aprobado.id + 100
+
+        resultados, actualizados = moderar_reportes(
+            [pendiente.id, faltante, aprobado.id], 'aprobar', self.moderador
+        )
+
+        self.assertEqual(actualizados, 1)
+        self.assertEqual(resultados, {
+            pendiente.id: 'aprobado',
+            faltante: 'no_encontrado',
+            aprobado.id: 'ya_moderado',
+        })
+        pendiente.refresh_from_db()
+        self.assertEqual(pendiente.estado, 'aprobado')
+        self.assertEqual(pendiente.moderador, self.moderador)
+
+    def test_aprobar_dos_veces(self):
+        reporte = crear_reporte(estado='pendiente')
+        self.assertEqual(moderar_reportes([reporte.id], 'aprobar', self.moderador)[0], {reporte.id: 'aprobado'})
+
+        otro = crear_moderador('otro')
+        resultados, actualizados = moderar_reportes([reporte.id], 'rechazar', otro, 'Repetido')
+        self.assertEqual((resultados, actualizados), ({reporte.id: 'ya_moderado'}, 0))
+        reporte.refresh_from_db()
+        self.assertEqual((reporte.estado, reporte.moderador), ('aprobado', self.moderador))
+
+    def test_aprobar_dos_veces_desde_la_vista_responde_409(self):
+        reporte = crear_reporte(estado='pendiente')
+        self.client.force_login(self.moderador)
+
+        self.assertEqual(self.client.post(f'/aprobar/{reporte.id}/').status_code, 200)
+        respuesta = self.client.post(f'/aprobar/{reporte.id}/')
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta.json()['status'], 'error')
+
+    def test_lote_responde_el_resultado_de_cada_id(self):
+        pendiente = crear_reporte(estado='pendiente')
+        aprobado = crear_reporte(estado='aprobado')
+        self.client.force_login(self.moderador)
+
+        respuesta = self.client.post(
+            '/moderar/lote/',
+            {'ids': [pendiente.id, aprobado.id, 9999], 'decision': 'rechazar', 'motivo': 'Sin datos'},
+            content_type='application/json',
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['actualizados'], 1)
+        self.assertEqual(respuesta.json()['resultados'], {
+            str(pendiente.id): 'rechazado',
+            str(aprobado.id): 'ya_moderado',
+            '9999': 'no_encontrado',
+        })
+
+    def test_rechazar_exige_motivo(self):
+        reporte = crear_reporte(estado='pendiente')
+        with self.assertRaises(ValueError):
+            moderar_reportes([reporte.id], 'rechazar', self.moderador, '  ')
+        reporte.refresh_from_db()
+        self.assertEqual(reporte.estado, 'pendiente')
+
+    def test_registra_un_log_por_reporte_decidido(self):
+        uno = crear_reporte(estado='pendiente')
+        dos = crear_reporte(estado='pendiente')
+        ya = crear_reporte(estado='rechazado')
+
+        moderar_reportes([uno.id, dos.id, ya.id], 'rechazar', self.moderador, 'Fuera de la comuna')
+
+        logs = ModeracionLog.objects.order_by('reporte_id')
+        self.assertEqual(
+            list(logs.values_list('reporte_id', 'moderador', 'accion', 'motivo')),
+            [
+                (uno.id, self.moderador.id, 'rechazado', 'Fuera de la comuna'),
+                (dos.id, self.moderador.id, 'rechazado', 'Fuera de la comuna'),
+            ],
+        )
+
+    def test_aprobar_usa_el_motivo_por_defecto_en_el_log(self):
+        reporte = crear_reporte(estado='pendiente')
+        moderar_reportes([reporte.id], 'aprobar', self.moderador)
+        log = ModeracionLog.objects.get(reporte=reporte)
+        self.assertEqual((log.accion, log.motivo), ('verificado', 'Aprobado por moderador'))
+
+    def test_invalida_los_tiles_al_confirmar(self):
+        reporte = crear_reporte(estado='pendiente')
+        x, y = tile_de_punto(reporte.latitud, reporte.longitud, TilesMapaTests.zoom)
+        url = f'/mapa/tiles/{TilesMapaTests.zoom}/{x}/{y}/'
+        self.assertEqual(self.client.get(url).json()['features'], [])
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            moderar_reportes([reporte.id], 'aprobar', self.moderador)
+        # Hasta que la transacción confirma, el tile cacheado sigue igual.
+        self.assertEqual(self.client.get(url).json()['features'], [])
+
+        for callback in callbacks:
+            callback()
+        ids = [f['properties']['id'] for f in self.client.get(url).json()['features']]
+        self.assertEqual(ids, [reporte.id])
+
+
+class ReclamarReportesTests(CasoPrueba):
+    def setUp(self):
+        super().setUp()
+        self.ana = crear_moderador('ana')
+        self.beto = crear_moderador('beto')
+        self.pendientes = [crear_reporte(estado='pendiente') for _ in range(6)]
+
+    def test_dos_moderadores_no_reciben_el_mismo_reporte(self):
+        de_ana = set(reclamar_reportes(self.ana, 4).values_list('id', flat=True))
+        de_beto = set(reclamar_reportes(self.beto, 4).values_list('id', flat=True))
+
+        self.assertEqual(len(de_ana), 4)
+        self.assertEqual(len(de_beto), 2)
+        self.assertFalse(de_ana & de_beto)
+        self.assertEqual(de_ana | de_beto, {r.id for r in self.pendientes})
+
+    def test_volver_a_reclamar_renueva_los_propios(self):
+        primeros = set(reclamar_reportes(self.ana, 2).values_list('id', flat=True))
+        segundos = set(reclamar_reportes(self.ana, 3).values_list('id', flat=True))
+        self.assertEqual(len(segundos), 3)
+        self.assertLess(primeros, segundos)
+
+    def test_reclamo_vencido_puede_tomarlo_otro(self):
+        vencidos = set(
+            reclamar_reportes(self.ana, 6, duracion=datetime.timedelta(seconds=-1)).values_list('id', flat=True)
+        )
+        self.assertEqual(vencidos, {r.id for r in self.pendientes})
+
+        de_beto = set(reclamar_reportes(self.beto, 6).values_list('id', flat=True))
+        self.assertEqual(de_beto, vencidos)
+        self.assertFalse(NuevoReporte.objects.filter(reclamado_por=self.ana).exists())
+
+    def test_solo_se_reclaman_pendientes(self):
+        aprobado = crear_reporte(estado='aprobado')
+        reclamados = set(reclamar_reportes(self.ana, 50).values_list('id', flat=True))
+        self.assertNotIn(aprobado.id, reclamados)
+        self.assertEqual(len(reclamados), len(self.pendientes))
+
+    def test_liberar_deja_los_reportes_para_otro(self):
+        de_ana = list(reclamar_reportes(self.ana, 6).values_list('id', flat=True))
+        self.assertFalse(reclamar_reportes(self.beto, 6).exists())
+
+        self.assertEqual(liberar_reportes(self.ana, de_ana[:2]), 2)
+        self.assertEqual(set(reclamar_reportes(self.beto, 6).values_list('id', flat=True)), set(de_ana[:2]))
+
+        self.assertEqual(liberar_reportes(self.ana), 4)
+        self.assertFalse(NuevoReporte.objects.filter(reclamado_por=self.ana).exists())
+
+    def test_liberar_no_toca_reclamos_ajenos(self):
+        de_beto = list(reclamar_reportes(self.beto, 2).values_list('id', flat=True))
+        self.assertEqual(liberar_reportes(self.ana, de_beto), 0)
+        self.assertEqual(NuevoReporte.objects.filter(reclamado_por=self.beto).count(), 2)
+
+    def test_moderar_libera_el_reclamo(self):
+        reporte = reclamar_reportes(self.ana, 1).get()
+        moderar_reportes([reporte.id], 'aprobar', self.ana)
+        reporte.refresh_from_db()
+        self.assertEqual((reporte.reclamado_por, reporte.reclamado_hasta), (None, None))
+
+
+class SubidaFotosTests(ConCarpetasTemporales, CasoPrueba):
+    def subidos(self):
+        return sorted(p.name for p in (self.media / 'fotos').iterdir())
+
+    def test_la_misma_foto_en_un_lote_se_sube_una_vez(self):
+        contenido = imagen_jpeg()
+        primero, segundo = crear_reporte(), crear_reporte()
+        [original] = preparar_fotos(primero, [SimpleUploadedFile('a.jpg', contenido)])
+        [copia] = preparar_fotos(segundo, [SimpleUploadedFile('b.jpg', contenido)])
+
+        self.assertEqual(procesar_fotos(), {'lista': 1, 'reutilizada': 1, 'reintento': 0, 'error': 0})
+        # Archivo, miniatura y vista previa de una sola foto.
+        self.assertEqual(len(self.subidos()), 3)
+
+        original.refresh_from_db()
+        copia.refresh_from_db()
+        self.assertEqual((original.estado_subida, original.duplicado_de), ('lista', None))
+        self.assertEqual((copia.estado_subida, copia.duplicado_de, copia.distancia_duplicado), ('lista', original, 0))
+        self.assertEqual(copia.archivo.public_id, original.archivo.public_id)
+        self.assertEqual(list(self.staging.iterdir()), [])
+
+    def test_foto_repetida_de_un_lote_anterior_se_reutiliza(self):
+        contenido = imagen_jpeg()
+        preparar_fotos(crear_reporte(), [SimpleUploadedFile('a.jpg', contenido)])
+        procesar_fotos()
+        preparar_fotos(crear_reporte(), [SimpleUploadedFile('b.jpg', contenido)])
+
+        self.assertEqual(procesar_fotos(), {'lista': 0, 'reutilizada': 1, 'reintento': 0, 'error': 0})
+        self.assertEqual(len(self.subidos()), 3)
+
+    def test_copias_de_un_archivo_invalido_fallan_con_el(self):
+        basura = b'\xff\xd8\xff' + b'no es una imagen' * 10
+        fotos = [
+            *preparar_fotos(crear_reporte(), [SimpleUploadedFile('a.jpg', basura)]),
+            *preparar_fotos(crear_reporte(), [SimpleUploadedFile('b.jpg', basura)]),
+        ]
+        with self.assertLogs('server.fotos', 'WARNING'):
+            conteo = procesar_fotos()
+        self.assertEqual(conteo, {'lista': 0, 'reutilizada': 0, 'reintento': 0, 'error': 2})
+        self.assertEqual({f.estado_subida for f in Foto.objects.filter(pk__in=[f.pk for f in fotos])}, {'error'})
+
+    def test_foto_lista_actualiza_mapa_y_tiles(self):
+        contenido = imagen_jpeg()
+        reporte, otro = crear_reporte(), crear_reporte(latitud=Decimal('-39.850000'))
+        preparar_fotos(reporte, [SimpleUploadedFile('a.jpg', contenido)])
+        hace_un_rato = timezone.now() - datetime.timedelta(hours=1)
+        NuevoReporte.objects.update(fecha_actualizacion=hace_un_rato)
+
+        mapa = self.client.get('/mapa/', headers={'x-requested-with': 'XMLHttpRequest'})
+        x, y = tile_de_punto(reporte.latitud, reporte.longitud, 17)
+        [antes] = self.client.get(f'/mapa/tiles/17/{x}/{y}/').json()['features']
+        self.assertEqual(antes['properties']['foto'], '')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            procesar_fotos()
+
+        reporte.refresh_from_db()
+        self.assertGreater(reporte.fecha_actualizacion, hace_un_rato)
+        nuevo = self.client.get('/mapa/', headers={'x-requested-with': 'XMLHttpRequest', 'if-none-match': mapa['ETag']})
+        self.assertEqual(nuevo.status_code, 200)
+        [despues] = self.client.get(f'/mapa/tiles/17/{x}/{y}/').json()['features']
+        self.assertTrue(despues['properties']['foto'])
+
+        # La copia que reutiliza el archivo también cuenta como cambio de su reporte.
+        preparar_fotos(otro, [SimpleUploadedFile('b.jpg', contenido)])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(procesar_fotos()['reutilizada'], 1)
+        otro.refresh_from_db()
+        self.assertGreater(otro.fecha_actualizacion, hace_un_rato)
+
+
+class FotoParecidaTests(CasoPrueba):
+    def crear_foto(self, reporte, dhash, ahash='0' * 16):
+        return Foto.objects.create(
+            reporte=reporte, estado_subida='lista', dhash=dhash, ahash=ahash, **duplicados.bandas(dhash)
+        )
+
+    def test_encuentra_la_parecida_entre_muchas_candidatas_de_banda(self):
+        otro = crear_reporte()
+        parecida = self.crear_foto(otro, '0123456789abcdef')
+        # Muchas fotos comparten la primera banda pero están lejos en el resto del hash.
+        for n in range(250):
+            self.crear_foto(otro, f'0123{n:03x}' + 'f' * 9)
+
+        nueva = Foto(reporte=crear_reporte())
+        dhash = '0123456789abcdee'
+        self.assertEqual(duplicados.foto_parecida(nueva, dhash, '0' * 16), (parecida, 1))
+
+    def test_ignora_las_del_mismo_reporte_y_las_lejanas(self):
+        reporte = crear_reporte()
+        self.crear_foto(reporte, '0123456789abcdef')
+        self.crear_foto(crear_reporte(), '0123ffffffffffff')
+        nueva = Foto(reporte=reporte)
+        self.assertIsNone(duplicados.foto_parecida(nueva, '0123456789abcdef', '0' * 16))
+
+
+class IncidenteRechazadoTests(CasoPrueba):
+    def setUp(self):
+        super().setUp()
+        self.moderador = crear_moderador()
+        self.principal = crear_reporte(estado='pendiente')
+        self.enlazado = crear_reporte(estado='aprobado', duplicado_de=self.principal)
+        self.otro = crear_reporte(estado='pendiente', duplicado_de=self.principal)
+
+    def conteos(self):
+        return {
+            estado: sum(EstadisticaReporte.objects.filter(estado=estado).values_list('total', flat=True))
+            for estado in ('pendiente', 'aprobado', 'rechazado')
+        }
+
+    def conteos_recalculados(self):
+        conteos = dict.fromkeys(('pendiente', 'aprobado', 'rechazado'), 0)
+        for clave, total in estadisticas.agrupar(NuevoReporte.objects.all()):
+            conteos[clave['estado']] += total
+        return conteos
+
+    def assertIncidente(self, principal, enlazados):
+        principal.refresh_from_db()
+        self.assertIsNone(principal.duplicado_de_id)
+        self.assertEqual(
+            set(NuevoReporte.objects.filter(duplicado_de=principal).values_list('id', flat=True)),
+            {r.id for r in enlazados},
+        )
+
+    def test_rechazar_solo_el_principal_pasa_el_incidente_al_enlazado(self):
+        moderar_reportes([self.principal.id], 'rechazar', self.moderador, 'Falso')
+
+        self.assertIncidente(self.enlazado, [self.otro])
+        self.assertIncidente(self.principal, [])
+        self.assertEqual(self.conteos(), {'pendiente': 0, 'aprobado': 1, 'rechazado': 1})
+        self.assertEqual(self.conteos(), self.conteos_recalculados())
+
+    def test_rechazar_el_incidente_completo_no_lo_reasigna(self):
+        self.enlazado.estado = 'pendiente'
+        self.enlazado.save()
+        moderar_incidente(self.otro.id, 'rechazar', self.moderador, 'Falso')
+
+        self.assertIncidente(self.principal, [self.enlazado, self.otro])
+        self.assertEqual(self.conteos(), {'pendiente': 0, 'aprobado': 0, 'rechazado': 1})
+        self.assertEqual(self.conteos(), self.conteos_recalculados())
+
+    def test_un_enlazado_rechazado_no_queda_como_principal(self):
+        principal = crear_reporte(estado='pendiente')
+        rechazado = crear_reporte(estado='rechazado', duplicado_de=principal)
+        aprobado = crear_reporte(estado='aprobado', duplicado_de=principal)
+        moderar_reportes([principal.id], 'rechazar', self.moderador, 'Falso')
+
+        self.assertIncidente(aprobado, [rechazado])
+
+    def test_rechazar_desde_save_tambien_reasigna(self):
+        self.principal.estado = 'rechazado'
+        self.principal.save()
+
+        self.assertIncidente(self.enlazado, [self.otro])
+        self.assertEqual(self.conteos(), self.conteos_recalculados())
+
+
+class LimiteFotosTests(ConCarpetasTemporales, CasoPrueba):
+    datos = dict(
+        titulo='Ataque en la plaza', fecha='2025-05-01', hora='10:00', tipo_animal='perro',
+        cantidad_perros=2, gravedad='grave', descripcion='x' * 60, direccion='Calle 1',
+        sector='centro', latitud='-39.8142', longitud='-73.2459', anonimo='on',
+    )
+
+    def enviar(self, fotos, **extra):
+        respuesta = self.client.post('/nuevo/', {**self.datos, 'fotografias': fotos}, **extra)
+        mensajes = [str(m) for m in respuesta.context['messages']] if respuesta.context else []
+        return respuesta, mensajes
+
+    def foto(self, nombre='a.jpg', contenido=None):
+        return SimpleUploadedFile(nombre, imagen_jpeg() if contenido is None else contenido, 'image/jpeg')
+
+    def archivos_en_staging(self):
+        return list(self.staging.iterdir()) if self.staging.exists() else []
+
+    def test_fotos_validas_crean_el_reporte(self):
+        respuesta, _ = self.enviar([self.foto('a.jpg'), self.foto('b.jpg')])
+        self.assertEqual(respuesta.status_code, 302)
+        reporte = NuevoReporte.objects.get()
+        self.assertEqual(reporte.fotos.count(), 2)
+        self.assertEqual(len(self.archivos_en_staging()), 2)
+
+    def test_la_sexta_foto_se_descarta(self):
+        respuesta, mensajes = self.enviar([self.foto(f'{n}.jpg') for n in range(6)])
+        self.assertEqual(len(respuesta.wsgi_request.FILES.getlist('fotografias')), 5)
+        self.assertIn('⚠️ Máximo 5 fotografías permitidas.', mensajes)
+        self.assertFalse(NuevoReporte.objects.exists())
+
+    def test_archivo_que_no_es_imagen(self):
+        respuesta, mensajes = self.enviar([self.foto('x.jpg', b'<?php echo 1; ?>' * 10)])
+        self.assertEqual(respuesta.wsgi_request.FILES.getlist('fotografias'), [])
+        self.assertEqual(mensajes, ['⚠️ x.jpg no es una imagen válida.'])
+        self.assertFalse(NuevoReporte.objects.exists())
+
+    def test_archivo_demasiado_grande(self):
+        grande = imagen_jpeg() + bytes(5 * 1024 * 1024)
+        respuesta, mensajes = self.enviar([self.foto('g.jpg', grande)])
+        self.assertEqual(respuesta.wsgi_request.FILES.getlist('fotografias'), [])
+        self.assertEqual(mensajes, ['⚠️ g.jpg excede los 5,0\xa0MB permitidos.'])
+        self.assertFalse(NuevoReporte.objects.exists())
+
+    def test_archivo_vacio(self):
+        _, mensajes = self.enviar([self.foto('v.jpg', b'')])
+        self.assertEqual(mensajes, ['⚠️ v.jpg no es una imagen válida.'])
+        self.assertFalse(NuevoReporte.objects.exists())
+
+    def test_cuerpo_demasiado_grande_no_se_lee(self):
+        # Se anuncia un cuerpo mayor al permitido: el handler corta antes de leerlo.
+        respuesta, mensajes = self.enviar([self.foto()], CONTENT_LENGTH=str(30 * 1024 * 1024))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(len(mensajes), 1)
+        self.assertIn('se permiten 5 fotografías', mensajes[0])
+        self.assertFalse(respuesta.wsgi_request.POST)
+        self.assertFalse(respuesta.wsgi_request.FILES)
+        self.assertFalse(NuevoReporte.objects.exists())
+        self.assertEqual(self.archivos_en_staging(), [])
+
+    def test_sigue_exigiendo_csrf(self):
+        cliente = self.client_class(enforce_csrf_checks=True)
+        respuesta = cliente.post('/nuevo/', {**self.datos, 'fotografias': [self.foto()]})
+        self.assertEqual(respuesta.status_code, 403)
+        self.assertFalse(NuevoReporte.objects.exists())
+
+
+class SubidaPorPartesTests(ConCarpetasTemporales, CasoPrueba):
+    def iniciar(self, contenido, cliente=None, nombre='a.jpg'):
+        return (cliente or self.client).post('/subidas/', {'nombre': nombre, 'tamano': len(contenido)})
+
+    def enviar_trozo(self, url, inicio, datos):
+        return self.client.patch(
+            url, data=datos, content_type='application/offset+octet-stream',
+            headers={'Upload-Offset': str(inicio)},
+        )
+
+    def subir(self, contenido, trozo=64 * 1024):
+        datos = self.iniciar(contenido).json()
+        for inicio in range(0, len(contenido), trozo):
+            respuesta = self.enviar_trozo(datos['url'], inicio, contenido[inicio:inicio + trozo])
+            self.assertEqual(respuesta.status_code, 200)
+        return datos['token']
+
+    def test_trozo_fuera_de_lugar_responde_409_y_se_reanuda(self):
+        contenido = imagen_jpeg()
+        mitad = len(contenido) // 2
+        datos = self.iniciar(contenido).json()
+        self.assertEqual(self.enviar_trozo(datos['url'], 0, contenido[:mitad]).status_code, 200)
+
+        # El cliente no supo si llegó el trozo y lo reenvía.
+        respuesta = self.enviar_trozo(datos['url'], 0, contenido[:mitad])
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta.json()['recibido'], mitad)
+        self.assertEqual(self.client.get(datos['url']).json()['recibido'], mitad)
+
+        respuesta = self.enviar_trozo(datos['url'], mitad, contenido[mitad:])
+        self.assertEqual(respuesta.status_code, 200)
+        sesion = SesionSubida.objects.get(token=datos['token'])
+        self.assertEqual((sesion.estado, sesion.recibido), ('completa', len(contenido)))
+        self.assertEqual(sesion.huella, hashlib.sha256(contenido).hexdigest())
+        self.assertEqual((self.staging / sesion.archivo_local).read_bytes(), contenido)
+
+    def test_trozo_que_no_empieza_como_imagen_responde_415(self):
+        datos = self.iniciar(b'x' * 100).json()
+        respuesta = self.enviar_trozo(datos['url'], 0, b'x' * 100)
+        self.assertEqual(respuesta.status_code, 415)
+        self.assertEqual(SesionSubida.objects.get(token=datos['token']).recibido, 0)
+
+    def test_un_token_sirve_para_un_solo_reporte(self):
+        token = self.subir(imagen_jpeg())
+        formulario = {**LimiteFotosTests.datos, 'fotos_subidas': token}
+
+        self.assertEqual(self.client.post('/nuevo/', formulario).status_code, 302)
+        reporte = NuevoReporte.objects.get()
+        self.assertEqual(reporte.fotos.count(), 1)
+        self.assertFalse(SesionSubida.objects.filter(token=token).exists())
+
+        respuesta = self.client.post('/nuevo/', formulario)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn(
+            '⚠️ Alguna fotografía no terminó de subirse o ya venció. Vuelve a adjuntarla.',
+            [str(m) for m in respuesta.context['messages']],
+        )
+        self.assertEqual(NuevoReporte.objects.count(), 1)
+        self.assertEqual(Foto.objects.count(), 1)
+
+    def test_limite_de_subidas_sin_usar_por_cliente(self):
+        contenido = imagen_jpeg()
+        for _ in range(MAX_SUBIDAS_CLIENTE):
+            self.assertEqual(self.iniciar(contenido).status_code, 201)
+
+        respuesta = self.iniciar(contenido)
+        self.assertEqual(respuesta.status_code, 429)
+        self.assertEqual(respuesta.json()['status'], 'error')
+        # Otro cliente no se ve afectado.
+        self.assertEqual(self.iniciar(contenido, cliente=self.client_class()).status_code, 201)
+
+    def test_enviar_el_reporte_libera_el_cupo(self):
+        for _ in range(MAX_SUBIDAS_CLIENTE - 1):
+            self.iniciar(imagen_jpeg())
+        token = self.subir(imagen_jpeg())
+        self.assertEqual(self.iniciar(imagen_jpeg()).status_code, 429)
+
+        self.client.post('/nuevo/', {**LimiteFotosTests.datos, 'fotos_subidas': token})
+        self.assertEqual(self.iniciar(imagen_jpeg()).status_code, 201)
+
+
+class ParsearBboxTests(SimpleTestCase):
+    def test_valores_validos(self):
+        self.assertEqual(parsear_bbox(' -73.3, -39.9 ,-73.2,-39.8'), (-73.3, -39.9, -73.2, -39.8))
+
+    def test_recorta_a_los_limites_del_mundo(self):
+        self.assertEqual(parsear_bbox('-200,-95,200,95'), (-180.0, -90.0, 180.0, 90.0))
+
+    def test_rechaza_entradas_invalidas(self):
+        for valor in (None, '', '1,2,3', '1,2,3,4,5', 'a,b,c,d', '-73.2,-39.8,-73.3,-39.9',
+                      'nan,nan,nan,nan', '-73.3,-39.9,inf,-39.8', '-inf,-39.9,-73.2,-39.8'):
+            with self.subTest(valor=valor), self.assertRaises(ValueError):
+                parsear_bbox(valor)
+
+    def test_zoom(self):
+        self.assertEqual(parsear_zoom('0'), 0)
+        self.assertEqual(parsear_zoom(str(ZOOM_MAXIMO)), ZOOM_MAXIMO)
+        for valor in ('', '-1', str(ZOOM_MAXIMO + 1), '3.5', 'nan'):
+            with self.subTest(valor=valor), self.assertRaises(ValueError):
+                parsear_zoom(valor)
+
+
+class MapaViewportTests(CasoPrueba):
+    bbox = '-73.30,-39.85,-73.20,-39.78'
+
+    def pedir(self, url='/mapa/', **params):
+        return self.client.get(url, params, headers={'x-requested-with': 'XMLHttpRequest'})
+
+    def test_clusters_con_zoom_bajo(self):
+        crear_reporte(gravedad='leve')
+        crear_reporte(gravedad='grave', latitud=Decimal('-39.814300'))
+        crear_reporte(estado='pendiente')
+        crear_reporte(latitud=Decimal('-39.500000'))
+
+        datos = self.pedir(bbox=self.bbox, zoom=10).json()
+        self.assertEqual(datos['modo'], 'clusters')
+        self.assertEqual([(c['total'], c['gravedad']) for c in datos['items']], [(2, 'grave')])
+
+    def test_puntos_con_zoom_alto(self):
+        reporte = crear_reporte()
+        crear_reporte(estado='rechazado')
+
+        datos = self.pedir(bbox=self.bbox, zoom=ZOOM_PUNTOS).json()
+        self.assertEqual(datos['modo'], 'puntos')
+        self.assertFalse(datos['truncado'])
+        self.assertEqual([p['id'] for p in datos['items']], [reporte.id])
+
+    def test_aplica_los_filtros_del_panel(self):
+        grave = crear_reporte(gravedad='grave')
+        crear_reporte(gravedad='leve')
+        datos = self.pedir(bbox=self.bbox, zoom=ZOOM_PUNTOS, gravedad='grave').json()
+        self.assertEqual([p['id'] for p in datos['items']], [grave.id])
+
+    def test_bbox_o_zoom_invalidos_responden_400(self):
+        for params in ({'bbox': 'nan,nan,nan,nan', 'zoom': 10}, {'bbox': '1,2,3', 'zoom': 10},
+                       {'bbox': self.bbox, 'zoom': 99}, {'bbox': self.bbox}):
+            with self.subTest(params=params):
+                respuesta = self.pedir(**params)
+                self.assertEqual(respuesta.status_code, 400)
+                self.assertEqual(respuesta.json()['status'], 'error')
+
+    def test_hotspots_con_bbox_no_finito_responde_400(self):
+        self.assertEqual(self.pedir('/mapa/hotspots/', bbox='nan,nan,nan,nan').status_code, 400)
+
+
+class AceptaGzipTests(SimpleTestCase):
+    def test_cabeceras(self):
+        casos = {
+            'gzip': True,
+            'gzip, deflate, br': True,
+            'br;q=1.0, gzip;q=0.8': True,
+            'GZIP': True,
+            '*': True,
+            '': False,
+            'identity': False,
+            'gzip;q=0': False,
+            'gzip; q=0.0, identity': False,
+            '*;q=0.5, gzip;q=0': False,
+            'x-gzip-like': False,
+            'gzip;q=abc': False,
+        }
+        for cabecera, esperado in casos.items():
+            with self.subTest(cabecera=cabecera):
+                self.assertIs(acepta_gzip(cabecera), esperado)
+
+
+class MapaCompletoTests(CasoPrueba):
+    def pedir(self, **cabeceras):
+        return self.client.get('/mapa/', headers={'x-requested-with': 'XMLHttpRequest', **cabeceras})
+
+    def test_gzip_solo_si_el_cliente_lo_acepta(self):
+        crear_reporte()
+        comprimida = self.pedir(accept_encoding='gzip, deflate')
+        self.assertEqual(comprimida['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(comprimida.content))[0]['titulo'], 'Ataque en la plaza')
+
+        rechaza = self.pedir(accept_encoding='gzip;q=0, identity')
+        self.assertFalse(rechaza.has_header('Content-Encoding'))
+        self.assertEqual(len(rechaza.json()), 1)
+        self.assertIn('Accept-Encoding', rechaza['Vary'])
+
+
+class MapaDeltaTests(CasoPrueba):
+    def pedir(self, params=None, **cabeceras):
+        return self.client.get('/mapa/', params or {}, headers={'x-requested-with': 'XMLHttpRequest', **cabeceras})
+
+    def cursor_tras_envejecer(self, *reportes):
+        """Deja `reportes` fuera del margen de `?since=` y devuelve el cursor del mapa.
+
+        El reporte del último cambio, que fija el cursor, siempre vuelve por el
+        margen de solapamiento; por eso se crea aparte un `ancla` y se devuelve.
+        """
+        hace_un_rato = timezone.now() - datetime.timedelta(hours=1)
+        NuevoReporte.objects.filter(pk__in=[r.pk for r in reportes]).update(
+            fecha_actualizacion=hace_un_rato - datetime.timedelta(hours=1)
+        )
+        ancla = crear_reporte(titulo='Ancla')
+        NuevoReporte.objects.filter(pk=ancla.pk).update(fecha_actualizacion=hace_un_rato)
+        return self.pedir()['X-Mapa-Cursor'], ancla
+
+    def test_etag_y_304_hasta_que_cambia_el_mapa(self):
+        crear_reporte()
+        primera = self.pedir()
+        self.assertEqual(primera.status_code, 200)
+        etag = primera['ETag']
+
+        self.assertEqual(self.pedir(if_none_match=etag).status_code, 304)
+        self.assertEqual(self.pedir({'formato': 'columnar'}, if_none_match=etag).status_code, 200)
+
+        crear_reporte(titulo='Otro ataque')
+        nueva = self.pedir(if_none_match=etag)
+        self.assertEqual(nueva.status_code, 200)
+        self.assertNotEqual(nueva['ETag'], etag)
+        self.assertEqual(len(nueva.json()), 2)
+
+    def test_since_devuelve_solo_los_cambios(self):
+        viejo = crear_reporte()
+        cursor, ancla = self.cursor_tras_envejecer(viejo)
+
+        nuevo = crear_reporte(titulo='Nuevo')
+        crear_reporte(estado='pendiente')
+        datos = self.pedir({'since': cursor}).json()
+
+        self.assertEqual([r['id'] for r in datos['actualizados']], [ancla.id, nuevo.id])
+        self.assertEqual(datos['eliminados'], [])
+        self.assertEqual(datos['total'], 3)
+        self.assertEqual(datos['cursor'], self.pedir()['X-Mapa-Cursor'])
+
+    def test_since_en_formato_columnar(self):
+        cursor, ancla = self.cursor_tras_envejecer(crear_reporte())
+        nuevo = crear_reporte()
+
+        datos = self.pedir({'since': cursor, 'formato': 'columnar'}).json()
+        self.assertEqual(datos['actualizados']['columnas']['id'], [ancla.id, nuevo.id])
+
+    def test_aprobado_que_se_rechaza_queda_como_eliminado(self):
+        reporte = crear_reporte()
+        cursor, ancla = self.cursor_tras_envejecer(reporte)
+
+        reporte.estado = 'rechazado'
+        reporte.fecha_moderacion = timezone.now()
+        reporte.save()
+        datos = self.pedir({'since': cursor}).json()
+
+        self.assertEqual([r['id'] for r in datos['actualizados']], [ancla.id])
+        self.assertEqual(datos['eliminados'], [reporte.id])
+        self.assertEqual(datos['total'], 1)
+
+    def test_cursor_invalido_responde_400(self):
+        crear_reporte()
+        for cursor in ('abc', '-1', '99999999999999999999999', '1' * 5000):
+            with self.subTest(cursor=cursor[:30]):
+                respuesta = self.pedir({'since': cursor})
+                self.assertEqual(respuesta.status_code, 400)
+                self.assertEqual(respuesta.json()['mensaje'], 'Cursor inválido.')
+
+
+class DensidadKernelTests(SimpleTestCase):
+    bbox = (-73.30, -39.90, -73.10, -39.75)
+
+    def area_celda_km2(self, densidad):
+        oeste, sur, este, norte = self.bbox
+        ancho = (este - oeste) * METROS_POR_GRADO * math.cos(math.radians((sur + norte) / 2)) / 1000
+        alto = (norte - sur) * METROS_POR_GRADO / 1000
+        return ancho * alto / densidad.size
+
+    def test_integra_la_cantidad_de_incidentes(self):
+        lats = np.array([-39.82, -39.83, -39.80])
+        lons = np.array([-73.20, -73.22, -73.18])
+        densidad = densidad_kernel(lats, lons, None, self.bbox, 128, 300)
+        self.assertAlmostEqual(densidad.sum() * self.area_celda_km2(densidad), 3, delta=0.03)
+
+    def test_los_pesos_escalan_la_densidad(self):
+        lats, lons = np.array([-39.82]), np.array([-73.20])
+        simple = densidad_kernel(lats, lons, None, self.bbox, 64, 300)
+        triple = densidad_kernel(lats, lons, np.array([3.0]), self.bbox, 64, 300)
+        np.testing.assert_allclose(triple, simple * 3, atol=1e-12)
+
+    def test_la_primera_fila_es_el_norte(self):
+        densidad = densidad_kernel(np.array([-39.76]), np.array([-73.20]), None, self.bbox, 64, 200)
+        fila, _ = np.unravel_index(densidad.argmax(), densidad.shape)
+        self.assertLess(fila, densidad.shape[0] // 4)
+
+    def test_sin_puntos_queda_en_cero(self):
+        densidad = densidad_kernel(np.empty(0), np.empty(0), None, self.bbox, 64, 300)
+        self.assertEqual(densidad.max(), 0)
+
+
+class CapaCalorTests(CasoPrueba):
+    def test_capa_cuantizada_de_los_aprobados(self):
+        crear_reporte(gravedad='grave')
+        crear_reporte(gravedad='leve', latitud=Decimal('-39.850000'))
+        crear_reporte(estado='pendiente')
+
+        datos = self.client.get('/mapa/calor/', {'zoom': 13}).json()
+        self.assertEqual((datos['total'], datos['banda']), (2, 'media'))
+        niveles = np.frombuffer(base64.b64decode(datos['valores']), dtype=np.uint8)
+        self.assertEqual(niveles.size, datos['filas'] * datos['columnas'])
+        self.assertEqual(niveles.max(), 255)
+
+    def test_ponderar_por_gravedad(self):
+        crear_reporte(gravedad='grave')
+        crear_reporte(gravedad='leve', latitud=Decimal('-39.850000'))
+        reportes = NuevoReporte.objects.filter(estado='aprobado')
+
+        simple = calcular_capa_calor(reportes, 64, 300, ponderar=False)
+        ponderada = calcular_capa_calor(reportes, 64, 300, ponderar=True)
+        self.assertAlmostEqual(ponderada['maximo'], simple['maximo'] * 3, delta=simple['maximo'] * 0.05)
+
+    def test_sin_reportes(self):
+        datos = calcular_capa_calor(NuevoReporte.objects.none(), 64, 300, ponderar=True)
+        self.assertEqual((datos['total'], datos['maximo']), (0, 0))
+
+
+class EstadisticasIncrementalesTests(CasoPrueba):
+    def tabla(self):
+        return sorted(
+            EstadisticaReporte.objects.values_list(*estadisticas.CAMPOS_CLAVE, 'total'),
+            key=repr,
+        )
+
+    def assertIgualAReconstruir(self):
+        incremental = self.tabla()
+        estadisticas.reconstruir()
+        self.assertEqual(incremental, self.tabla())
+
+    def test_crear_aprobar_rechazar_y_borrar(self):
+        moderador = crear_moderador()
+        uno = crear_reporte(estado='pendiente', hora=datetime.time(7, 30))
+        dos = crear_reporte(estado='pendiente', sector='', hora=None)
+        tres = crear_reporte(estado='pendiente', fecha=datetime.date(2025, 5, 4))
+        self.assertIgualAReconstruir()
+
+        moderar_reportes([uno.id], 'aprobar', moderador)
+        moderar_reportes([dos.id], 'rechazar', moderador, 'Falso')
+        self.assertIgualAReconstruir()
+
+        tres.estado = 'aprobado'
+        tres.gravedad = 'leve'
+        tres.save()
+        self.assertIgualAReconstruir()
+
+        uno.delete()
+        self.assertIgualAReconstruir()
+        self.assertEqual(sum(t[-1] for t in self.tabla()), 2)
+
+    def test_cambiar_fecha_y_hora(self):
+        reporte = crear_reporte(hora=datetime.time(10, 0))
+        reporte.fecha = '2025-06-01'
+        reporte.hora = '23:15'
+        reporte.save()
+        self.assertIgualAReconstruir()
+
+        reporte.hora = None
+        reporte.save(update_fields=['hora'])
+        self.assertIgualAReconstruir()
+
+    def test_agregar_y_borrar_fotos(self):
+        reporte = crear_reporte()
+        primera = Foto.objects.create(reporte=reporte)
+        Foto.objects.create(reporte=reporte)
+        self.assertIgualAReconstruir()
+
+        reporte.estado = 'rechazado'
+        reporte.save()
+        self.assertIgualAReconstruir()
+
+        primera.delete()
+        self.assertIgualAReconstruir()
+        reporte.fotos.all().delete()
+        self.assertIgualAReconstruir()
+        self.assertFalse(EstadisticaReporte.objects.get().con_foto)
+
+    def test_enlazar_y_separar_de_un_incidente(self):
+        principal = crear_reporte()
+        enlazado = crear_reporte(duplicado_de=principal)
+        self.assertIgualAReconstruir()
+
+        separar(enlazado)
+        self.assertIgualAReconstruir()
+        self.assertEqual(sum(t[-1] for t in self.tabla()), 2)
+
+    def test_guardar_sin_tocar_la_clave_no_consulta_la_fila(self):
+        reporte = crear_reporte()
+        reporte.titulo = 'Otro título'
+        with self.captureOnCommitCallbacks():
+            with self.assertNumQueries(1):
+                reporte.save(update_fields=['titulo'])
+            # Sin update_fields hay que leer la fila una vez para saber qué cambió.
+            with self.assertNumQueries(2):
+                reporte.save()
+
+
+class FiltrosEstadisticasTests(SimpleTestCase):
+    def test_filtros_validos(self):
+        filtros = estadisticas.filtros_estadisticas({
+            'desde': '2025-01-01', 'hasta': '2025-12-31', 'sector': 'centro',
+            'gravedad': 'grave', 'tipo_animal': 'perro',
+        })
+        self.assertEqual(filtros, {
+            'desde': datetime.date(2025, 1, 1), 'hasta': datetime.date(2025, 12, 31),
+            'sector': 'centro', 'gravedad': 'grave', 'tipo_animal': 'perro',
+        })
+
+    def test_ignora_opciones_desconocidas_y_vacios(self):
+        filtros = estadisticas.filtros_estadisticas({'desde': ' ', 'sector': 'marte', 'gravedad': 'fatal'})
+        self.assertEqual(filtros, {})
+
+    def test_fechas_invalidas(self):
+        for params in ({'desde': '01-05-2025'}, {'hasta': '2025-02-30'}, {'desde': '2025-06-01', 'hasta': '2025-05-01'}):
+            with self.subTest(params=params), self.assertRaises(ValueError):
+                estadisticas.filtros_estadisticas(params)
+
+
+class EstadisticasDatosTests(CasoPrueba):
+    def pedir(self, **params):
+        return self.client.get('/estadisticas/datos/', params)
+
+    def test_series_y_totales(self):
+        crear_reporte(gravedad='grave', hora=datetime.time(7, 0))
+        crear_reporte(gravedad='leve', fecha=datetime.date(2025, 6, 2), hora=datetime.time(22, 0))
+        crear_reporte(estado='pendiente', gravedad='grave')
+        Foto.objects.create(reporte=crear_reporte(gravedad='moderado', fecha=datetime.date(2025, 6, 3)))
+
+        datos = self.pedir().json()
+        self.assertEqual(
+            (datos['total_reportes'], datos['verificados'], datos['ataques_graves']), (4, 3, 2)
+        )
+        self.assertEqual((datos['graves'], datos['moderados'], datos['leves']), (1, 1, 1))
+        self.assertEqual(datos['meses'], ['May', 'Jun'])
+        self.assertEqual(datos['totales_mes'], [1, 2])
+        self.assertEqual(len(datos['etiquetas_horas']), len(datos['totales_horas']))
+        self.assertEqual(datos['totales_horas'], [0, 1, 1, 0, 0, 0, 1])
+        # 2025-05-01 es jueves; 2025-06-02 lunes y 2025-06-03 martes. La semana empieza el lunes.
+        self.assertEqual(datos['dias_ordenados'], ['Lun', 'Mar', 'Mié', 'Jue', 'Vie', 'Sáb', 'Dom'])
+        self.assertEqual(datos['totales_dias'], [1, 1, 0, 1, 0, 0, 0])
+        self.assertEqual(datos['sectores_ranking'], [{'sector': 'Centro', 'total': 3}])
+        self.assertEqual((datos['tasa_aprobacion'], datos['porcentaje_con_foto']), (75, 33))
+        self.assertEqual(datos['filtros'], {})
+
+    def test_filtros_aplican_a_las_series(self):
+        crear_reporte(gravedad='grave')
+        crear_reporte(gravedad='leve', fecha=datetime.date(2025, 6, 2))
+
+        datos = self.pedir(gravedad='leve').json()
+        self.assertEqual((datos['total_reportes'], datos['meses']), (1, ['Jun']))
+        self.assertEqual(datos['filtros'], {'gravedad': 'leve'})
+
+        datos = self.pedir(desde='2025-05-01', hasta='2025-05-31').json()
+        self.assertEqual((datos['total_reportes'], datos['meses']), (1, ['May']))
+
+    def test_sin_datos(self):
+        datos = self.pedir().json()
+        self.assertEqual((datos['total_reportes'], datos['tasa_aprobacion']), (0, 0))
+        self.assertEqual(datos['totales_dias'], [0] * 7)
+
+    def test_filtros_invalidos_responden_400(self):
+        for params in ({'desde': 'ayer'}, {'desde': '2025-06-01', 'hasta': '2025-05-01'}):
+            with self.subTest(params=params):
+                respuesta = self.pedir(**params)
+                self.assertEqual(respuesta.status_code, 400)
+                self.assertEqual(respuesta.json()['status'], 'error')
+
+    def test_etag_cambia_con_los_datos(self):
+        crear_reporte()
+        etag = self.pedir()['ETag']
+        self.assertEqual(self.client.get('/estadisticas/datos/', headers={'if-none-match': etag}).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            crear_reporte()
+        self.assertNotEqual(self.pedir()['ETag'], etag)
+
+
+def dbscan_directo(x, y, radio, minimo):
+    """DBSCAN de referencia con la matriz completa de distancias."""
+    cerca = (x[:, None] - x[None, :]) ** 2 + (y[:, None] - y[None, :]) ** 2 <= radio * radio
+    nucleo = cerca.sum(axis=1) >= minimo
+    etiquetas = np.full(len(x), -1)
+    grupo = 0
+    for inicio in np.nonzero(nucleo)[0]:
+        if etiquetas[inicio] >= 0:
+            continue
+        pendientes = [inicio]
+        etiquetas[inicio] = grupo
+        while pendientes:
+            actual = pendientes.pop()
+            for vecino in np.nonzero(cerca[actual] & nucleo & (etiquetas < 0))[0]:
+                etiquetas[vecino] = grupo
+                pendientes.append(vecino)
+        grupo += 1
+    for borde in np.nonzero(~nucleo)[0]:
+        vecinos = np.nonzero(cerca[borde] & nucleo)[0]
+        if len(vecinos):
+            etiquetas[borde] = etiquetas[vecinos[0]]
+    return etiquetas, nucleo
+
+
+class DbscanGrillaTests(SimpleTestCase):
+    def test_coincide_con_dbscan_directo(self):
+        rng = np.random.default_rng(7)
+        centros = rng.uniform(0, 3000, size=(6, 2))
+        puntos = np.vstack([rng.normal(c, 120, size=(40, 2)) for c in centros] + [rng.uniform(0, 3000, size=(80, 2))])
+        x, y = puntos[:, 0], puntos[:, 1]
+
+        etiquetas = hotspots.dbscan_grilla(x, y, 100.0, 5)
+        referencia, nucleo = dbscan_directo(x, y, 100.0, 5)
+
+        self.assertTrue(nucleo.any())
+        # Los núcleos forman los mismos grupos, salvo por la numeración.
+        pares = set(zip(etiquetas[nucleo].tolist(), referencia[nucleo].tolist()))
+        self.assertEqual(len(pares), len({a for a, _ in pares}))
+        self.assertEqual(len(pares), len({b for _, b in pares}))
+        # Un borde puede quedar en cualquiera de sus grupos vecinos, pero nunca como ruido.
+        np.testing.assert_array_equal(etiquetas < 0, referencia < 0)
+
+    def test_sin_puntos(self):
+        self.assertEqual(len(hotspots.dbscan_grilla(np.array([]), np.array([]), 100.0, 5)), 0)
+
+
+class HotspotsIncrementalesTests(CasoPrueba):
+    def setUp(self):
+        super().setUp()
+        self.hoy = timezone.localdate()
+        self.rng = random.Random(11)
+
+    def grupo(self, lat, lon, cantidad, dispersion=0.0008):
+        return [
+            crear_reporte(
+                fecha=self.hoy,
+                latitud=Decimal(f'{lat + self.rng.uniform(-dispersion, dispersion):.6f}'),
+                longitud=Decimal(f'{lon + self.rng.uniform(-dispersion, dispersion):.6f}'),
+            )
+            for _ in range(cantidad)
+        ]
+
+    def estado(self):
+        return {
+            frozenset(h.reportes.values_list('id', flat=True))
+            for h in Hotspot.objects.prefetch_related(None)
+        }
+
+    def assertIgualACompleto(self):
+        creados, eliminados, revisadas = hotspots.actualizar_hotspots()
+        self.assertIsNotNone(revisadas)
+        incremental = self.estado()
+        hotspots.actualizar_hotspots(completo=True)
+        self.assertEqual(incremental, self.estado())
+        return incremental
+
+    def test_incremental_coincide_con_recalculo_completo(self):
+        plaza = self.grupo(-39.8142, -73.2459, 6)
+        self.grupo(-39.8300, -73.2200, 4)
+        hotspots.actualizar_hotspots(completo=True)
+        self.assertEqual(len(self.estado()), 1)
+
+        # Un grupo nuevo lejos del existente y otro que alcanza el mínimo.
+        self.grupo(-39.8500, -73.2000, 5)
+        self.grupo(-39.8300, -73.2200, 2)
+        self.assertEqual(len(self.assertIgualACompleto()), 3)
+
+        # Un reporte rechazado deshace el hotspot de la plaza.
+        for reporte in plaza[:2]:
+            reporte.estado = 'rechazado'
+            reporte.save()
+        self.assertEqual(len(self.assertIgualACompleto()), 2)
+
+        # Mover reportes de vuelta a la plaza lo recupera.
+        for reporte in NuevoReporte.objects.filter(latitud__lt=-39.84)[:3]:
+            reporte.latitud = Decimal('-39.814200')
+            reporte.longitud = Decimal('-73.245900')
+            reporte.save()
+        self.assertEqual(len(self.assertIgualACompleto()), 2)
+
+        # Los reportes borrados también cuentan como cambio.
+        borrar = NuevoReporte.objects.filter(latitud__gt=-39.835, latitud__lt=-39.825).values_list('id', flat=True)[:2]
+        NuevoReporte.objects.filter(id__in=list(borrar)).delete()
+        self.assertEqual(len(self.assertIgualACompleto()), 1)
+
+    def test_grupos_que_se_unen(self):
+        self.grupo(-39.8142, -73.2459, 5, dispersion=0.0003)
+        self.grupo(-39.8142, -73.2400, 5, dispersion=0.0003)
+        hotspots.actualizar_hotspots(completo=True)
+        self.assertEqual(len(self.estado()), 2)
+
+        # Un puente de reportes entre ambos los convierte en un solo hotspot.
+        for paso in range(1, 8):
+            crear_reporte(fecha=self.hoy, latitud=Decimal('-39.814200'),
+                          longitud=Decimal(f'{-73.2459 + paso * 0.00074:.6f}'))
+        self.assertEqual(len(self.assertIgualACompleto()), 1)
+
+    def test_sin_cambios_no_revisa_celdas(self):
+        self.grupo(-39.8142, -73.2459, 6)
+        hotspots.actualizar_hotspots(completo=True)
+        self.assertEqual(hotspots.actualizar_hotspots(), (0, 0, 0))
+
+
+class PaginacionKeysetTests(CasoPrueba):
+    def setUp(self):
+        super().setUp()
+        # Tres reportes por día: los empates en fecha se resuelven por id.
+        self.reportes = [
+            crear_reporte(fecha=datetime.date(2025, 5, dia))
+            for dia in (1, 2, 3, 4)
+            for _ in range(3)
+        ]
+        self.esperado = sorted(self.reportes, key=lambda r: (r.fecha, r.id), reverse=True)
+        self.consulta = NuevoReporte.objects.all()
+
+    def paginar(self, **cursores):
+        return paginar_keyset(self.consulta, ('fecha', 'id'), 5, **cursores)
+
+    def test_avanza_y_retrocede_sin_saltos_ni_repetidos(self):
+        paginas = [self.paginar()]
+        while paginas[-1].has_next:
+            paginas.append(self.paginar(despues=paginas[-1].cursor_siguiente))
+
+        self.assertEqual([len(p) for p in paginas], [5, 5, 2])
+        self.assertEqual([r for p in paginas for r in p], self.esperado)
+        self.assertFalse(paginas[0].has_previous)
+        self.assertIsNone(paginas[-1].cursor_siguiente)
+
+        anterior = self.paginar(antes=paginas[2].cursor_anterior)
+        self.assertEqual(list(anterior), list(paginas[1]))
+        self.assertTrue(anterior.has_previous and anterior.has_next)
+
+        # Al llegar al principio se devuelve la primera página completa.
+        self.assertEqual(list(self.paginar(antes=paginas[1].cursor_anterior)), list(paginas[0]))
+        self.assertFalse(self.paginar(antes=paginas[1].cursor_anterior).has_previous)
+
+    def test_cursor_dentro_de_un_empate(self):
+        reporte = self.esperado[4]
+        pagina = self.paginar(despues=codificar_cursor(reporte, ('fecha', 'id')))
+        self.assertEqual(list(pagina), self.esperado[5:10])
+
+    def test_cursores_invalidos(self):
+        for cursor in ('basura', '2025-05-01', '2025-13-01_4', '2025-05-01_x', '2025-05-01_4_1'):
+            for sentido in ('despues', 'antes'):
+                with self.subTest(cursor=cursor, sentido=sentido), self.assertRaises(ValueError):
+                    self.paginar(**{sentido: cursor})
+
+    def test_decodificar_cursor(self):
+        self.assertEqual(
+            decodificar_cursor(NuevoReporte, '2025-05-01_7', ('fecha', 'id')),
+            [datetime.date(2025, 5, 1), 7],
+        )
+
+
+class PanelModeradorTests(CasoPrueba):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(crear_moderador())
+        for dia in range(1, 8):
+            crear_reporte(fecha=datetime.date(2025, 5, dia), estado='pendiente' if dia % 2 else 'aprobado')
+
+    def test_cursor_invalido_vuelve_a_la_primera_pagina(self):
+        respuesta = self.client.get('/moderador/', {'despues': 'basura'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(list(respuesta.context['reportes']), list(self.client.get('/moderador/').context['reportes']))
+
+    def test_total_filtrado_sale_de_los_contadores(self):
+        contexto = self.client.get('/moderador/').context
+        self.assertEqual((contexto['todos'], contexto['total_filtrados']), (7, 7))
+        self.assertEqual(self.client.get('/moderador/', {'estado': 'pendiente'}).context['total_filtrados'], 4)
+        self.assertEqual(self.client.get('/moderador/', {'estado': 'aprobado'}).context['total_filtrados'], 3)
+
+        # Con otros filtros no se cuenta la tabla.
+        respuesta = self.client.get('/moderador/', {'estado': 'pendiente', 'gravedad': 'grave'})
+        self.assertIsNone(respuesta.context['total_filtrados'])
+        self.assertContains(respuesta, 'id="alertContador"')
+        self.assertNotContains(respuesta, 'id="contadorReportes"')
+
+
+class PanelModeradorConsultasTests(ConCarpetasTemporales, CasoPrueba):
+    # Sesión, usuario, perfil (es_moderador), página con sus anotaciones,
+    # fotos precargadas con su duplicado y contadores.
+    CONSULTAS_PANEL = 6
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(crear_moderador())
+        self.anterior = None
+
+    def crear_con_fotos(self, cantidad):
+        for _ in range(cantidad):
+            reporte = crear_reporte(estado='pendiente')
+            crear_reporte(duplicado_de=reporte)
+            for orden in range(2):
+                self.anterior = Foto.objects.create(
+                    reporte=reporte, estado_subida='lista', orden=orden,
+                    miniatura=f'fotos/{reporte.pk}-{orden}-m.jpg', vista_previa=f'fotos/{reporte.pk}-{orden}-v.jpg',
+                    duplicado_de=self.anterior, distancia_duplicado=3 if self.anterior else None,
+                )
+
+    def consultas_panel(self):
+        with self.assertNumQueries(self.CONSULTAS_PANEL):
+            respuesta = self.client.get('/moderador/', {'estado': 'pendiente'})
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta
+
+    def test_consultas_no_dependen_de_los_reportes_ni_las_fotos(self):
+        self.crear_con_fotos(1)
+        self.consultas_panel()
+
+        self.crear_con_fotos(4)
+        respuesta = self.consultas_panel()
+        reportes = list(respuesta.context['reportes'])
+        self.assertEqual(len(reportes), 5)
+        self.assertEqual([r.total_fotos for r in reportes], [2] * 5)
+        self.assertContains(respuesta, 'class="duplicate-tag"', count=9)
+        self.assertContains(respuesta, 'Incidente: 2 reportes', count=5)
+
+
+class PrioridadTests(CasoPrueba):
+    def setUp(self):
+        super().setUp()
+        self.hoy = timezone.localdate()
+
+    def test_puntos(self):
+        self.assertEqual(prioridad.puntos('leve', 1, False, 0, 0), 105)
+        self.assertEqual(prioridad.puntos('grave', 2, True, 3, 1), 100 + 60 + 10 + 10 - 3 + 2)
+        # Perros entre 1 y MAX_PERROS, antigüedad y densidad con tope.
+        self.assertEqual(prioridad.puntos('moderado', 0, False, -4, 0), 135)
+        self.assertEqual(prioridad.puntos('moderado', 40, False, 400, 50), 130 + 25 - 30 + 20)
+
+    def test_prioridad_al_recibir(self):
+        primero = crear_reporte(fecha=self.hoy, cantidad_perros=2)
+        self.assertEqual(primero.prioridad, 170)
+
+        # Reportes del mismo sector en la ventana suben la prioridad; los rechazados no cuentan.
+        crear_reporte(fecha=self.hoy - datetime.timedelta(days=5), estado='rechazado')
+        crear_reporte(fecha=self.hoy - datetime.timedelta(days=prioridad.DIAS_DENSIDAD))
+        segundo = crear_reporte(fecha=self.hoy - datetime.timedelta(days=2), cantidad_perros=2, gravedad='leve')
+        self.assertEqual(segundo.prioridad, 110 - 2 + 2)
+
+        otro_sector = crear_reporte(fecha=self.hoy, cantidad_perros=2, sector='collico')
+        self.assertEqual(otro_sector.prioridad, 170)
+
+    def test_fotos_suman_una_sola_vez(self):
+        reporte = crear_reporte(fecha=self.hoy, cantidad_perros=2)
+        fotos = [Foto.objects.create(reporte=reporte, orden=i) for i in range(2)]
+        reporte.refresh_from_db()
+        self.assertEqual(reporte.prioridad, 180)
+
+        fotos[1].delete()
+        reporte.refresh_from_db()
+        self.assertEqual(reporte.prioridad, 180)
+        fotos[0].delete()
+        reporte.refresh_from_db()
+        self.assertEqual(reporte.prioridad, 170)
+
+    def test_recalcular(self):
+        hace_diez = self.hoy - datetime.timedelta(days=10)
+        viejo = crear_reporte(fecha=hace_diez, gravedad='leve')
+        nuevo = crear_reporte(fecha=self.hoy)
+        Foto.objects.create(reporte=nuevo)
+        NuevoReporte.objects.update(prioridad=0)
+
+        self.assertEqual(prioridad.recalcular(), 2)
+        viejo.refresh_from_db()
+        nuevo.refresh_from_db()
+        # Cada uno cuenta al otro dentro de la ventana de densidad, en su propia fecha.
+        self.assertEqual(viejo.prioridad, 110 - 10)
+        self.assertEqual(nuevo.prioridad, 170 + 10 + 2)
+
+    def test_cola_de_pendientes_por_prioridad(self):
+        self.client.force_login(crear_moderador())
+        leve = crear_reporte(estado='pendiente', gravedad='leve', fecha=self.hoy)
+        grave = crear_reporte(estado='pendiente', gravedad='grave', fecha=self.hoy - datetime.timedelta(days=1))
+        moderado = crear_reporte(estado='pendiente', gravedad='moderado', fecha=self.hoy)
+        # Misma prioridad: gana la fecha más reciente y luego el id mayor.
+        empate = crear_reporte(estado='pendiente', gravedad='leve', fecha=self.hoy)
+        NuevoReporte.objects.filter(pk=empate.pk).update(prioridad=leve.prioridad)
+        leve.refresh_from_db()
+        crear_reporte(gravedad='grave', fecha=self.hoy)
+
+        pendientes = self.client.get('/moderador/', {'estado': 'pendiente'}).context['reportes']
+        self.assertEqual([r.pk for r in pendientes], [grave.pk, moderado.pk, empate.pk, leve.pk])
+
+
+class ExportacionReportesTests(CasoPrueba):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(crear_moderador())
+        self.reportes = {
+            'leve_gato': crear_reporte(gravedad='leve', tipo_animal='gato', fecha=datetime.date(2025, 3, 1)),
+            'anonimo': crear_reporte(anonimo=True, fecha=datetime.date(2025, 4, 1)),
+            'pendiente': crear_reporte(estado='pendiente', gravedad='moderado', fecha=datetime.date(2025, 5, 1)),
+            'rechazado': crear_reporte(estado='rechazado', fecha=datetime.date(2025, 6, 1)),
+            'junio': crear_reporte(tipo_animal='otro', fecha=datetime.date(2025, 6, 30), hora=None),
+        }
+
+    def ids(self, *nombres):
+        return sorted(self.reportes[n].pk for n in nombres)
+
+    def exportar_csv(self, **params):
+        respuesta = self.client.get('/exportar/csv/', params)
+        self.assertEqual(respuesta.status_code, 200)
+        return list(csv.reader(io.StringIO(b''.join(respuesta.streaming_content).decode())))
+
+    def test_por_lotes_cruza_el_limite_de_lote(self):
+        reportes = NuevoReporte.objects.all()
+        with self.assertNumQueries(3):
+            lotes = list(exportacion.por_lotes(reportes, ('titulo',), lote=2))
+        self.assertEqual([len(l) for l in lotes], [2, 2, 1])
+        self.assertEqual([fila[0] for l in lotes for fila in l], self.ids(*self.reportes))
+
+        # Con un múltiplo exacto del lote no queda un lote vacío al final.
+        reportes = reportes.exclude(pk=self.reportes['junio'].pk)
+        with self.assertNumQueries(3):
+            self.assertEqual([len(l) for l in exportacion.por_lotes(reportes, lote=2)], [2, 2])
+
+    def test_bloques_csv(self):
+        bloques = list(exportacion.bloques_csv(NuevoReporte.objects.all(), lote=2))
+        self.assertEqual(len(bloques), 4)
+        filas = list(csv.reader(io.StringIO(''.join(bloques))))
+        self.assertEqual(filas[0], [encabezado for encabezado, _ in exportacion.COLUMNAS])
+        self.assertEqual([int(f[0]) for f in filas[1:]], self.ids(*self.reportes))
+
+        junio = dict(zip(exportacion.CAMPOS, filas[-1]))
+        self.assertEqual((junio['fecha'], junio['hora']), ('30-06-2025', ''))
+        self.assertEqual((junio['usuario__username'], junio['latitud']), ('Anónimo', '-39.814200'))
+
+    def test_filtros(self):
+        casos = [
+            ({}, list(self.reportes)),
+            ({'estado': 'todos', 'gravedad': 'all', 'animal': 'all'}, list(self.reportes)),
+            ({'estado': 'pendiente'}, ['pendiente']),
+            ({'gravedad': 'leve'}, ['leve_gato']),
+            ({'animal': 'gato'}, ['leve_gato']),
+            ({'anonimo': 'true'}, ['anonimo']),
+            ({'anonimo': 'false', 'estado': 'aprobado'}, ['leve_gato', 'junio']),
+            ({'desde': '2025-05-01'}, ['pendiente', 'rechazado', 'junio']),
+            ({'desde': '2025-04-01', 'hasta': '2025-06-01'}, ['anonimo', 'pendiente', 'rechazado']),
+        ]
+        for params, esperados in casos:
+            with self.subTest(params=params):
+                filas = self.exportar_csv(**params)
+                self.assertEqual(sorted(int(f[0]) for f in filas[1:]), self.ids(*esperados))
+
+    def test_filtros_iguales_al_panel(self):
+        for params in ({'estado': 'aprobado'}, {'gravedad': 'grave'}, {'animal': 'perro', 'anonimo': 'false'}):
+            with self.subTest(params=params):
+                panel = self.client.get('/moderador/', params).context['reportes']
+                self.assertFalse(panel.has_next)
+                filas = self.exportar_csv(**params)
+                self.assertEqual(sorted(int(f[0]) for f in filas[1:]), sorted(r.pk for r in panel))
+
+    def test_rango_de_fechas_invalido(self):
+        for params in ({'desde': '2025-13-01'}, {'hasta': 'ayer'}, {'desde': '2025-06-01', 'hasta': '2025-05-01'}):
+            with self.subTest(params=params):
+                respuesta = self.client.get('/exportar/ndjson/', params)
+                self.assertEqual(respuesta.status_code, 400)
+                self.assertEqual(respuesta.json()['status'], 'error')
+
+    def test_formato_desconocido(self):
+        self.assertEqual(self.client.get('/exportar/xlsx/').status_code, 404)
+
+    def test_requiere_moderador(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/exportar/csv/').status_code, 302)
+
+
+class FormatosExportacionTests(CasoPrueba):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(crear_moderador())
+        self.reporte = crear_reporte(
+            titulo='Perros, "sueltos"\ny agresivos', hora=datetime.time(7, 45), latitud=Decimal('-39.814201'),
+            longitud=Decimal('-73.245987'), comentario_moderacion='Revisado',
+        )
+        self.sin_hora = crear_reporte(hora=None, tipo_animal='gato', sector='collico', anonimo=True)
+
+    def descargar(self, formato):
+        respuesta = self.client.get(f'/exportar/{formato}/')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['Content-Type'], exportacion.FORMATOS[formato][0])
+        self.assertIn(f'.{formato}"', respuesta['Content-Disposition'])
+        return b''.join(respuesta.streaming_content)
+
+    def test_csv(self):
+        filas = list(csv.reader(io.StringIO(self.descargar('csv').decode('utf-8'))))
+        self.assertEqual(filas[0][:4], ['ID', 'Título', 'Descripción', 'Estado'])
+        self.assertEqual(len(filas), 3)
+        datos = dict(zip(exportacion.CAMPOS, filas[1]))
+        self.assertEqual(datos['titulo'], 'Perros, "sueltos"\ny agresivos')
+        self.assertEqual((datos['latitud'], datos['longitud']), ('-39.814201', '-73.245987'))
+        self.assertEqual((datos['fecha'], datos['hora']), ('01-05-2025', '07:45'))
+        self.assertEqual(datos['comentario_moderacion'], 'Revisado')
+        self.assertEqual(dict(zip(exportacion.CAMPOS, filas[2]))['hora'], '')
+
+    def test_ndjson(self):
+        lineas = self.descargar('ndjson').decode('utf-8').splitlines()
+        registros = [json.loads(linea) for linea in lineas]
+        self.assertEqual([r['id'] for r in registros], [self.reporte.pk, self.sin_hora.pk])
+        registro = registros[0]
+        self.assertEqual(list(registro), list(exportacion.COLUMNAS_DATOS))
+        self.assertEqual((registro['latitud'], registro['longitud']), (-39.814201, -73.245987))
+        self.assertEqual((registro['fecha'], registro['hora']), ('2025-05-01', '07:45'))
+        self.assertIs(registro['anonimo'], False)
+        self.assertIsInstance(registro['cantidad_perros'], int)
+        self.assertEqual(datetime.datetime.fromisoformat(registro['fecha_creacion']), self.reporte.fecha_creacion)
+        self.assertIsNone(registros[1]['hora'])
+        self.assertIsNone(registro['usuario'])
+
+    def test_geojson(self):
+        datos = json.loads(self.descargar('geojson'))
+        self.assertEqual(datos['type'], 'FeatureCollection')
+        feature = datos['features'][0]
+        self.assertEqual(feature['id'], self.reporte.pk)
+        # GeoJSON usa [longitud, latitud].
+        self.assertEqual(feature['geometry'], {'type': 'Point', 'coordinates': [-73.245987, -39.814201]})
+        self.assertNotIn('latitud', feature['properties'])
+        self.assertEqual(feature['properties']['tipo_animal'], 'perro')
+
+    def test_geojson_vacio_es_valido(self):
+        NuevoReporte.objects.all().delete()
+        self.assertEqual(json.loads(self.descargar('geojson')), {'type': 'FeatureCollection', 'features': []})
+
+    @skipUnless(exportacion.parquet_disponible(), 'pyarrow no está instalado')
+    def test_parquet(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        tabla = pq.read_table(io.BytesIO(self.descargar('parquet')))
+        self.assertTrue(tabla.schema.equals(exportacion.esquema_parquet(pa)))
+        self.assertEqual(tabla.num_rows, 2)
+        filas = tabla.to_pylist()
+        self.assertEqual(filas[0]['id'], self.reporte.pk)
+        self.assertEqual((filas[0]['latitud'], filas[0]['longitud']), (-39.814201, -73.245987))
+        self.assertEqual((filas[0]['fecha'], filas[0]['hora']), (datetime.date(2025, 5, 1), datetime.time(7, 45)))
+        self.assertEqual(filas[0]['fecha_creacion'], self.reporte.fecha_creacion)
+        self.assertEqual((filas[1]['hora'], filas[1]['sector'], filas[1]['anonimo']), (None, 'collico', True))
+
+    @skipUnless(exportacion.parquet_disponible(), 'pyarrow no está instalado')
+    def test_parquet_por_lotes(self):
+        import pyarrow.parquet as pq
+
+        for _ in range(3):
+            crear_reporte()
+        contenido = b''.join(exportacion.exportar(NuevoReporte.objects.all(), 'parquet', lote=2))
+        archivo = pq.ParquetFile(io.BytesIO(contenido))
+        self.assertEqual(archivo.metadata.num_row_groups, 3)
+        self.assertEqual(archivo.read().column('id').to_pylist(), sorted(NuevoReporte.objects.values_list('id', flat=True)))
+
+
+class ExportacionesEnSegundoPlanoTests(ConCarpetasTemporales, CasoPrueba):
+    def setUp(self):
+        super().setUp()
+        self.moderador = crear_moderador()
+        crear_reporte()
+        crear_reporte(gravedad='leve')
+
+    def solicitar(self, formato='csv', **params):
+        return exportacion.solicitar_exportacion(self.moderador, formato, params)
+
+    def tomar(self, formato):
+        self.solicitar(formato)
+        return exportacion.tomar_exportacion()
+
+    def envejecer(self, trabajo, **campos):
+        ExportacionJob.objects.filter(pk=trabajo.pk).update(**campos)
+        trabajo.refresh_from_db()
+
+    def test_reutiliza_pedidos_iguales(self):
+        trabajo, reutilizado = self.solicitar(gravedad='leve', estado='todos')
+        self.assertFalse(reutilizado)
+        self.assertEqual(trabajo.filtros, {'gravedad': 'leve'})
+
+        self.assertEqual(self.solicitar(gravedad='leve', animal='all'), (trabajo, True))
+        self.assertFalse(self.solicitar('ndjson', gravedad='leve')[1])
+        self.assertFalse(self.solicitar(gravedad='grave')[1])
+
+        # Un archivo listo se reutiliza solo dentro de la ventana.
+        exportacion.generar_exportacion(exportacion.tomar_exportacion())
+        self.assertEqual(self.solicitar(gravedad='leve'), (trabajo, True))
+        self.envejecer(trabajo, terminado=timezone.now() - exportacion.VENTANA_REUTILIZACION - datetime.timedelta(seconds=1))
+        nuevo, reutilizado = self.solicitar(gravedad='leve')
+        self.assertFalse(reutilizado)
+        self.assertNotEqual(nuevo.pk, trabajo.pk)
+
+    def test_no_reutiliza_errores(self):
+        trabajo, _ = self.solicitar()
+        self.envejecer(trabajo, estado='error', terminado=timezone.now())
+        self.assertFalse(self.solicitar()[1])
+
+    def test_pedidos_invalidos(self):
+        for formato, params in (('xlsx', {}), ('csv', {'desde': 'ayer'}), ('csv', {'desde': '2025-06-01', 'hasta': '2025-05-01'})):
+            with self.subTest(formato=formato, params=params), self.assertRaises(ValueError):
+                self.solicitar(formato, **params)
+        self.assertFalse(ExportacionJob.objects.exists())
+
+    def test_toma_la_mas_antigua_una_sola_vez(self):
+        primero, _ = self.solicitar()
+        segundo, _ = self.solicitar('ndjson')
+
+        self.assertEqual(exportacion.tomar_exportacion().pk, primero.pk)
+        tomado = exportacion.tomar_exportacion()
+        self.assertEqual((tomado.pk, tomado.estado), (segundo.pk, 'procesando'))
+        self.assertIsNone(exportacion.tomar_exportacion())
+
+    def test_reclama_trabajos_abandonados(self):
+        trabajo, _ = self.solicitar()
+        exportacion.tomar_exportacion()
+        self.envejecer(trabajo, iniciado=timezone.now() - datetime.timedelta(minutes=30))
+        self.assertIsNone(exportacion.tomar_exportacion())
+
+        abandonado = timezone.now() - exportacion.TIEMPO_MAXIMO_PROCESO - datetime.timedelta(minutes=1)
+        self.envejecer(trabajo, iniciado=abandonado)
+        reclamado = exportacion.tomar_exportacion()
+        self.assertEqual(reclamado.pk, trabajo.pk)
+        self.assertGreater(reclamado.iniciado, abandonado)
+
+    def test_genera_en_un_parcial_y_lo_renombra(self):
+        self.solicitar(gravedad='grave')
+        trabajo = exportacion.tomar_exportacion()
+        exportar = exportacion.exportar
+        vistos = []
+
+        def exportar_vigilado(reportes, formato, lote):
+            for bloque in exportar(reportes, formato, lote):
+                vistos.append(sorted(p.name for p in self.exportaciones.iterdir()))
+                yield bloque
+
+        with mock.patch.object(exportacion, 'exportar', exportar_vigilado):
+            exportacion.generar_exportacion(trabajo)
+
+        trabajo.refresh_from_db()
+        final = exportacion.ruta_archivo(trabajo)
+        self.assertEqual(vistos[-1], [final.name + '.parcial'])
+        self.assertEqual(sorted(p.name for p in self.exportaciones.iterdir()), [final.name])
+        self.assertEqual((trabajo.estado, trabajo.filas, trabajo.tamano), ('listo', 1, final.stat().st_size))
+        self.assertEqual(len(final.read_text(encoding='utf-8').splitlines()), 2)
+
+        respuesta = self.client.get(f'/exportaciones/{trabajo.pk}/')
+        self.assertEqual(respuesta.status_code, 302)
+        self.client.force_login(self.moderador)
+        datos = self.client.get(f'/exportaciones/{trabajo.pk}/').json()
+        self.assertEqual(datos['url_descarga'], f'/exportaciones/{trabajo.pk}/descargar/')
+        descarga = self.client.get(datos['url_descarga'])
+        self.assertEqual(b''.join(descarga.streaming_content), final.read_bytes())
+
+    def test_error_deja_el_trabajo_en_error(self):
+        self.solicitar()
+        trabajo = exportacion.tomar_exportacion()
+
+        def exportar_roto(reportes, formato, lote):
+            yield 'ID\n'
+            raise OSError('Disco lleno')
+
+        with mock.patch.object(exportacion, 'exportar', exportar_roto), self.assertRaises(OSError):
+            exportacion.generar_exportacion(trabajo)
+
+        trabajo.refresh_from_db()
+        self.assertEqual((trabajo.estado, trabajo.error), ('error', 'Disco lleno'))
+        self.assertIsNotNone(trabajo.terminado)
+        self.assertEqual(list(self.exportaciones.iterdir()), [])
+
+        self.client.force_login(self.moderador)
+        self.assertEqual(self.client.get(f'/exportaciones/{trabajo.pk}/descargar/').status_code, 404)
+        self.assertEqual(self.client.get(f'/exportaciones/{trabajo.pk}/').json()['estado'], 'error')
+
+    def test_limpieza_por_retencion(self):
+        viejo = exportacion.generar_exportacion(self.tomar('csv'))
+        reciente = exportacion.generar_exportacion(self.tomar('ndjson'))
+        fallido, _ = self.solicitar('geojson')
+        pendiente, _ = self.solicitar('csv', gravedad='leve')
+
+        antiguo = timezone.now() - exportacion.RETENCION_EXPORTACIONES - datetime.timedelta(hours=1)
+        self.envejecer(viejo, terminado=antiguo)
+        self.envejecer(fallido, estado='error', terminado=antiguo)
+        self.envejecer(pendiente, creado=antiguo)
+
+        self.assertEqual(exportacion.limpiar_exportaciones(), 2)
+        self.assertEqual(
+            set(ExportacionJob.objects.values_list('id', flat=True)), {reciente.pk, pendiente.pk}
+        )
+        self.assertFalse(exportacion.ruta_archivo(viejo).exists())
+        self.assertTrue(exportacion.ruta_archivo(reciente).exists())
+
+
+def mitades(ancho, alto, modo='RGB'):
+    """Imagen con la mitad izquierda roja y la derecha azul."""
+    imagen = Image.new(modo, (ancho, alto), 'blue')
+    ImageDraw.Draw(imagen).rectangle((0, 0, ancho // 2 - 1, alto), fill='red')
+    return imagen
+
+
+class ProcesarImagenTests(SimpleTestCase):
+    def setUp(self):
+        carpeta = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, carpeta, ignore_errors=True)
+        self.carpeta = carpeta
+
+    def guardar(self, imagen, nombre='foto.jpg', **opciones):
+        ruta = self.carpeta / nombre
+        imagen.save(ruta, **opciones)
+        return ruta
+
+    def assertColor(self, imagen, punto, color):
+        self.assertTrue(all(abs(a - b) < 40 for a, b in zip(imagen.getpixel(punto), color)), imagen.getpixel(punto))
+
+    def test_endereza_segun_exif(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # La cámara estaba girada: hay que rotar 90° en sentido horario.
+        ruta = self.guardar(mitades(400, 200), exif=exif, quality=95)
+
+        resultado = procesar_imagen(ruta)
+        self.assertEqual((resultado['ancho'], resultado['alto']), (200, 400))
+        with Image.open(resultado['archivo']) as imagen:
+            self.assertEqual(imagen.size, (200, 400))
+            imagen = imagen.convert('RGB')
+            self.assertColor(imagen, (100, 20), (255, 0, 0))
+            self.assertColor(imagen, (100, 380), (0, 0, 255))
+
+        # Enderezada, tiene los mismos hashes que la foto tomada derecha.
+        derecha = procesar_imagen(self.guardar(mitades(400, 200).rotate(-90, expand=True), 'derecha.jpg', quality=95))
+        self.assertEqual((resultado['dhash'], resultado['ahash']), (derecha['dhash'], derecha['ahash']))
+
+    def test_quita_los_metadatos(self):
+        exif = Image.Exif()
+        exif[0x010F] = 'Cámara'
+        exif[0x8825] = {1: 'S', 2: (39.0, 48.0, 51.0)}  # GPS
+        perfil = ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes()
+        ruta = self.guardar(mitades(300, 200), exif=exif, icc_profile=perfil)
+        with Image.open(ruta) as original:
+            self.assertTrue(original.getexif())
+
+        resultado = procesar_imagen(ruta)
+        for campo in ('archivo', *TAMANOS):
+            with self.subTest(campo=campo), Image.open(resultado[campo]) as imagen:
+                self.assertFalse(imagen.getexif())
+                self.assertNotIn('exif', imagen.info)
+                self.assertNotIn('icc_profile', imagen.info)
+
+    def test_limita_el_lado_mayor(self):
+        resultado = procesar_imagen(self.guardar(mitades(4000, 1000)))
+        self.assertEqual((resultado['ancho'], resultado['alto']), (MAX_LADO, MAX_LADO // 4))
+
+        # Las chicas no se agrandan.
+        resultado = procesar_imagen(self.guardar(mitades(300, 200), 'chica.jpg'))
+        self.assertEqual((resultado['ancho'], resultado['alto']), (300, 200))
+
+    def test_tamanos_fijos(self):
+        resultado = procesar_imagen(self.guardar(mitades(3000, 1500)))
+        with Image.open(resultado['miniatura']) as miniatura:
+            self.assertEqual(miniatura.size, (MINIATURA_ANCHO, MINIATURA_ALTO))
+        with Image.open(resultado['vista_previa']) as vista_previa:
+            self.assertEqual(vista_previa.size, (1024, 512))
+        self.assertEqual(
+            {resultado[c].name for c in ('archivo', *TAMANOS)},
+            {f'foto.{nombre}{resultado["archivo"].suffix}' for nombre in ('normal', *TAMANOS)},
+        )
+
+    def test_transparencia(self):
+        # JPEG no admite transparencia; WebP la conserva.
+        self.assertEqual(normalizar(mitades(50, 50, 'RGBA')).mode, 'RGBA' if FORMATO == 'WEBP' else 'RGB')
+        self.assertEqual(normalizar(mitades(50, 50, 'L')).mode, 'RGB')
+
+    def test_archivo_que_no_es_imagen(self):
+        ruta = self.carpeta / 'basura.jpg'
+        ruta.write_bytes(b'\xff\xd8\xff' + b'no es una imagen' * 10)
+        with self.assertRaises(ImagenInvalida):
+            procesar_imagen(ruta)
+
+    def test_imagen_truncada(self):
+        contenido = imagen_jpeg()
+        ruta = self.carpeta / 'cortada.jpg'
+        ruta.write_bytes(contenido[:len(contenido) // 2])
+        with self.assertRaises(ImagenInvalida):
+            procesar_imagen(ruta)
+
+
+class RegistrarResultadoTests(ConCarpetasTemporales, CasoPrueba):
+    def tomar(self):
+        preparar_fotos(crear_reporte(), [SimpleUploadedFile('a.jpg', imagen_jpeg())])
+        [foto] = tomar_fotos()
+        return foto
+
+    def test_imagen_invalida_no_se_reintenta(self):
+        foto = self.tomar()
+        self.assertEqual(registrar_resultado(foto, error=ImagenInvalida('No es una imagen válida: x')), 'error')
+        foto.refresh_from_db()
+        self.assertEqual((foto.estado_subida, foto.intentos_subida), ('error', 1))
+        self.assertEqual(foto.error_subida, 'No es una imagen válida: x')
+        self.assertIsNone(foto.proximo_intento)
+
+    def test_otros_errores_se_reintentan(self):
+        foto = self.tomar()
+        self.assertEqual(registrar_resultado(foto, error=OSError('Sin conexión')), 'reintento')
+        foto.refresh_from_db()
+        self.assertEqual((foto.estado_subida, foto.intentos_subida), ('pendiente', 1))
+        self.assertGreater(foto.proximo_intento, timezone.now())
+
+    def test_resultado_de_una_foto_que_tomo_otro_worker_se_descarta(self):
+        foto = self.tomar()
+        Foto.objects.filter(pk=foto.pk).update(proximo_intento=timezone.now())
+        registrar_resultado(foto, error=ImagenInvalida('x'))
+        foto.refresh_from_db()
+        self.assertEqual((foto.estado_subida, foto.intentos_subida), ('subiendo', 0))
@@ -0,0 +1,85 @@
+"""Avisos en vivo al panel de moderación a través de la capa de canales.
+
+Los avisos se envían al confirmar la transacción, así un panel nunca ve un
+reporte o una decisión que después se deshizo. Si la capa no está disponible
+solo se registra el error: la moderación no depende de los avisos.
+"""
+
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+GRUPO_MODERACION = 'moderacion'
+
+
+def enviar(tipo, datos):
+    capa = get_channel_layer()
+    if capa is None:
+        return
+    try:
+        async_to_sync(capa.group_send)(GRUPO_MODERACION, {'type': tipo, 'datos': datos})
+    except Exception:
+        logger.exception('No se pudo avisar al panel de moderación.')
+
+
+def avisar_moderadores(tipo, datos):
+    """Envía `datos` a todos los paneles abiertos cuando se confirme la transacción actual."""
+    transaction.on_commit(lambda: enviar(tipo, datos))
+
+
+def datos_reporte(reporte):
+    return {
+        'id': reporte.id,
+        'titulo': reporte.titulo,
+        'fecha': str(reporte.fecha) if reporte.fecha else None,
+        'hora': str(reporte.hora)[:5] if reporte.hora else None,
+        'gravedad': reporte.gravedad,
+        'gravedad_display': reporte.get_gravedad_display(),
+        'tipo_animal': reporte.tipo_animal,
+        'sector': reporte.get_sector_display() if reporte.sector else None,
+        'anonimo': reporte.anonimo,
+        'prioridad': reporte.prioridad,
+        'incidente': reporte.duplicado_de_id,
+    }
+
+
+def avisar_reporte_nuevo(reporte):
+    avisar_moderadores('reporte.nuevo', datos_reporte(reporte))
+
+
+def avisar_moderados(anteriores, estado, moderador):
+    """`anteriores` es {id: estado anterior} de los reportes que cambiaron a `estado`."""
+    avisar_moderadores('reportes.moderados', {
+        'reportes': [{'id': i, 'anterior': anterior} for i, anterior in anteriores.items()],
+        'estado': estado,
+        'moderador': moderador.get_username() if moderador else None,
+    })
+
+
+def avisar_reclamados(ids, moderador, hasta):
+    """Reclamo (o liberación, con `moderador` None) de reportes pendientes."""
+    if ids:
+        avisar_moderadores('reportes.reclamados', {
+            'ids': ids,
+            'moderador': moderador.get_username() if moderador else None,
+            'hasta': hasta.isoformat() if hasta else None,
+        })
+
+
+@register(Tags.compatibility, deploy=True)
+def revisar_capa_canales(app_configs, **kwargs):
+    """En producción los avisos tienen que cruzar procesos: la capa en memoria no sirve."""
+    backend = settings.CHANNEL_LAYERS.get('default', {}).get('BACKEND', '')
+    if backend != 'channels.layers.InMemoryChannelLayer':
+        return []
+    return [Warning(
+        'El panel de moderación en vivo usa la capa de canales en memoria.',
+        hint='Define REDIS_URL para usar channels_redis; con varios procesos los avisos se pierden.',
+        id='server.W001',
+    )]
@@ -6,10 +6,15 @@ urlpatterns = [
 
     path('', views.index, name='index'),
     path('estadisticas/', views.estadisticas, name='estadisticas'),
+    path('estadisticas/datos/', views.estadisticas_datos, name='estadisticas_datos'),
     path('detalle_reporte_mapa/<int:id>/', views.detalle, name='detalle_reporte_mapa'),
     path('nuevo/', views.nuevo_reporte, name='nuevo_reporte'),
     path('estadisticas/', views.estadisticas, name='estadisticas'),
     path('mapa/', views.mapa, name='mapa'),
+    path('mapa/recientes/', views.mapa_recientes, name='mapa_recientes'),
+    path('mapa/calor/', views.mapa_calor, name='mapa_calor'),
+    path('mapa/hotspots/', views.mapa_hotspots, name='mapa_hotspots'),
+    path('mapa/tiles/<int:z>/<int:x>/<int:y>/', views.mapa_tile, name='mapa_tile'),
     path('contacto/', views.contacto, name='contacto'),
     path('ayuda/', views.ayuda, name='ayuda'),
     path('acerca/', views.acerca, name='acerca'),
@@ -33,11 +38,22 @@ urlpatterns = [
     path("api/check-email/", views.check_email, name="check_email"),
 
 
+    path('subidas/', views.iniciar_subida_foto, name='iniciar_subida_foto'),
+    path('subidas/<str:token>/', views.subir_foto_por_partes, name='subir_foto_por_partes'),
     path('moderador/', views.panel_moderador, name='panel_moderador'),
     path('detalles/<int:id>/', views.detalles_reporte, name='detalles_reporte'),
     path('aprobar/<int:id>/', views.aprobar_reporte, name='aprobar_reporte'),
     path('rechazar/<int:id>/', views.rechazar_reporte, name='rechazar_reporte'),
+    path('moderar/lote/', views.moderar_lote, name='moderar_lote'),
+    path('moderar/reclamar/', views.reclamar_siguientes, name='reclamar_siguientes'),
+    path('moderar/liberar/', views.liberar_reclamos, name='liberar_reclamos'),
+    path('moderar/incidente/<int:id>/', views.moderar_incidente_view, name='moderar_incidente'),
+    path('moderar/separar/<int:id>/', views.separar_reporte, name='separar_reporte'),
     path('exportar_csv/', views.exportar_csv, name='exportar_csv'),
+    path('exportar/<str:formato>/', views.exportar_reportes, name='exportar_reportes'),
+    path('exportaciones/', views.solicitar_exportacion_view, name='solicitar_exportacion'),
+    path('exportaciones/<int:id>/', views.estado_exportacion, name='estado_exportacion'),
+    path('exportaciones/<int:id>/descargar/', views.descargar_exportacion, name='descargar_exportacion'),
 
 
     path('usuarios/', views.usuarios_list, name='usuarios_list'),
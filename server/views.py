@@ -1,26 +1,48 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
-from django.db.models import Count, Q
+from django.http import JsonResponse, HttpResponse, Http404, StreamingHttpResponse, FileResponse
+from django.db.models import Count, Q, Sum
 from django.db.models.functions import TruncMonth, TruncDate, ExtractHour, ExtractWeekDay
 from django.utils.dateformat import DateFormat
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import User, Group
 from django.contrib.auth import logout
 from .models import *
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
 from datetime import datetime, timedelta
 from django.utils import timezone
-import csv
 from django.contrib.auth import authenticate, login
 from .forms import *
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from .geo import parsear_bbox, parsear_zoom, tile_valido
+from .mapa import (
+    datos_viewport, filtrar_reportes_mapa, tile_geojson, mapa_completo,
+    version_mapa, etag_mapa, cursor_mapa, parsear_cursor, delta_mapa, recientes_mapa, acepta_gzip,
+    TILE_MAX_AGE, TILE_STALE_WHILE_REVALIDATE,
+)
+from .calor import capa_calor, clave_calor
+from .paginacion import paginar_keyset
+from .fotos import preparar_fotos
+from .subidas import (
+    LimiteFotosHandler, SubidaRechazada, agregar_trozo, iniciar_subida, sesiones_completas,
+    MAX_FOTOS, MAX_TAMANO_TROZO,
+)
+from .exportacion import (
+    filtros_reportes, exportar, parquet_disponible, solicitar_exportacion, ruta_archivo, FORMATOS,
+)
+from .moderacion import moderar_reportes, reclamar_reportes, liberar_reportes, MAX_LOTE_MODERACION
+from .incidentes import buscar_principal, moderar_incidente, separar
+from .tiempo_real import datos_reporte
+from .estadisticas import (
+    series_estadisticas, filtros_estadisticas, datos_estadisticas, ESTADISTICAS_MAX_AGE,
+)
+from django.utils.http import http_date
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+import hashlib
 import json
 
-
 def index(request):
     """Página principal: muestra reportes verificados y estadísticas."""
     if request.user.is_authenticated and not request.session.get("bienvenida_mostrada"):
@@ -37,24 +59,19 @@ def index(request):
 
         request.session["bienvenida_mostrada"] = True
 
-    reportes = NuevoReporte.objects.filter(estado='aprobado').order_by('-fecha_creacion')
-
-    total_reportes = NuevoReporte.objects.count()
-    total_verificados = NuevoReporte.objects.filter(estado='aprobado').count()
-    total_pendientes = NuevoReporte.objects.filter(estado='pendiente').count()
-
     hoy = timezone.now().date()
-    total_mes = NuevoReporte.objects.filter(
-        fecha__year=hoy.year,
-        fecha__month=hoy.month
-    ).count()
+    totales = NuevoReporte.objects.aggregate(
+        total_reportes=Count('id'),
+        total_verificados=Count('id', filter=Q(estado='aprobado')),
+        total_pendientes=Count('id', filter=Q(estado='pendiente')),
+        total_mes=Count('id', filter=Q(fecha__year=hoy.year, fecha__month=hoy.month)),
+    )
 
     contexto = {
-        'reportes': reportes,
-        'total_reportes': total_reportes,
-        'total_verificados': total_verificados,
-        'total_pendientes': total_pendientes,
-        'total_mes': total_mes,
+        'total_reportes': totales['total_reportes'],
+        'total_verificados': totales['total_verificados'],
+        'total_pendientes': totales['total_pendientes'],
+        'total_mes': totales['total_mes'],
     }
 
     return render(request, 'index.html', contexto)
@@ -62,7 +79,7 @@ def index(request):
 def detalle(request, id):
     """Vista detallada de un reporte individual."""
     reporte = get_object_or_404(NuevoReporte, id=id)
-    fotos = reporte.fotos.all()
+    fotos = reporte.fotos.filter(estado_subida='lista')
     return render(request, 'detalle.html', {'reporte': reporte, 'fotos': fotos})
 
 def contacto(request):
@@ -105,23 +122,41 @@ def cerrar_sesion(request):
     logout(request)
     return redirect('login')
 
+@csrf_exempt
 def nuevo_reporte(request):
-    """Vista para crear un nuevo reporte con soporte de anonimato y máximo 5 imágenes."""
-    
+    """Vista para crear un nuevo reporte con soporte de anonimato y máximo 5 imágenes.
+
+    Las fotos se controlan mientras llegan (ver server/subidas.py). El handler
+    tiene que instalarse antes de que CsrfViewMiddleware lea request.POST, por
+    eso el CSRF se revisa en `_nuevo_reporte`.
+    """
+    limite = None
+    if request.method == 'POST':
+        limite = LimiteFotosHandler(request)
+        request.upload_handlers.insert(0, limite)
+        if limite.cortado(request):
+            # El cuerpo no se leyó (ni el token CSRF): solo se informa el error.
+            for error in limite.errores:
+                messages.error(request, f'⚠️ {error}')
+            return render(request, 'nuevo_reporte.html', {'form': NuevoReporteForm(), 'title': 'Nuevo Reporte'})
+    return _nuevo_reporte(request, limite)
+
+
+@csrf_protect
+def _nuevo_reporte(request, limite):
     if request.method == 'POST':
         form = NuevoReporteForm(request.POST, request.FILES)
         
         fotografias = request.FILES.getlist('fotografias')
+        # Fotos subidas antes por partes (ver subir_foto_por_partes).
+        tokens = request.POST.getlist('fotos_subidas')
+        sesiones = sesiones_completas(tokens)
         
-        imagen_errors = []
-        if len(fotografias) > 5:
-            imagen_errors.append('Máximo 5 fotografías permitidas.')
-        
-        for foto in fotografias:
-            if foto.size > 5 * 1024 * 1024:
-                imagen_errors.append(f'{foto.name} excede los 5MB permitidos.')
-            if not foto.content_type.startswith('image/'):
-                imagen_errors.append(f'{foto.name} no es una imagen válida.')
+        imagen_errors = list(limite.errores)
+        if len(fotografias) + len(sesiones) > MAX_FOTOS:
+            imagen_errors.append(f'Máximo {MAX_FOTOS} fotografías permitidas.')
+        if len(sesiones) < len(set(tokens)):
+            imagen_errors.append('Alguna fotografía no terminó de subirse o ya venció. Vuelve a adjuntarla.')
         
         if imagen_errors:
             for error in imagen_errors:
@@ -142,14 +177,12 @@ def nuevo_reporte(request):
                 reporte.email_reportante = None
                 reporte.telefono_reportante = None
             
+            # Si otro vecino ya reportó el mismo ataque, se enlaza a ese incidente.
+            reporte.duplicado_de = buscar_principal(reporte)
             reporte.save()
             
-            for idx, foto in enumerate(fotografias[:5], start=1):
-                Foto.objects.create(
-                    reporte=reporte,
-                    archivo=foto,
-                    orden=idx
-                )
+            # Las fotos quedan en espera; el comando subir_fotos las sube a Cloudinary.
+            preparar_fotos(reporte, fotografias, sesiones)
             
             if reporte.anonimo:
                 messages.success(
@@ -262,245 +295,284 @@ def mapa(request):
     )
 
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        data = []
-        for r in reportes:
+        if 'bbox' in request.GET:
             try:
-                data.append({
-                    'id': r.id,
-                    'titulo': r.titulo,
-                    'descripcion': r.descripcion,
-                    'tipo_animal': r.tipo_animal,
-                    'cantidad_perros': r.cantidad_perros,
-                    'gravedad': r.gravedad,
-                    'hora': r.hora.strftime('%H:%M') if r.hora else '',
-                    'gravedad': r.gravedad,
-                    'sector': r.get_sector_display() if r.sector else 'Sin sector',
-                    'comuna': r.get_sector_display() if r.sector else 'Sin sector',
-                    'fecha': r.fecha.strftime('%d/%m/%Y'),  
-                    'lat': float(r.latitud),
-                    'lon': float(r.longitud),
-                    'direccion': r.direccion,
-                    'foto': r.fotos.first().archivo.url if r.fotos.exists() else '',
-                })
-            except Exception as e:
-                print(f"Error en reporte {r.id}: {e}")
-                continue 
-
-        print(f"✅ Enviando {len(data)} reportes al frontend") 
-        return JsonResponse(data, safe=False)
+                bbox = parsear_bbox(request.GET.get('bbox'))
+                zoom = parsear_zoom(request.GET.get('zoom', ''))
+            except ValueError as e:
+                return JsonResponse({'status': 'error', 'mensaje': str(e)}, status=400)
+
+            reportes = filtrar_reportes_mapa(reportes, request.GET)
+            return JsonResponse(datos_viewport(reportes, bbox, zoom))
+
+        formato = 'columnar' if request.GET.get('formato') == 'columnar' else 'lista'
+        since = request.GET.get('since')
+        version = version_mapa()
+        ultima, total = version
+
+        etag = etag_mapa(version, formato, since or '')
+        last_modified = int(ultima.timestamp()) if ultima else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            if since is not None:
+                try:
+                    desde = parsear_cursor(since)
+                except ValueError:
+                    return JsonResponse({'status': 'error', 'mensaje': 'Cursor inválido.'}, status=400)
+                response = JsonResponse(delta_mapa(reportes, desde, formato, version))
+            else:
+                cuerpo, cuerpo_gzip = mapa_completo(reportes, formato, version)
+                response = HttpResponse(content_type='application/json')
+                if acepta_gzip(request.headers.get('accept-encoding', '')):
+                    response.content = cuerpo_gzip
+                    response['Content-Encoding'] = 'gzip'
+                else:
+                    response.content = cuerpo
+                response['X-Mapa-Cursor'] = cursor_mapa(ultima)
+
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, public=True, no_cache=True)
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
 
     total_reportes = reportes.count()
     return render(request, 'mapa.html', {'total_reportes': total_reportes})
 
-def estadisticas(request):
+def mapa_recientes(request):
+    """Últimos reportes aprobados para el mapa de la página de inicio."""
+    version = version_mapa()
+    etag = etag_mapa(version, 'recientes')
 
-    total_reportes = NuevoReporte.objects.count()
-    verificados = NuevoReporte.objects.filter(estado='aprobado').count()
-    ataques_graves = NuevoReporte.objects.filter(gravedad='grave').count()
-    sectores_afectados = NuevoReporte.objects.values('sector').distinct().count()
-
-    mes_data = (
-        NuevoReporte.objects.filter(estado='aprobado')
-        .annotate(mes=TruncMonth('fecha'))
-        .values('mes')
-        .annotate(total=Count('id'))
-        .order_by('mes')
-    )
-    
-    meses = [DateFormat(m['mes']).format('M') for m in mes_data] if mes_data else []
-    totales_mes = [m['total'] for m in mes_data] if mes_data else []
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        reportes = NuevoReporte.objects.filter(estado='aprobado')
+        response = JsonResponse(recientes_mapa(reportes, version), safe=False)
 
-    gravedad_data = (
-        NuevoReporte.objects.filter(estado='aprobado')
-        .values('gravedad')
-        .annotate(total=Count('id'))
-    )
-    
-    graves = next((g['total'] for g in gravedad_data if g['gravedad'] == 'grave'), 0)
-    moderados = next((g['total'] for g in gravedad_data if g['gravedad'] == 'moderado'), 0)
-    leves = next((g['total'] for g in gravedad_data if g['gravedad'] == 'leve'), 0)
-
-    top_sectores = (
-        NuevoReporte.objects.filter(estado='aprobado')
-        .exclude(sector__isnull=True)
-        .values('sector')
-        .annotate(total=Count('id'))
-        .order_by('-total')[:10]
-    )
-    
-    SECTOR_NOMBRES = dict(NuevoReporte.SECTOR_CHOICES)
-    sectores_ranking = []
-    for s in top_sectores:
-        sectores_ranking.append({
-            'sector': SECTOR_NOMBRES.get(s['sector'], s['sector']),
-            'total': s['total']
-        })
-    
-    max_sector = sectores_ranking[0]['total'] if sectores_ranking else 1
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+def mapa_calor(request):
+    """Capa de calor con la densidad de reportes aprobados, por banda de zoom y período."""
+    try:
+        zoom = parsear_zoom(request.GET.get('zoom', '13'))
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'mensaje': str(e)}, status=400)
 
+    version = version_mapa()
+    etag = '"%s"' % hashlib.sha1(clave_calor(zoom, request.GET, version).encode('utf-8')).hexdigest()
 
-    hace_12_meses = datetime.now() - timedelta(days=365)
-    
-    tendencia_2024 = (
-        NuevoReporte.objects.filter(
-            estado='aprobado',
-            fecha__gte=hace_12_meses
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        reportes = NuevoReporte.objects.filter(estado='aprobado')
+        response = JsonResponse(capa_calor(reportes, zoom, request.GET, version))
+
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+def mapa_hotspots(request):
+    """Hotspots detectados por detectar_hotspots, opcionalmente limitados a un bbox."""
+    hotspots = Hotspot.objects.all()
+
+    if request.GET.get('bbox'):
+        try:
+            oeste, sur, este, norte = parsear_bbox(request.GET['bbox'])
+        except ValueError as e:
+            return JsonResponse({'status': 'error', 'mensaje': str(e)}, status=400)
+        hotspots = hotspots.filter(
+            latitud__gte=sur, latitud__lte=norte, longitud__gte=oeste, longitud__lte=este,
         )
-        .annotate(mes=TruncMonth('fecha'))
-        .values('mes')
-        .annotate(total=Count('id'))
-        .order_by('mes')
-    )
-    
-    meses_tendencia = [DateFormat(m['mes']).format('M') for m in tendencia_2024]
-    totales_tendencia = [m['total'] for m in tendencia_2024]
-
-    horas_data = (
-        NuevoReporte.objects.filter(estado='aprobado')
-        .exclude(hora__isnull=True)
-        .annotate(hora_del_dia=ExtractHour('hora'))
-        .values('hora_del_dia')
-        .annotate(total=Count('id'))
-        .order_by('hora_del_dia')
-    )
-    
-    rangos_horas = {
-        '0-6h': 0, '6-9h': 0, '9-12h': 0, '12-15h': 0,
-        '15-18h': 0, '18-21h': 0, '21-24h': 0
-    }
-    
-    for h in horas_data:
-        hora = h['hora_del_dia']
-        if 0 <= hora < 6:
-            rangos_horas['0-6h'] += h['total']
-        elif 6 <= hora < 9:
-            rangos_horas['6-9h'] += h['total']
-        elif 9 <= hora < 12:
-            rangos_horas['9-12h'] += h['total']
-        elif 12 <= hora < 15:
-            rangos_horas['12-15h'] += h['total']
-        elif 15 <= hora < 18:
-            rangos_horas['15-18h'] += h['total']
-        elif 18 <= hora < 21:
-            rangos_horas['18-21h'] += h['total']
-        else:
-            rangos_horas['21-24h'] += h['total']
-    
-    etiquetas_horas = list(rangos_horas.keys())
-    totales_horas = list(rangos_horas.values())
-
-    dias_data = (
-        NuevoReporte.objects.filter(estado='aprobado')
-        .annotate(dia_semana=ExtractWeekDay('fecha'))
-        .values('dia_semana')
-        .annotate(total=Count('id'))
-        .order_by('dia_semana')
-    )
-    
-    dias_nombres = ['Dom', 'Lun', 'Mar', 'Mié', 'Jue', 'Vie', 'Sáb']
-    totales_dias = [0] * 7
-    
-    for d in dias_data:
-        totales_dias[d['dia_semana'] - 1] = d['total']
-    
-    totales_dias_ordenados = totales_dias[1:] + [totales_dias[0]]
-    dias_ordenados = dias_nombres[1:] + [dias_nombres[0]]
 
-    if total_reportes > 0:
-        tasa_aprobacion = round((verificados / total_reportes) * 100)
-    else:
-        tasa_aprobacion = 0
-    
-    reportes_con_foto = NuevoReporte.objects.filter(
-        estado='aprobado',
-        fotos__isnull=False
-    ).distinct().count()
-    
-    if verificados > 0:
-        porcentaje_con_foto = round((reportes_con_foto / verificados) * 100)
-    else:
-        porcentaje_con_foto = 0
+    datos = [
+        {
+            'id': h['id'],
+            'lat': float(h['latitud']),
+            'lon': float(h['longitud']),
+            'radio_m': h['radio_m'],
+            'total': h['total_reportes'],
+            'graves': h['graves'],
+            'desde': h['fecha_inicio'].isoformat(),
+            'hasta': h['fecha_fin'].isoformat(),
+        }
+        for h in hotspots.values(
+            'id', 'latitud', 'longitud', 'radio_m', 'total_reportes', 'graves', 'fecha_inicio', 'fecha_fin',
+        )
+    ]
 
-    context = {
-        'total_reportes': total_reportes,
-        'verificados': verificados,
-        'ataques_graves': ataques_graves,
-        'sectores_afectados': sectores_afectados,
+    response = JsonResponse(datos, safe=False)
+    patch_cache_control(response, public=True, max_age=TILE_MAX_AGE)
+    return response
 
-        'meses': meses,
-        'totales_mes': totales_mes,
-        
-        'graves': graves,
-        'moderados': moderados,
-        'leves': leves,
-        
-        'sectores_ranking': sectores_ranking,
-        'max_sector': max_sector,
-        
-        'meses_tendencia': meses_tendencia,
-        'totales_tendencia': totales_tendencia,
-        
-        'etiquetas_horas': etiquetas_horas,
-        'totales_horas': totales_horas,
-        
-        'dias_ordenados': dias_ordenados,
-        'totales_dias': totales_dias_ordenados,
-        
-        'tasa_aprobacion': tasa_aprobacion,
-        'porcentaje_con_foto': porcentaje_con_foto,
-    }
+def mapa_tile(request, z, x, y):
+    """Reportes aprobados de un tile z/x/y en GeoJSON, cacheable por navegador y proxy."""
+    if not tile_valido(z, x, y):
+        raise Http404('Tile fuera de rango.')
+
+    reportes = NuevoReporte.objects.filter(estado='aprobado')
+    cuerpo, etag = tile_geojson(reportes, z, x, y, request.GET)
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(cuerpo, content_type='application/geo+json')
+
+    response['ETag'] = etag
+    patch_cache_control(
+        response,
+        public=True,
+        max_age=TILE_MAX_AGE,
+        stale_while_revalidate=TILE_STALE_WHILE_REVALIDATE,
+    )
+    return response
+
+def estadisticas(request):
+    """Estadísticas públicas, leídas de la tabla resumen EstadisticaReporte."""
+    context = series_estadisticas()
+    context['sectores'] = NuevoReporte.SECTOR_CHOICES
+    context['gravedades'] = NuevoReporte.GRAVEDAD_CHOICES
+    context['tipos_animal'] = NuevoReporte.TIPO_ANIMAL_CHOICES
     
     return render(request, 'estadisticas.html', context)
 
+
+def estadisticas_datos(request):
+    """Series de la página de estadísticas en JSON, filtrables por fechas, sector, gravedad y animal."""
+    try:
+        filtros = filtros_estadisticas(request.GET)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'mensaje': str(e)}, status=400)
+
+    cuerpo, etag = datos_estadisticas(filtros)
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(cuerpo, content_type='application/json')
+
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=ESTADISTICAS_MAX_AGE)
+    return response
+
+
 def es_moderador(user):
     return user.is_authenticated and (
         user.perfil.rol == 'moderador' or user.perfil.rol == 'admin'
     )
 
+def datos_subida(sesion):
+    return {
+        'status': 'ok',
+        'token': sesion.token,
+        'tamano': sesion.tamano,
+        'recibido': sesion.recibido,
+        'completa': sesion.estado == 'completa',
+        'url': reverse('subir_foto_por_partes', args=[sesion.token]),
+    }
+
+
+@require_http_methods(["POST"])
+def iniciar_subida_foto(request):
+    """Abre una subida por partes de una foto; recibe `nombre` y `tamano` en bytes."""
+    # La clave de sesión identifica al cliente para limitar sus subidas sin usar.
+    if not request.session.session_key:
+        request.session.save()
+    try:
+        sesion = iniciar_subida(
+            request.POST.get('nombre', ''), request.POST.get('tamano'), cliente=request.session.session_key
+        )
+    except SubidaRechazada as e:
+        return JsonResponse({'status': 'error', 'mensaje': str(e)}, status=e.status)
+    return JsonResponse(datos_subida(sesion), status=201)
+
+
+@require_http_methods(["GET", "PATCH"])
+def subir_foto_por_partes(request, token):
+    """GET: cuánto recibió el servidor. PATCH: agrega un trozo que empieza en el byte `Upload-Offset`."""
+    if request.method == 'GET':
+        sesion = get_object_or_404(SesionSubida, token=token)
+        return JsonResponse(datos_subida(sesion))
+
+    try:
+        inicio = int(request.headers.get('Upload-Offset', ''))
+        largo = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'mensaje': 'Falta la cabecera Upload-Offset.'}, status=400)
+    # Se revisa antes de leer el cuerpo.
+    if largo > MAX_TAMANO_TROZO:
+        return JsonResponse(
+            {'status': 'error', 'mensaje': f'Cada trozo puede pesar hasta {MAX_TAMANO_TROZO} bytes.'}, status=413
+        )
+
+    try:
+        sesion = agregar_trozo(token, inicio, request.body)
+    except SubidaRechazada as e:
+        return JsonResponse({'status': 'error', 'mensaje': str(e), 'recibido': e.recibido}, status=e.status)
+    return JsonResponse(datos_subida(sesion))
+
+
+# Contador de `panel_moderador` que corresponde a cada valor del filtro de estado.
+CONTADOR_ESTADO = {
+    'todos': 'todos',
+    'pendiente': 'pendientes',
+    'aprobado': 'aprobados',
+    'rechazado': 'rechazados',
+}
+
+
 @login_required
 @user_passes_test(es_moderador)
 def panel_moderador(request):
     estado_filtro = request.GET.get('estado', None)
-    gravedad_filtro = request.GET.get('gravedad', None)
-    animal_filtro = request.GET.get('animal', None)
-    anonimo_filtro = request.GET.get('anonimo', None)
+    reclamados_filtro = request.GET.get('reclamados', None)
 
-    reportes = NuevoReporte.objects.all().order_by('-fecha', '-id')
+    reportes = NuevoReporte.objects.all()
+    filtros = filtros_reportes(request.GET, fechas=False)
 
-    if estado_filtro and estado_filtro != 'todos':
-        reportes = reportes.filter(estado=estado_filtro)
-
-    if gravedad_filtro and gravedad_filtro != 'all':
-        reportes = reportes.filter(gravedad=gravedad_filtro)
-
-    if animal_filtro and animal_filtro != 'all':
-        reportes = reportes.filter(tipo_animal=animal_filtro)
-
-    if anonimo_filtro and anonimo_filtro != 'all':
-        if anonimo_filtro == 'true':
-            reportes = reportes.filter(anonimo=True)
-        elif anonimo_filtro == 'false':
-            reportes = reportes.filter(anonimo=False)
+    if reclamados_filtro == 'mios':
+        filtros &= Q(estado='pendiente', reclamado_por=request.user, reclamado_hasta__gt=timezone.now())
 
     reportes_por_pagina = 5
-    paginator = Paginator(reportes, reportes_por_pagina)
-    
-    page = request.GET.get('page', 1)
-    
+
+    # Paginación por cursor: cada página cuesta lo mismo sin importar su
+    # profundidad, a diferencia de OFFSET. Los pendientes salen por prioridad.
+    orden = ('prioridad', 'fecha', 'id') if estado_filtro == 'pendiente' else ('fecha', 'id')
+    pagina = reportes.filter(filtros).con_fotos().con_incidente().select_related('reclamado_por')
     try:
-        reportes_paginados = paginator.page(page)
-    except PageNotAnInteger:
-        reportes_paginados = paginator.page(1)
-    except EmptyPage:
-        reportes_paginados = paginator.page(paginator.num_pages)
+        reportes_paginados = paginar_keyset(
+            pagina,
+            orden,
+            reportes_por_pagina,
+            despues=request.GET.get('despues'),
+            antes=request.GET.get('antes'),
+        )
+    except ValueError:
+        reportes_paginados = paginar_keyset(pagina, orden, reportes_por_pagina)
+
+    contadores = reportes.aggregate(
+        pendientes=Count('id', filter=Q(estado='pendiente')),
+        aprobados=Count('id', filter=Q(estado='aprobado')),
+        rechazados=Count('id', filter=Q(estado='rechazado')),
+        todos=Count('id'),
+    )
+    # El total filtrado sale gratis de los contadores cuando el único filtro es
+    # el estado; con otros filtros habría que recorrer la tabla, así que no se muestra.
+    total_filtrados = None
+    if reclamados_filtro != 'mios' and filtros == filtros_reportes({'estado': estado_filtro}, fechas=False):
+        contador = CONTADOR_ESTADO.get(estado_filtro or 'todos')
+        total_filtrados = contadores.get(contador)
+
+    parametros = request.GET.copy()
+    for clave in ('page', 'despues', 'antes'):
+        parametros.pop(clave, None)
 
     context = {
         'reportes': reportes_paginados,
-        'pendientes': NuevoReporte.objects.filter(estado='pendiente').count(),
-        'aprobados': NuevoReporte.objects.filter(estado='aprobado').count(),
-        'rechazados': NuevoReporte.objects.filter(estado='rechazado').count(),
-        'todos': NuevoReporte.objects.count(),
-        'total_filtrados': paginator.count, 
+        'parametros_filtros': parametros.urlencode(),
+        'ahora': timezone.now(),
+        'total_filtrados': total_filtrados,
+        **contadores,
     }
     return render(request, 'moderador/panel_moderador.html', context)
 
@@ -508,19 +580,11 @@ def panel_moderador(request):
 @login_required
 @user_passes_test(es_moderador)
 def aprobar_reporte(request, id):
-    reporte = get_object_or_404(NuevoReporte, id=id)
-    reporte.estado = 'aprobado'
-    reporte.moderador = request.user
-    reporte.fecha_moderacion = timezone.now()
-    reporte.comentario_moderacion = 'Reporte aprobado y publicado.'
-    reporte.save()
-
-    ModeracionLog.objects.create(
-        reporte=reporte,
-        moderador=request.user,
-        accion='verificado',
-        motivo='Aprobado por moderador'
-    )
+    resultados, _ = moderar_reportes([id], 'aprobar', request.user)
+    if resultados[id] == 'no_encontrado':
+        raise Http404('Reporte no encontrado.')
+    if resultados[id] == 'ya_moderado':
+        return JsonResponse({'status': 'error', 'mensaje': 'Otro moderador ya decidió este reporte.'}, status=409)
 
     return JsonResponse({'status': 'ok', 'mensaje': 'Reporte aprobado correctamente.'})
 
@@ -529,29 +593,127 @@ def aprobar_reporte(request, id):
 @user_passes_test(es_moderador)
 def rechazar_reporte(request, id):
     if request.method == 'POST':
-        motivo = request.POST.get('motivo', '').strip()
-        if not motivo:
-            return JsonResponse({'status': 'error', 'mensaje': 'Debes escribir un motivo de rechazo.'})
-        
-        reporte = get_object_or_404(NuevoReporte, id=id)
-        reporte.estado = 'rechazado'
-        reporte.moderador = request.user
-        reporte.fecha_moderacion = timezone.now()
-        reporte.comentario_moderacion = motivo
-        reporte.save()
-
-        ModeracionLog.objects.create(
-            reporte=reporte,
-            moderador=request.user,
-            accion='rechazado',
-            motivo=motivo
-        )
+        try:
+            resultados, _ = moderar_reportes([id], 'rechazar', request.user, request.POST.get('motivo'))
+        except ValueError as e:
+            return JsonResponse({'status': 'error', 'mensaje': str(e)})
+
+        if resultados[id] == 'no_encontrado':
+            raise Http404('Reporte no encontrado.')
+        if resultados[id] == 'ya_moderado':
+            return JsonResponse({'status': 'error', 'mensaje': 'Otro moderador ya decidió este reporte.'}, status=409)
 
         return JsonResponse({'status': 'ok', 'mensaje': 'Reporte rechazado correctamente.'})
     
     return JsonResponse({'status': 'error', 'mensaje': 'Método no permitido'})
 
 
+@login_required
+@user_passes_test(es_moderador)
+@require_http_methods(["POST"])
+def moderar_lote(request):
+    """Aprueba o rechaza varios reportes en una sola transacción.
+
+    Recibe JSON: {"ids": [...], "decision": "aprobar" | "rechazar", "motivo": "..."}
+    y responde con el resultado de cada id.
+    """
+    try:
+        datos = json.loads(request.body or b'{}')
+        ids = [int(i) for i in datos.get('ids', [])]
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'status': 'error', 'mensaje': 'Se esperaba JSON con una lista de ids.'}, status=400)
+
+    if not ids:
+        return JsonResponse({'status': 'error', 'mensaje': 'No se indicaron reportes.'}, status=400)
+    if len(ids) > MAX_LOTE_MODERACION:
+        return JsonResponse(
+            {'status': 'error', 'mensaje': f'Se pueden moderar hasta {MAX_LOTE_MODERACION} reportes por vez.'},
+            status=400,
+        )
+
+    try:
+        resultados, actualizados = moderar_reportes(ids, datos.get('decision'), request.user, datos.get('motivo'))
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'mensaje': str(e)}, status=400)
+
+    return JsonResponse({
+        'status': 'ok',
+        'mensaje': f'{actualizados} reporte(s) moderado(s).',
+        'actualizados': actualizados,
+        'resultados': {str(i): r for i, r in resultados.items()},
+    })
+
+
+@login_required
+@user_passes_test(es_moderador)
+@require_http_methods(["POST"])
+def reclamar_siguientes(request):
+    """Reclama para el moderador los siguientes `cantidad` reportes pendientes libres."""
+    try:
+        cantidad = int(request.POST.get('cantidad', 5))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'mensaje': 'La cantidad debe ser un número.'}, status=400)
+
+    reclamados = list(reclamar_reportes(request.user, cantidad))
+    return JsonResponse({
+        'status': 'ok',
+        'mensaje': f'{len(reclamados)} reporte(s) reclamado(s).',
+        'reclamado_hasta': reclamados[0].reclamado_hasta.isoformat() if reclamados else None,
+        'reportes': [datos_reporte(r) for r in reclamados],
+    })
+
+
+@login_required
+@user_passes_test(es_moderador)
+@require_http_methods(["POST"])
+def moderar_incidente_view(request, id):
+    """Aprueba o rechaza todos los reportes pendientes del incidente del reporte `id`."""
+    try:
+        resultados, actualizados = moderar_incidente(
+            id, request.POST.get('decision'), request.user, request.POST.get('motivo')
+        )
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'mensaje': str(e)}, status=400)
+
+    if not resultados:
+        raise Http404('Reporte no encontrado.')
+    if not actualizados:
+        return JsonResponse(
+            {'status': 'error', 'mensaje': 'Los reportes de este incidente ya fueron moderados.'}, status=409
+        )
+
+    return JsonResponse({
+        'status': 'ok',
+        'mensaje': f'{actualizados} reporte(s) del incidente moderado(s).',
+        'resultados': {str(i): r for i, r in resultados.items()},
+    })
+
+
+@login_required
+@user_passes_test(es_moderador)
+@require_http_methods(["POST"])
+def separar_reporte(request, id):
+    """Saca el reporte `id` del incidente al que se enlazó por error."""
+    reporte = get_object_or_404(NuevoReporte, id=id)
+    if not separar(reporte):
+        return JsonResponse({'status': 'error', 'mensaje': 'El reporte no está enlazado a otro incidente.'}, status=409)
+    return JsonResponse({'status': 'ok', 'mensaje': 'El reporte se separó del incidente.'})
+
+
+@login_required
+@user_passes_test(es_moderador)
+@require_http_methods(["POST"])
+def liberar_reclamos(request):
+    """Suelta los reclamos del moderador; con `ids` solo los indicados."""
+    try:
+        ids = [int(i) for i in request.POST.getlist('ids')] or None
+    except ValueError:
+        return JsonResponse({'status': 'error', 'mensaje': 'Los ids deben ser números.'}, status=400)
+
+    liberados = liberar_reportes(request.user, ids)
+    return JsonResponse({'status': 'ok', 'mensaje': f'{liberados} reporte(s) liberado(s).', 'liberados': liberados})
+
+
 @login_required
 @user_passes_test(es_moderador)
 def detalles_reporte(request, id):
@@ -586,34 +748,94 @@ def detalles_reporte(request, id):
 @login_required
 @user_passes_test(es_moderador)
 def exportar_csv(request):
-    reportes = NuevoReporte.objects.all().select_related('usuario', 'moderador')
+    return exportar_reportes(request, 'csv')
 
-    fecha_actual = timezone.now().strftime("%Y-%m-%d_%H-%M")
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="reportes_{fecha_actual}.csv"'
-
-    writer = csv.writer(response)
-    writer.writerow([
-        'ID', 'Título', 'Descripción', 'Estado', 'Gravedad', 'Tipo Animal',
-        'Cantidad Perros', 'Dirección', 'Latitud', 'Longitud',
-        'Fecha', 'Hora', 'Usuario', 'Email', 'Teléfono',
-        'Moderador', 'Comentario Moderación'
-    ])
-
-    for r in reportes:
-        writer.writerow([
-            r.id, r.titulo, r.descripcion, r.estado, r.gravedad,
-            r.tipo_animal, r.cantidad_perros, r.direccion, r.latitud, r.longitud,
-            r.fecha.strftime("%d-%m-%Y") if r.fecha else '',
-            r.hora.strftime("%H:%M") if r.hora else '',
-            r.usuario.username if r.usuario else 'Anónimo',
-            r.email_reportante, r.telefono_reportante,
-            r.moderador.username if r.moderador else '',
-            r.comentario_moderacion or ''
-        ])
 
+@login_required
+@user_passes_test(es_moderador)
+def exportar_reportes(request, formato):
+    """Descarga de los reportes en CSV, NDJSON, GeoJSON o Parquet.
+
+    Acepta los filtros del panel y un rango de fechas (desde/hasta); el
+    archivo se genera por lotes mientras se envía.
+    """
+    if formato not in FORMATOS:
+        return JsonResponse({'status': 'error', 'mensaje': 'Formato de exportación desconocido.'}, status=404)
+    if formato == 'parquet' and not parquet_disponible():
+        return JsonResponse(
+            {'status': 'error', 'mensaje': 'La exportación a Parquet no está disponible en este servidor (falta pyarrow).'},
+            status=501,
+        )
+
+    try:
+        filtros = filtros_reportes(request.GET)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'mensaje': str(e)}, status=400)
+
+    content_type, extension = FORMATOS[formato]
+    fecha_actual = timezone.now().strftime("%Y-%m-%d_%H-%M")
+    response = StreamingHttpResponse(
+        exportar(NuevoReporte.objects.filter(filtros), formato), content_type=content_type
+    )
+    response['Content-Disposition'] = f'attachment; filename="reportes_{fecha_actual}.{extension}"'
     return response
 
+
+def datos_exportacion(trabajo):
+    datos = {
+        'id': trabajo.id,
+        'formato': trabajo.formato,
+        'estado': trabajo.estado,
+        'filas': trabajo.filas,
+        'tamano': trabajo.tamano,
+        'url_estado': reverse('estado_exportacion', args=[trabajo.id]),
+    }
+    if trabajo.estado == 'listo':
+        datos['url_descarga'] = reverse('descargar_exportacion', args=[trabajo.id])
+    if trabajo.estado == 'error':
+        datos['mensaje'] = 'No se pudo generar la exportación.'
+    return datos
+
+
+@login_required
+@user_passes_test(es_moderador)
+@require_http_methods(["POST"])
+def solicitar_exportacion_view(request):
+    """Pide una exportación en segundo plano con los filtros del panel.
+
+    Recibe por POST `formato` y los mismos filtros que exportar_reportes; si
+    hay una igual reciente se reutiliza su archivo.
+    """
+    try:
+        trabajo, reutilizada = solicitar_exportacion(request.user, request.POST.get('formato', 'csv'), request.POST)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'mensaje': str(e)}, status=400)
+
+    return JsonResponse({'status': 'ok', 'reutilizada': reutilizada, **datos_exportacion(trabajo)}, status=202)
+
+
+@login_required
+@user_passes_test(es_moderador)
+def estado_exportacion(request, id):
+    trabajo = get_object_or_404(ExportacionJob, id=id)
+    return JsonResponse({'status': 'ok', **datos_exportacion(trabajo)})
+
+
+@login_required
+@user_passes_test(es_moderador)
+def descargar_exportacion(request, id):
+    trabajo = get_object_or_404(ExportacionJob, id=id, estado='listo')
+    ruta = ruta_archivo(trabajo)
+    if not ruta.exists():
+        raise Http404('El archivo de la exportación ya no existe.')
+
+    content_type, extension = FORMATOS[trabajo.formato]
+    fecha = timezone.localtime(trabajo.terminado).strftime("%Y-%m-%d_%H-%M")
+    return FileResponse(
+        open(ruta, 'rb'), as_attachment=True, filename=f'reportes_{fecha}.{extension}', content_type=content_type
+    )
+
+
 def es_admin(user):
     if user.is_superuser or user.is_staff:
         return True
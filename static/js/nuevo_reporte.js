@@ -268,6 +268,7 @@ function addFiles(fileList) {
         if (file.size > 5 * 1024 * 1024) continue;
 
         previewFiles.push(file);
+        subidas.set(file, subirPorPartes(file));
     }
 
     const dt = new DataTransfer();
@@ -298,6 +299,7 @@ imagePreview?.addEventListener('click', (e) => {
     if (!btn) return;
 
     const idx = Number(btn.dataset.remove);
+    subidas.delete(previewFiles[idx]);
     previewFiles.splice(idx, 1);
 
     const dt = new DataTransfer();
@@ -307,6 +309,106 @@ imagePreview?.addEventListener('click', (e) => {
     rerenderPreview();
 });
 
+/* ========================= SUBIDA POR PARTES ========================= */
+// Cada foto se sube apenas se agrega, en trozos que se reanudan si la red se
+// corta. El formulario solo manda los tokens de las subidas terminadas.
+const TAMANO_TROZO = 512 * 1024;
+const MAX_FALLOS_SUBIDA = 8;
+const subidas = new Map();  // File -> Promise<token | null>
+
+const csrfToken = () => document.querySelector('[name=csrfmiddlewaretoken]')?.value;
+const esperar = (ms) => new Promise(r => setTimeout(r, ms));
+
+async function subirPorPartes(file) {
+    let sesion;
+    try {
+        const res = await fetch('/subidas/', {
+            method: 'POST',
+            headers: {'X-CSRFToken': csrfToken()},
+            body: new URLSearchParams({nombre: file.name, tamano: file.size})
+        });
+        if (!res.ok) return null;
+        sesion = await res.json();
+    } catch (e) {
+        return null;
+    }
+
+    let recibido = 0;
+    let fallos = 0;
+    while (recibido < file.size) {
+        try {
+            const res = await fetch(sesion.url, {
+                method: 'PATCH',
+                headers: {
+                    'X-CSRFToken': csrfToken(),
+                    'Upload-Offset': String(recibido),
+                    'Content-Type': 'application/offset+octet-stream'
+                },
+                body: file.slice(recibido, recibido + TAMANO_TROZO)
+            });
+            if (res.status >= 500) throw new Error(`HTTP ${res.status}`);
+            const data = await res.json();
+            // 409: el servidor tiene otra cantidad de bytes; se sigue desde ahí.
+            if (!res.ok && res.status !== 409) {
+                log('Subida rechazada', data.mensaje);
+                return null;
+            }
+            recibido = data.recibido;
+            fallos = 0;
+        } catch (e) {
+            if (++fallos > MAX_FALLOS_SUBIDA) return null;
+            await esperar(Math.min(1000 * 2 ** fallos, 30000));
+            try {
+                const estado = await fetch(sesion.url);
+                if (estado.ok) recibido = (await estado.json()).recibido;
+            } catch (e) { /* sin red todavía */ }
+        }
+    }
+    log('Foto subida', file.name);
+    return sesion.token;
+}
+
+document.addEventListener("DOMContentLoaded", () => {
+    const form = document.getElementById('reportForm');
+    if (!form) return;
+
+    form.addEventListener('submit', async (e) => {
+        if (form.dataset.fotosListas) return;
+        e.preventDefault();
+
+        Swal.fire({
+            title: 'Subiendo fotos...',
+            allowOutsideClick: false,
+            didOpen: () => Swal.showLoading()
+        });
+
+        const tokens = [];
+        const sinSubir = [];
+        for (const file of previewFiles) {
+            const token = await subidas.get(file);
+            if (token) tokens.push(token);
+            else sinSubir.push(file);
+        }
+
+        form.querySelectorAll('input[name="fotos_subidas"]').forEach(el => el.remove());
+        tokens.forEach(token => {
+            const campo = document.createElement('input');
+            campo.type = 'hidden';
+            campo.name = 'fotos_subidas';
+            campo.value = token;
+            form.appendChild(campo);
+        });
+
+        // Las que no se pudieron subir por partes van con el formulario, como antes.
+        const dt = new DataTransfer();
+        sinSubir.forEach(f => dt.items.add(f));
+        fileInput.files = dt.files;
+
+        form.dataset.fotosListas = '1';
+        form.submit();
+    });
+});
+
 /* ========================= CONTADOR DESCRIPCIÓN ========================= */
 const descripcionField = document.getElementById('id_descripcion');
 const descProgress = document.getElementById('descProgress');